@@ -0,0 +1,54 @@
+"""
+   Measures how long it takes to import arcrest and run a pure REST
+   FeatureLayer.query on a machine without arcpy.
+
+   Each run happens in a fresh interpreter where arcpy is blocked, so any
+   module level "import arcpy" left in the package makes the run fail.  The
+   query response is canned, so no network access is required.
+
+   Usage:
+      python import_benchmark.py [runs] [budget in ms]
+"""
+import os
+import sys
+import subprocess
+
+_CHILD = r"""
+import sys
+import time
+sys.modules['arcpy'] = None
+start = time.time()
+import arcrest
+layer = arcrest.agol.FeatureLayer(url="http://example.com/arcgis/rest/services/Parcels/FeatureServer/0")
+layer._do_get = lambda url, param_dict, **kwargs: {
+    "objectIdFieldName" : "OBJECTID",
+    "features" : [{"attributes" : {"OBJECTID" : 1, "NAME" : "A"},
+                   "geometry" : {"x" : 1.0, "y" : 2.0}}]}
+features = layer.query(where="1=1")
+elapsed = (time.time() - start) * 1000.0
+assert len(features) == 1
+assert sys.modules.get('arcpy') is None
+print elapsed
+"""
+#----------------------------------------------------------------------
+def run_once(src_path):
+    """ runs the import + query in a new interpreter, returns milliseconds """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = src_path + os.pathsep + env.get('PYTHONPATH', '')
+    output = subprocess.check_output([sys.executable, "-c", _CHILD], env=env)
+    return float(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 200.0
+    src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            os.pardir, "src")
+    timings = sorted([run_once(src_path) for i in xrange(runs)])
+    median = timings[len(timings) // 2]
+    print "import arcrest + FeatureLayer.query without arcpy"
+    print "   runs: %s  min: %.1f ms  median: %.1f ms  max: %.1f ms" % \
+          (runs, timings[0], median, timings[-1])
+    if median > budget:
+        print "   FAILED: median is over the %.0f ms budget" % budget
+        sys.exit(1)
+    print "   OK: median is under the %.0f ms budget" % budget
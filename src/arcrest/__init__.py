@@ -1,13 +1,56 @@
-import agol
-import ags
-from security import *
-from common import *
-import _abstract
-import web
-import manageorg
-import manageags
-import manageportal
-import hostedservice
-#import webmap
-from geometryservice import *
-__version__ = "2.0.100"
\ No newline at end of file
+"""
+   ArcREST
+
+   The sub-packages are imported lazily, the first time they are accessed
+   (ex: arcrest.agol is only imported when it is used).  ArcPy is likewise
+   only imported by the functions that need it, so the REST functionality
+   can be used on machines without ArcGIS installed.
+"""
+import sys
+import types
+import importlib
+
+__version__ = "2.0.100"
+
+_subpackages = ['agol', 'ags', 'security', 'common', '_abstract', 'web',
+                'manageorg', 'manageags', 'manageportal', 'hostedservice',
+                'geometryservice']
+# sub-packages whose public members are exposed as arcrest.<member>
+_exported = ['security', 'common', 'geometryservice']
+# names imported by "from arcrest import *"
+__all__ = ['agol', 'ags', 'security', 'common', 'web', 'manageorg',
+           'manageags', 'manageportal', 'hostedservice', 'geometryservice',
+           'AGOLTokenSecurityHandler', 'AGSTokenSecurityHandler',
+           'OAuthSecurityHandler', 'PortalTokenSecurityHandler',
+           'abstract', 'spatial', 'general', 'geometry', 'filters',
+           'servicedef', 'find', 'Point', 'MultiPoint', 'Polyline',
+           'Polygon', 'Envelope', 'GeometryService']
+########################################################################
+class _LazyPackage(types.ModuleType):
+    """ package module that imports its sub-packages on first access """
+    #----------------------------------------------------------------------
+    def __getattr__(self, name):
+        """ imports the sub-package or exported member on demand """
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name in _subpackages:
+            return importlib.import_module("%s.%s" % (self.__name__, name))
+        if not name.startswith('_'):
+            for package in _exported:
+                module = importlib.import_module("%s.%s" % (self.__name__, package))
+                if hasattr(module, name):
+                    value = getattr(module, name)
+                    setattr(self, name, value)
+                    return value
+        raise AttributeError("'module' object has no attribute '%s'" % name)
+    #----------------------------------------------------------------------
+    def __dir__(self):
+        """ lists the loaded members and the lazy sub-packages """
+        return sorted(set(self.__dict__.keys() + _subpackages))
+
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+# the original module must stay referenced, python 2 clears the globals
+# of a module object once it is garbage collected.
+_package._original = sys.modules[__name__]
+sys.modules[__name__] = _package
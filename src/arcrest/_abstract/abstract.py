@@ -1,4 +1,5 @@
 from ..web import _base
+from ..web._unzip import StreamingUnzip, StreamingNotSupported
 import httplib
 import zipfile
 import datetime
@@ -6,6 +7,8 @@ import calendar
 import glob
 import mimetypes
 import os
+import uuid
+import urllib
 ########################################################################
 class BaseBookmark(object):
     """ base Bookmark class """
@@ -53,7 +56,7 @@ class BaseSecurityHandler(_base.BaseWebOperations):
 ########################################################################
 class AbstractGeometry(object):
     """ Base Geometry Class """
-    pass
+    __slots__ = ()
 ########################################################################
 class BaseFilter(object):
     """ base filter class """
@@ -193,6 +196,33 @@ class BaseAGOLClass(_base.BaseWebOperations):
         except:
             return False
     #----------------------------------------------------------------------
+    def _stream_unzip(self, url, out_folder, param_dict=None):
+        """ downloads a zip file and extracts it while it downloads.
+            Archives that cannot be read as a stream are saved to disk
+            and unzipped afterwards. """
+        writer = StreamingUnzip(out_folder=out_folder)
+        try:
+            self._download_stream(url=url, writer=writer,
+                                  param_dict=param_dict,
+                                  proxy_url=self._proxy_url,
+                                  proxy_port=self._proxy_port)
+            writer.close()
+            return True
+        except StreamingNotSupported:
+            pass
+        if param_dict is not None:
+            url = url + "?%s" % urllib.urlencode(param_dict)
+        dl_file = self._download_file(url=url,
+                                      save_path=out_folder,
+                                      file_name="%s.zip" % uuid.uuid4().get_hex(),
+                                      proxy_url=self._proxy_url,
+                                      proxy_port=self._proxy_port)
+        if dl_file == False:
+            return False
+        res = self._unzip_file(zip_file=dl_file, out_folder=out_folder)
+        os.remove(dl_file)
+        return res
+    #----------------------------------------------------------------------
     def _date_handler(self, obj):
         if isinstance(obj, datetime.datetime):
             return calendar.timegm(obj.utctimetuple()) * 1000
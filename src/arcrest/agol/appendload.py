@@ -0,0 +1,191 @@
+"""
+
+.. module:: appendload
+   :platform: Windows, Linux
+   :synopsis: Loads features into hosted feature layers with an uploaded
+              file and the append operation.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import uuid
+import tempfile
+from ..common.sinks import GeoJSONSink, CSVSink
+from ..manageorg.parameters import ItemParameter
+from bulkload import as_feature_dict
+########################################################################
+class AppendLoader(object):
+    """
+       Loads large numbers of features into a hosted feature layer with
+       the append operation.
+
+       The features are written to a local GeoJSON or CSV file, one at a
+       time, the file is uploaded as an item (in parts when it is large)
+       and append loads it into the layer on the server.  Only the file
+       travels over the network, and the server reads and writes the
+       features in bulk, so large loads run at the server's ingest speed
+       instead of the speed of addFeatures requests.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer of a hosted feature
+                  service
+          userContent - manageorg UserContent of the user the temporary
+                        item is added for
+          uploadFormat - geojson or csv.  GeoJSON geometries must be in
+                         WGS84 (query with outSR=4326).  CSV files only hold
+                         the attributes; point locations are read from
+                         coordinate fields described by the sourceInfo
+                         of Content.analyze.
+          folder - folder id of the temporary item
+          work_folder - folder the file is written to, default is the
+                        system temp folder
+          multipart_size - files larger than this number of bytes are
+                           uploaded in parts
+          keep_item - if False, the item and the file are removed after
+                      the append
+          poll_interval - seconds before the first job status check
+          max_poll_interval - longest wait between status checks
+          timeout - seconds to wait for the append job, None waits until
+                    it ends
+    """
+    _layer = None
+    _userContent = None
+    _uploadFormat = None
+    _folder = None
+    _work_folder = None
+    _multipart_size = None
+    _keep_item = None
+    _poll_interval = None
+    _max_poll_interval = None
+    _timeout = None
+    _formats = {"geojson" : ("GeoJson", ".geojson"),
+                "csv" : ("CSV", ".csv")}
+    #----------------------------------------------------------------------
+    def __init__(self, layer, userContent,
+                 uploadFormat="geojson",
+                 folder=None,
+                 work_folder=None,
+                 multipart_size=104857600,
+                 keep_item=False,
+                 poll_interval=5,
+                 max_poll_interval=30,
+                 timeout=None):
+        """Constructor"""
+        uploadFormat = uploadFormat.lower()
+        if uploadFormat not in self._formats:
+            raise AttributeError("uploadFormat must be one of: %s" % \
+                                 ", ".join(sorted(self._formats.keys())))
+        self._layer = layer
+        self._userContent = userContent
+        self._uploadFormat = uploadFormat
+        self._folder = folder
+        self._work_folder = work_folder or tempfile.gettempdir()
+        self._multipart_size = multipart_size
+        self._keep_item = keep_item
+        self._poll_interval = poll_interval
+        self._max_poll_interval = max_poll_interval
+        self._timeout = timeout
+    #----------------------------------------------------------------------
+    def build(self, features, path=None, fields=None):
+        """
+           writes the features to the upload file
+           Inputs:
+              features - iterable of Feature objects, esri json or
+                         attribute dictionaries, or rows with fields
+              path - output file, a new file in work_folder by default
+              fields - field names of the rows when rows are given
+           Output:
+              tuple of the file path and the number of features
+        """
+        if path is None:
+            path = os.path.join(self._work_folder,
+                                "append_%s%s" % (uuid.uuid4().get_hex(),
+                                                 self._formats[self._uploadFormat][1]))
+        if self._uploadFormat == "geojson":
+            sink = GeoJSONSink(path, collection=True)
+        else:
+            sink = CSVSink(path)
+        with sink:
+            for feature in features:
+                feature = as_feature_dict(feature, fields)
+                if self._uploadFormat == "csv":
+                    feature = {"attributes" : feature.get('attributes', {})}
+                sink.write([feature])
+        return path, sink.count
+    #----------------------------------------------------------------------
+    def upload(self, path):
+        """
+           adds the file as an item and returns the item id
+        """
+        ip = ItemParameter()
+        ip.title = os.path.splitext(os.path.basename(path))[0]
+        ip.type = self._formats[self._uploadFormat][0]
+        ip.tags = "append"
+        multipart = os.path.getsize(path) > self._multipart_size
+        res = self._userContent.addItem(itemParameters=ip,
+                                        filePath=path,
+                                        folder=self._folder,
+                                        multipart=multipart)
+        if not isinstance(res, dict) or 'error' in res:
+            raise ValueError(res)
+        itemId = res.get('id', None) or res.get('itemId', None)
+        if itemId is None:
+            raise ValueError(res)
+        return itemId
+    #----------------------------------------------------------------------
+    def append(self, itemId, **kwargs):
+        """
+           appends the uploaded item to the layer and waits for the job.
+           The keyword arguments are passed to FeatureLayer.append.
+        """
+        kwargs.setdefault('poll_interval', self._poll_interval)
+        kwargs.setdefault('max_poll_interval', self._max_poll_interval)
+        kwargs.setdefault('timeout', self._timeout)
+        return self._layer.append(sourceItemId=itemId,
+                                  uploadFormat=self._uploadFormat,
+                                  **kwargs)
+    #----------------------------------------------------------------------
+    def load(self, features, fields=None,
+             fieldMappings=None,
+             upsert=False,
+             upsertMatchingField=None,
+             sourceInfo=None,
+             **kwargs):
+        """
+           builds the file, uploads it and appends it to the layer
+           Inputs:
+              features - iterable of features, see build()
+              fields - field names of the rows when rows are given
+              fieldMappings - list of {"name" : <layer field>,
+                              "sourceName" : <file field>} dictionaries
+              upsert - update features matching upsertMatchingField (or
+                       the global id) instead of adding them
+              upsertMatchingField - field used to match features on upsert
+              sourceInfo - publishParameters of Content.analyze for csv
+              kwargs - other FeatureLayer.append parameters
+           Output:
+              dictionary with the number of features written, the item id
+              and the append job status
+        """
+        path, count = self.build(features, fields=fields)
+        itemId = None
+        try:
+            if count == 0:
+                return {"count" : 0, "itemId" : None, "status" : None}
+            itemId = self.upload(path)
+            status = self.append(itemId,
+                                 fieldMappings=fieldMappings,
+                                 upsert=upsert,
+                                 upsertMatchingField=upsertMatchingField,
+                                 sourceInfo=sourceInfo,
+                                 **kwargs)
+            return {"count" : count, "itemId" : itemId, "status" : status}
+        finally:
+            if not self._keep_item:
+                if itemId is not None:
+                    self._userContent.deleteItem(item_id=itemId,
+                                                 folder=self._folder)
+                if os.path.isfile(path):
+                    os.remove(path)
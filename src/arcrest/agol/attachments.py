@@ -0,0 +1,412 @@
+"""
+
+.. module:: attachments
+   :platform: Windows, Linux
+   :synopsis: Moves large numbers of feature attachments concurrently.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import json
+import urllib
+import hashlib
+import httplib
+import threading
+from urlparse import urlparse, urljoin
+from ..common.parallel import imap_bounded, retry_call
+########################################################################
+class AttachmentUploader(object):
+    """
+       Uploads attachments with a bounded pool of concurrent addAttachment
+       requests.  The attachment data can be a file path, a file like
+       object or the blob itself wrapped in a web._base.FileData; blobs
+       are written straight into the request body.  Every attachment is
+       retried on its own.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer with attachments
+          max_workers - number of concurrent uploads
+          retries - number of times a failed upload is re-sent
+          backoff - seconds to wait before the first retry, doubled on
+                    every following retry
+    """
+    _layer = None
+    _max_workers = None
+    _retries = None
+    _backoff = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer, max_workers=4, retries=3, backoff=2.0):
+        """Constructor"""
+        self._layer = layer
+        self._max_workers = max_workers
+        self._retries = retries
+        self._backoff = backoff
+    #----------------------------------------------------------------------
+    def _post(self, item):
+        """ uploads one attachment, raises so the upload is retried """
+        oid, name, data = item
+        if hasattr(data, 'seek'):
+            data.seek(0)
+        res = self._layer.addAttachment(oid, data, file_name=name)
+        if not isinstance(res, dict) or 'error' in res or \
+           not res.get('addAttachmentResult', {}).get('success', False):
+            raise ValueError(res)
+        return res
+    #----------------------------------------------------------------------
+    def _send(self, item):
+        """ uploads an attachment with retries """
+        return retry_call(self._post, args=(item,),
+                          retries=self._retries,
+                          backoff=self._backoff)
+    #----------------------------------------------------------------------
+    def iter_upload(self, attachments):
+        """
+           uploads the attachments and yields every outcome as it completes
+           Inputs:
+              attachments - iterable of (object id, file name, data)
+                            tuples.  data is a path, a file like object
+                            or the bytes of the file in a FileData.
+           Output:
+              generator of (object id, file name, response) tuples.
+              response is the addAttachment response or an error
+              dictionary.
+        """
+        for item, res, err in imap_bounded(self._send, attachments,
+                                           max_workers=self._max_workers):
+            if err is not None:
+                res = {"error" : {"message" : str(err)}}
+            yield item[0], item[1], res
+    #----------------------------------------------------------------------
+    def upload(self, attachments):
+        """
+           uploads the attachments and returns a summary
+           Output:
+              dictionary with the number of uploaded and failed attachments
+              and a list of (object id, file name, response) for the
+              failures
+        """
+        summary = {"uploaded" : 0, "failed" : 0, "failures" : []}
+        for oid, name, res in self.iter_upload(attachments):
+            if 'error' in res:
+                summary['failed'] += 1
+                summary['failures'].append((oid, name, res))
+            else:
+                summary['uploaded'] += 1
+        return summary
+########################################################################
+class AttachmentDownloader(object):
+    """
+       Downloads the attachments of a feature layer into a content
+       addressed cache folder.
+
+       Attachment metadata is read in batches with queryAttachments when
+       the layer supports it, else with concurrent listAttachments
+       requests.  Files are downloaded by a pool of worker threads, each
+       keeping its own persistent connection to the server.  A file is
+       stored under a name derived from the layer, the attachment id and
+       its size, so running the download again skips every attachment
+       that did not change.  The connections are closed when a download
+       finishes; the downloader can also be used as a context manager.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer with attachments
+          cache_folder - folder holding the downloaded files
+          max_workers - number of concurrent downloads
+          batch_size - number of object ids per metadata request
+          retries - number of times a failed download is repeated
+          backoff - seconds to wait before the first retry, doubled on
+                    every following retry
+    """
+    _layer = None
+    _cache_folder = None
+    _max_workers = None
+    _batch_size = None
+    _retries = None
+    _backoff = None
+    _local = None
+    _lock = None
+    _connections = None
+    _use_query = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer, cache_folder,
+                 max_workers=4,
+                 batch_size=100,
+                 retries=3,
+                 backoff=2.0):
+        """Constructor"""
+        self._layer = layer
+        self._cache_folder = cache_folder
+        self._max_workers = max_workers
+        self._batch_size = batch_size
+        self._retries = retries
+        self._backoff = backoff
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        if not os.path.isdir(cache_folder):
+            os.makedirs(cache_folder)
+    #----------------------------------------------------------------------
+    def _params(self):
+        """ returns the base request parameters """
+        params = {"f" : "json"}
+        if self._layer._token is not None:
+            params['token'] = self._layer._token
+        return params
+    #----------------------------------------------------------------------
+    def _query_attachments(self, oids):
+        """ returns the attachment infos of a batch of object ids """
+        params = self._params()
+        params['objectIds'] = ",".join(["%s" % oid for oid in oids])
+        res = self._layer._do_post(url=self._layer.url + "/queryAttachments",
+                                   param_dict=params,
+                                   proxy_url=self._layer._proxy_url,
+                                   proxy_port=self._layer._proxy_port)
+        if not isinstance(res, dict) or 'error' in res:
+            raise ValueError(res)
+        infos = []
+        for group in res.get('attachmentGroups', []):
+            for info in group.get('attachmentInfos', []):
+                infos.append((group['parentObjectId'], info))
+        return infos
+    #----------------------------------------------------------------------
+    def _list_attachments(self, oids):
+        """ returns the attachment infos of object ids, one request each """
+        infos = []
+        for oid in oids:
+            res = self._layer.listAttachments(oid)
+            if not isinstance(res, dict) or 'error' in res:
+                raise ValueError(res)
+            for info in res.get('attachmentInfos', []):
+                infos.append((oid, info))
+        return infos
+    #----------------------------------------------------------------------
+    def _infos(self, oids):
+        """ returns the attachment infos of object ids with retries """
+        func = self._list_attachments
+        if self._use_query:
+            func = self._query_attachments
+        return retry_call(func, args=(oids,),
+                          retries=self._retries,
+                          backoff=self._backoff)
+    #----------------------------------------------------------------------
+    def _oid_batches(self, where, object_ids):
+        """ yields lists of object ids """
+        if object_ids is None:
+            res = self._layer.query(where=where, returnIDsOnly=True)
+            if 'error' in res:
+                raise ValueError(res)
+            object_ids = res.get('objectIds', None) or []
+            object_ids.sort()
+        batch = []
+        for oid in object_ids:
+            batch.append(oid)
+            if len(batch) >= self._batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+    #----------------------------------------------------------------------
+    def iter_attachment_infos(self, where="1=1", object_ids=None):
+        """
+           yields the attachment metadata of the features
+           Inputs:
+              where - sql statement selecting the parent features
+              object_ids - list of parent object ids to use instead of
+                           where
+           Output:
+              generator of (parent object id, attachment info) tuples
+        """
+        capabilities = self._layer.advancedQueryCapabilities or {}
+        self._use_query = capabilities.get('supportsQueryAttachments', False)
+        batches = self._oid_batches(where, object_ids)
+        if not self._use_query:
+            # one request per feature, so the requests are spread over
+            # the worker pool
+            batches = ([oid] for batch in batches for oid in batch)
+        for oids, infos, err in imap_bounded(self._infos, batches,
+                                             max_workers=self._max_workers):
+            if err is not None:
+                raise err
+            for info in infos:
+                yield info
+    #----------------------------------------------------------------------
+    def cache_path(self, attachment_id, size):
+        """ returns the cache file of an attachment """
+        key = hashlib.md5("%s|%s|%s" % (self._layer.url.lower(),
+                                        attachment_id, size)).hexdigest()
+        return os.path.join(self._cache_folder, key[:2], key)
+    #----------------------------------------------------------------------
+    def _connection(self, scheme, host, port):
+        """ returns the persistent connection of the calling thread """
+        pool = getattr(self._local, 'pool', None)
+        if pool is None:
+            pool = self._local.pool = {}
+        key = (scheme, host, port)
+        if not key in pool:
+            proxy_url = self._layer._proxy_url
+            proxy_port = self._layer._proxy_port or 80
+            if scheme == "https":
+                if proxy_url is not None:
+                    conn = httplib.HTTPSConnection(proxy_url, proxy_port,
+                                                   timeout=60)
+                    conn.set_tunnel(host, port)
+                else:
+                    conn = httplib.HTTPSConnection(host, port, timeout=60)
+            else:
+                if proxy_url is not None:
+                    conn = httplib.HTTPConnection(proxy_url, proxy_port,
+                                                  timeout=60)
+                else:
+                    conn = httplib.HTTPConnection(host, port, timeout=60)
+            pool[key] = conn
+            with self._lock:
+                self._connections.append(conn)
+        return pool[key]
+    #----------------------------------------------------------------------
+    def _drop_connections(self):
+        """ closes the connections of the calling thread """
+        pool = getattr(self._local, 'pool', None) or {}
+        with self._lock:
+            for conn in pool.values():
+                conn.close()
+                if conn in self._connections:
+                    self._connections.remove(conn)
+        self._local.pool = {}
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the connections opened by every worker thread """
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    #----------------------------------------------------------------------
+    def _fetch(self, url, path, redirects=5):
+        """ streams url into path using the pooled connection """
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower()
+        port = parsed.port or (443 if scheme == "https" else 80)
+        conn = self._connection(scheme, parsed.hostname, port)
+        selector = parsed.path
+        if parsed.query:
+            selector += "?" + parsed.query
+        if scheme == "http" and self._layer._proxy_url is not None:
+            selector = url
+        try:
+            conn.request("GET", selector,
+                         headers={'User-Agent' : self._layer._useragent,
+                                  'Referer' : self._layer._referer_url})
+            response = conn.getresponse()
+        except (httplib.HTTPException, IOError):
+            self._drop_connections()
+            raise
+        if response.status in [301, 302, 303, 307, 308] and redirects > 0:
+            location = response.getheader('location')
+            response.read()
+            return self._fetch(urljoin(url, location), path, redirects - 1)
+        if response.status != 200:
+            response.read()
+            raise IOError("HTTP %s downloading %s" % (response.status, url))
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                pass
+        temp = "%s.%s.part" % (path, threading.current_thread().ident)
+        with open(temp, 'wb') as writer:
+            while True:
+                chunk = response.read(65536)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(temp, path)
+        return path
+    #----------------------------------------------------------------------
+    def _download(self, item):
+        """ downloads one attachment unless it is in the cache """
+        oid, info = item
+        path = self.cache_path(info['id'], info.get('size', None))
+        if os.path.isfile(path) and \
+           (info.get('size', None) is None or \
+            os.path.getsize(path) == info['size']):
+            return path, True
+        url = self._layer.url + "/%s/attachments/%s" % (oid, info['id'])
+        if self._layer._token is not None:
+            url += "?" + urllib.urlencode({"token" : self._layer._token})
+        retry_call(self._fetch, args=(url, path),
+                   retries=self._retries,
+                   backoff=self._backoff)
+        return path, False
+    #----------------------------------------------------------------------
+    def iter_download(self, where="1=1", object_ids=None):
+        """
+           downloads the attachments of the features and yields every
+           outcome as it completes
+           Inputs:
+              where - sql statement selecting the parent features
+              object_ids - list of parent object ids to use instead of
+                           where
+           Output:
+              generator of dictionaries with the parent object id, the
+              attachment info, the cache path and whether the file came
+              from the cache.  Failed downloads carry an error message.
+        """
+        results = imap_bounded(self._download,
+                               self.iter_attachment_infos(where, object_ids),
+                               max_workers=self._max_workers)
+        try:
+            for item, res, err in results:
+                record = {"parentObjectId" : item[0],
+                          "attachment" : item[1],
+                          "path" : None,
+                          "cached" : False}
+                if err is not None:
+                    record['error'] = str(err)
+                else:
+                    record['path'], record['cached'] = res
+                yield record
+        finally:
+            # joins the worker threads before their connections are closed
+            results.close()
+            self.close()
+    #----------------------------------------------------------------------
+    def download(self, where="1=1", object_ids=None, manifest=True):
+        """
+           downloads the attachments of the features
+           Inputs:
+              where - sql statement selecting the parent features
+              object_ids - list of parent object ids to use instead of
+                           where
+              manifest - if True, manifest.json listing the downloaded
+                         attachments is written to the cache folder
+           Output:
+              dictionary with the number of downloaded, cached and failed
+              attachments and the list of records
+        """
+        summary = {"downloaded" : 0, "cached" : 0, "failed" : 0,
+                   "attachments" : []}
+        for record in self.iter_download(where, object_ids):
+            if 'error' in record:
+                summary['failed'] += 1
+            elif record['cached']:
+                summary['cached'] += 1
+            else:
+                summary['downloaded'] += 1
+            summary['attachments'].append(record)
+        if manifest:
+            with open(os.path.join(self._cache_folder,
+                                   "manifest.json"), 'wb') as writer:
+                writer.write(json.dumps(summary['attachments']))
+        return summary
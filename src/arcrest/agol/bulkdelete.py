@@ -0,0 +1,173 @@
+"""
+
+.. module:: bulkdelete
+   :platform: Windows, Linux
+   :synopsis: Deletes large numbers of features from a feature layer.
+
+.. moduleauthor:: Esri
+
+
+"""
+import time
+from ..common.parallel import imap_bounded, retry_call
+########################################################################
+class BulkDeleter(object):
+    """
+       Deletes features from a feature layer or table using concurrent
+       deleteFeatures requests.
+
+       The object ids are split into batches of at most batch_size ids,
+       so no request runs long enough to time out, several batches are in
+       flight at once and every batch is retried on its own.  The outcome
+       of every batch is reported.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer to delete from
+          batch_size - object ids per request, default is the layer's
+                       maxRecordCount
+          max_workers - number of concurrent deleteFeatures requests
+          retries - number of times a failed batch is re-sent
+          backoff - seconds to wait before the first retry, doubled on
+                    every following retry
+          gdbVersion - geodatabase version to apply the edits to
+          rollbackOnFailure - if True, a batch is only applied when all of
+                              its features are deleted
+    """
+    _layer = None
+    _batch_size = None
+    _max_workers = None
+    _retries = None
+    _backoff = None
+    _gdbVersion = None
+    _rollbackOnFailure = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer,
+                 batch_size=None,
+                 max_workers=4,
+                 retries=3,
+                 backoff=2.0,
+                 gdbVersion=None,
+                 rollbackOnFailure=True):
+        """Constructor"""
+        self._layer = layer
+        self._batch_size = batch_size
+        self._max_workers = max_workers
+        self._retries = retries
+        self._backoff = backoff
+        self._gdbVersion = gdbVersion
+        self._rollbackOnFailure = rollbackOnFailure
+    #----------------------------------------------------------------------
+    @property
+    def batchSize(self):
+        """ returns the number of object ids per request """
+        if self._batch_size is None:
+            self._batch_size = self._layer.maxRecordCount or 1000
+        return self._batch_size
+    #----------------------------------------------------------------------
+    def _post(self, oids):
+        """ deletes one batch, raises so the batch is retried on errors """
+        params = {
+            "f" : "json",
+            "objectIds" : ",".join(["%s" % oid for oid in oids]),
+            "rollbackOnFailure" : self._rollbackOnFailure
+        }
+        if self._gdbVersion is not None:
+            params['gdbVersion'] = self._gdbVersion
+        if self._layer._token is not None:
+            params['token'] = self._layer._token
+        res = self._layer._do_post(url=self._layer.url + "/deleteFeatures",
+                                   param_dict=params,
+                                   proxy_url=self._layer._proxy_url,
+                                   proxy_port=self._layer._proxy_port)
+        self._layer._invalidate_cache()
+        if not isinstance(res, dict) or \
+           not 'deleteResults' in res:
+            raise ValueError(res)
+        return res
+    #----------------------------------------------------------------------
+    def _send(self, oids):
+        """ sends a batch with retries and returns its report """
+        start = time.time()
+        try:
+            res = retry_call(self._post, args=(oids,),
+                             retries=self._retries,
+                             backoff=self._backoff)
+        except Exception, e:
+            res = {"error" : {"message" : str(e)}}
+        report = {"count" : len(oids),
+                  "first" : oids[0],
+                  "last" : oids[-1],
+                  "deleted" : 0,
+                  "failed" : [],
+                  "seconds" : time.time() - start}
+        if 'error' in res:
+            report['error'] = res['error']
+            report['failed'] = list(oids)
+        else:
+            for result in res['deleteResults']:
+                if result.get('success', False):
+                    report['deleted'] += 1
+                else:
+                    report['failed'].append(result.get('objectId', None))
+        return report
+    #----------------------------------------------------------------------
+    def _batches(self, objectIds):
+        """ splits the object ids into batches """
+        if isinstance(objectIds, basestring):
+            objectIds = [oid for oid in objectIds.split(",") if oid.strip() != ""]
+        oids = sorted(set([int(oid) for oid in objectIds]))
+        size = self.batchSize
+        for i in xrange(0, len(oids), size):
+            yield oids[i:i + size]
+    #----------------------------------------------------------------------
+    def iter_batches(self, objectIds):
+        """
+           deletes the features and yields the report of every batch as it
+           completes
+           Inputs:
+              objectIds - list or comma separated string of object ids
+           Output:
+              generator of dictionaries with the number of ids in the
+              batch (count), the first and last id, the number deleted,
+              the ids that failed, the seconds taken and the error of a
+              batch that could not be sent
+        """
+        for oids, report, err in imap_bounded(self._send,
+                                              self._batches(objectIds),
+                                              max_workers=self._max_workers):
+            if err is not None:
+                report = {"count" : len(oids),
+                          "first" : oids[0],
+                          "last" : oids[-1],
+                          "deleted" : 0,
+                          "failed" : list(oids),
+                          "error" : {"message" : str(err)}}
+            yield report
+    #----------------------------------------------------------------------
+    def delete(self, objectIds):
+        """
+           deletes the features and returns a summary
+           Output:
+              dictionary with the number of deleted features, the failed
+              object ids and the batch reports ordered by object id
+        """
+        summary = {"deleted" : 0, "failed" : [], "batches" : []}
+        for report in self.iter_batches(objectIds):
+            summary['deleted'] += report['deleted']
+            summary['failed'].extend(report['failed'])
+            summary['batches'].append(report)
+        summary['batches'].sort(key=lambda r: r['first'])
+        summary['failed'].sort()
+        return summary
+    #----------------------------------------------------------------------
+    def delete_where(self, where="1=1", geometryFilter=None):
+        """
+           deletes the features matching a where clause and an optional
+           filters.GeometryFilter, see delete()
+        """
+        res = self._layer.query(where=where,
+                                geometryFilter=geometryFilter,
+                                returnIDsOnly=True)
+        if 'error' in res:
+            raise ValueError(res)
+        return self.delete(res.get('objectIds') or [])
@@ -0,0 +1,348 @@
+"""
+
+.. module:: bulkload
+   :platform: Windows, Linux
+   :synopsis: Streams large numbers of features into a feature layer.
+
+.. moduleauthor:: Esri
+
+
+"""
+import json
+import time
+import datetime
+import itertools
+from ..common.general import _date_handler, _unicode_convert, Feature
+from ..common.parallel import imap_bounded, retry_call
+from journal import EditJournal, assign_global_ids
+#----------------------------------------------------------------------
+def as_feature_dict(feature, fields=None):
+    """
+       converts a common.Feature, esri json dictionary, attribute dictionary
+       or row to an esri json feature dictionary
+       Inputs:
+          feature - the feature to convert
+          fields - field names of the row when a list/tuple is given.  Use
+                   SHAPE@JSON (or SHAPE@ for arcpy geometries) for the
+                   geometry column.
+       Output:
+          dictionary with attributes and (optional) geometry keys
+    """
+    if isinstance(feature, Feature):
+        return feature.asDictionary
+    elif isinstance(feature, dict):
+        if 'attributes' in feature:
+            return feature
+        return {"attributes" : feature}
+    elif isinstance(feature, (list, tuple)) and \
+         fields is not None:
+        attributes = {}
+        feat = {}
+        for name, value in zip(fields, feature):
+            if name.upper() in ['SHAPE@JSON', 'SHAPE', 'GEOMETRY']:
+                if isinstance(value, basestring):
+                    value = json.loads(value)
+                if value is not None:
+                    feat['geometry'] = value
+            elif name.upper() == 'SHAPE@':
+                if value is not None:
+                    feat['geometry'] = json.loads(value.JSON)
+            else:
+                if isinstance(value, datetime.datetime):
+                    value = _date_handler(value)
+                attributes[name] = value
+        feat['attributes'] = _unicode_convert(attributes)
+        return feat
+    raise TypeError("features must be Feature objects, dictionaries " + \
+                    "or rows with a list of fields")
+########################################################################
+class _Batch(object):
+    """ a block of serialized features sent in a single request """
+    #----------------------------------------------------------------------
+    def __init__(self, number, start, count, payload):
+        """Constructor"""
+        self.number = number
+        self.start = start
+        self.count = count
+        self.payload = payload
+        self.entry = None
+        self.response = None
+        self.seconds = None
+########################################################################
+class BulkLoader(object):
+    """
+       Loads features into a feature layer or table using concurrent
+       addFeatures requests.
+
+       Features are read lazily from any iterable, serialized one at a
+       time and grouped into batches that are capped by the serialized
+       payload size.  The number of features per batch adapts to the
+       observed server response time, several batches are in flight at
+       once, and every batch is retried on its own.  Only the batches in
+       flight are held in memory, so the size of the load is unbounded.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer to load into
+          max_workers - number of concurrent addFeatures requests
+          max_batch_bytes - maximum size of the serialized features of a
+                            single request
+          initial_batch_size - number of features in the first batches
+          min_batch_size - lower limit of the adaptive batch size
+          max_batch_size - upper limit of the adaptive batch size
+          target_seconds - server response time the batch size is tuned
+                           towards
+          retries - number of times a failed batch is re-sent
+          backoff - seconds to wait before the first retry, doubled on
+                    every following retry
+          gdbVersion - geodatabase version to apply the edits to
+          rollbackOnFailure - if True, a batch is only applied when all of
+                              its features succeed
+          journal - journal.EditJournal or path of a journal file.  Every
+                    batch is journaled before it is sent.  When a load is
+                    restarted with the same input and journal, the pending
+                    batches are replayed and the journaled features are
+                    skipped.  On layers with a global id field the features
+                    get global ids and are sent with applyEdits, which makes
+                    the replay idempotent.
+          preprocess - (optional) callable that takes an esri json feature
+                       dictionary and returns the feature to send, applied
+                       before the feature is serialized, for example a
+                       common.generalize.GeometryPreprocessor that cleans
+                       and generalizes the geometries
+    """
+    _layer = None
+    _max_workers = None
+    _max_batch_bytes = None
+    _batch_size = None
+    _min_batch_size = None
+    _max_batch_size = None
+    _target_seconds = None
+    _retries = None
+    _backoff = None
+    _gdbVersion = None
+    _rollbackOnFailure = None
+    _journal = None
+    _preprocess = None
+    _global_id_field = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer,
+                 max_workers=4,
+                 max_batch_bytes=2097152,
+                 initial_batch_size=250,
+                 min_batch_size=10,
+                 max_batch_size=5000,
+                 target_seconds=10.0,
+                 retries=3,
+                 backoff=2.0,
+                 gdbVersion=None,
+                 rollbackOnFailure=True,
+                 journal=None,
+                 preprocess=None):
+        """Constructor"""
+        if isinstance(journal, basestring):
+            journal = EditJournal(path=journal)
+        self._layer = layer
+        self._max_workers = max_workers
+        self._max_batch_bytes = max_batch_bytes
+        self._batch_size = initial_batch_size
+        self._min_batch_size = min_batch_size
+        self._max_batch_size = max_batch_size
+        self._target_seconds = target_seconds
+        self._retries = retries
+        self._backoff = backoff
+        self._gdbVersion = gdbVersion
+        self._rollbackOnFailure = rollbackOnFailure
+        self._journal = journal
+        self._preprocess = preprocess
+    #----------------------------------------------------------------------
+    @property
+    def batchSize(self):
+        """ returns the current number of features per batch """
+        return self._batch_size
+    #----------------------------------------------------------------------
+    @property
+    def journal(self):
+        """ returns the edit journal or None """
+        return self._journal
+    #----------------------------------------------------------------------
+    @property
+    def _operation(self):
+        """ returns the layer operation used to add the features """
+        if self._global_id_field is not None:
+            return "applyEdits"
+        return "addFeatures"
+    #----------------------------------------------------------------------
+    def _params(self, payload):
+        """ returns the request parameters of a batch """
+        params = {
+            "f" : "json",
+            "rollbackOnFailure" : self._rollbackOnFailure
+        }
+        if self._global_id_field is not None:
+            params['adds'] = payload
+            params['useGlobalIds'] = True
+        else:
+            params['features'] = payload
+        if self._gdbVersion is not None:
+            params['gdbVersion'] = self._gdbVersion
+        return params
+    #----------------------------------------------------------------------
+    def _batch(self, number, start, parts):
+        """ creates a batch and journals it before it is sent """
+        batch = _Batch(number, start, len(parts),
+                       "[" + ",".join(parts) + "]")
+        if self._journal is not None:
+            batch.entry = self._journal.begin(self._operation,
+                                              self._params(batch.payload),
+                                              start=start,
+                                              count=batch.count)
+        return batch
+    #----------------------------------------------------------------------
+    def _batches(self, features, fields=None, offset=0):
+        """ serializes the features and groups them into batches """
+        number = 0
+        start = offset
+        parts = []
+        size = 2
+        index = offset
+        for feature in features:
+            feat = as_feature_dict(feature, fields)
+            if self._preprocess is not None:
+                feat = self._preprocess(feat)
+            if self._global_id_field is not None:
+                feat = dict(feat)
+                feat['attributes'] = dict(feat['attributes'])
+                assign_global_ids([feat], self._global_id_field)
+            text = json.dumps(feat, default=_date_handler)
+            if len(parts) > 0 and \
+               (len(parts) >= self._batch_size or \
+                size + len(text) + 1 > self._max_batch_bytes):
+                yield self._batch(number, start, parts)
+                number += 1
+                start = index
+                parts = []
+                size = 2
+            parts.append(text)
+            size += len(text) + 1
+            index += 1
+        if len(parts) > 0:
+            yield self._batch(number, start, parts)
+    #----------------------------------------------------------------------
+    def _post(self, batch):
+        """ sends one batch, raises so the batch is retried on errors """
+        params = self._params(batch.payload)
+        if self._layer._token is not None:
+            params['token'] = self._layer._token
+        res = self._layer._do_post(url=self._layer.url + "/" + self._operation,
+                                   param_dict=params,
+                                   proxy_url=self._layer._proxy_url,
+                                   proxy_port=self._layer._proxy_port)
+        self._layer._invalidate_cache()
+        if not isinstance(res, dict) or \
+           not 'addResults' in res:
+            raise ValueError(res)
+        return res
+    #----------------------------------------------------------------------
+    def _send(self, batch):
+        """ sends a batch with retries and records the response time """
+        start = time.time()
+        try:
+            batch.response = retry_call(self._post, args=(batch,),
+                                        retries=self._retries,
+                                        backoff=self._backoff)
+        except Exception, e:
+            batch.response = {"error" : {"message" : str(e)}}
+        batch.seconds = time.time() - start
+        batch.payload = None
+        return batch
+    #----------------------------------------------------------------------
+    def _adapt(self, batch):
+        """ tunes the batch size towards the target response time """
+        if batch.seconds is None or \
+           'error' in batch.response:
+            self._batch_size = max(self._min_batch_size,
+                                   self._batch_size // 2)
+            return
+        per_feature = batch.seconds / float(max(batch.count, 1))
+        if per_feature <= 0:
+            ideal = self._max_batch_size
+        else:
+            ideal = int(self._target_seconds / per_feature)
+        size = (self._batch_size + ideal) // 2
+        self._batch_size = max(self._min_batch_size,
+                               min(self._max_batch_size, size))
+    #----------------------------------------------------------------------
+    def iter_batches(self, features, fields=None):
+        """
+           loads the features and yields the outcome of every batch as it
+           completes
+           Inputs:
+              features - iterable of common.Feature objects, esri json
+                         feature dictionaries, or rows (lists/tuples)
+              fields - field names of the rows when rows are given.  Use
+                       SHAPE@JSON (or SHAPE@ for arcpy geometries) for the
+                       geometry column.
+           Output:
+              generator of (offsets, response) tuples.  offsets are the
+              input indices of the features of the batch, in the order of
+              the addResults of the response, which is the addFeatures
+              response or an error dictionary.  When a journal is used,
+              the pending batches of an earlier run are replayed first;
+              their responses and offsets only hold the features that
+              were not already in the layer.
+        """
+        offset = 0
+        if self._journal is not None:
+            global_id_field = self._layer.globalIdField
+            if global_id_field is not None and global_id_field != "":
+                self._global_id_field = global_id_field
+            for record, res in self._journal.replay(self._layer):
+                yield record.get('offsets', None) or [], res
+            offset = self._journal.resume_index()
+            if offset > 0:
+                features = itertools.islice(features, offset, None)
+        for batch, res, err in imap_bounded(self._send,
+                                            self._batches(features, fields,
+                                                          offset),
+                                            max_workers=self._max_workers):
+            if err is not None:
+                batch.response = {"error" : {"message" : str(err)}}
+            elif self._journal is not None and \
+                 not 'error' in batch.response:
+                self._journal.commit(batch.entry, batch.response)
+            self._adapt(batch)
+            yield range(batch.start, batch.start + batch.count), batch.response
+    #----------------------------------------------------------------------
+    def iter_results(self, features, fields=None):
+        """
+           loads the features and yields the result of every feature
+           Output:
+              generator of (index, result) tuples in completion order.
+              index is the position of the feature in the input and result
+              is the matching entry of the server's addResults, or an
+              error result when the batch failed.
+        """
+        for offsets, res in self.iter_batches(features, fields):
+            if 'addResults' in res:
+                for index, result in zip(offsets, res['addResults']):
+                    yield index, result
+            else:
+                for index in offsets:
+                    yield index, {"success" : False,
+                                  "error" : res['error']}
+    #----------------------------------------------------------------------
+    def load(self, features, fields=None):
+        """
+           loads the features and returns a summary of the load
+           Output:
+              dictionary with the number of added and failed features and
+              a list of (index, result) for the failed features
+        """
+        summary = {"added" : 0, "failed" : 0, "failures" : []}
+        for index, result in self.iter_results(features, fields):
+            if result.get('success', False):
+                summary['added'] += 1
+            else:
+                summary['failed'] += 1
+                summary['failures'].append((index, result))
+        return summary
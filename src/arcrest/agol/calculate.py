@@ -0,0 +1,185 @@
+"""
+
+.. module:: calculate
+   :platform: Windows, Linux
+   :synopsis: Client side field calculation for layers without the
+              calculate operation.
+
+.. moduleauthor:: Esri
+
+
+"""
+import json
+import sqlite3
+from ..common.general import _date_handler
+from ..common.parallel import imap_bounded, retry_call
+#----------------------------------------------------------------------
+def normalize_expressions(calcExpression):
+    """
+       returns the calcExpression as a list of {"field", "value"} or
+       {"field", "sqlExpression"} dictionaries.  A single dictionary is
+       accepted too.
+    """
+    if isinstance(calcExpression, basestring):
+        calcExpression = json.loads(calcExpression)
+    if isinstance(calcExpression, dict):
+        calcExpression = [calcExpression]
+    expressions = []
+    for expression in calcExpression:
+        if 'field' not in expression or \
+           ('value' not in expression and 'sqlExpression' not in expression):
+            raise ValueError("each calcExpression needs a field and a " + \
+                             "value or sqlExpression: %s" % expression)
+        expressions.append(expression)
+    return expressions
+########################################################################
+class FieldCalculator(object):
+    """
+       Sets fields of the features matching a where clause by querying
+       them in object id batches and sending only the object id and the
+       calculated fields back with updateFeatures.  Batches run
+       concurrently.
+
+       Value expressions are used as is.  SQL expressions are evaluated
+       on each batch with SQLite, which covers the usual standard SQL
+       operators and functions (arithmetic, ||, UPPER, SUBSTR, CASE,
+       COALESCE, ...).
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer
+          calcExpression - list of {"field", "value"} or
+                           {"field", "sqlExpression"} dictionaries
+          where - the selection sql statement
+          batch_size - number of features per batch, default is the
+                       layer's maxRecordCount
+          max_workers - number of concurrent batches
+          retries - number of times a failed request is re-sent
+          backoff - seconds to wait before the first retry
+          gdbVersion - geodatabase version to edit
+    """
+    _layer = None
+    _expressions = None
+    _where = None
+    _batch_size = None
+    _max_workers = None
+    _retries = None
+    _backoff = None
+    _gdbVersion = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer, calcExpression, where="1=1",
+                 batch_size=None, max_workers=4, retries=3, backoff=2.0,
+                 gdbVersion=None):
+        """Constructor"""
+        self._layer = layer
+        self._expressions = normalize_expressions(calcExpression)
+        self._where = where
+        self._batch_size = batch_size
+        self._max_workers = max_workers
+        self._retries = retries
+        self._backoff = backoff
+        self._gdbVersion = gdbVersion
+    #----------------------------------------------------------------------
+    def _request(self, operation, params):
+        """ posts a request to the layer and checks the response """
+        layer = self._layer
+        params = dict(params)
+        params['f'] = "json"
+        if layer._token is not None:
+            params['token'] = layer._token
+        res = layer._do_post(url=layer.url + "/" + operation,
+                             param_dict=params,
+                             proxy_url=layer._proxy_url,
+                             proxy_port=layer._proxy_port)
+        if not isinstance(res, dict) or 'error' in res:
+            raise ValueError(res)
+        return res
+    #----------------------------------------------------------------------
+    def _evaluate(self, oid_field, features):
+        """ returns the update features of a batch """
+        sql = [e for e in self._expressions if 'sqlExpression' in e]
+        computed = {}
+        if len(sql) > 0 and len(features) > 0:
+            columns = sorted(features[0]['attributes'].keys())
+            conn = sqlite3.connect(":memory:")
+            try:
+                conn.execute("CREATE TABLE batch (%s)" % \
+                             ", ".join(['"%s"' % c.replace('"', '""') for c in columns]))
+                conn.executemany("INSERT INTO batch VALUES (%s)" % \
+                                 ", ".join(["?"] * len(columns)),
+                                 [[f['attributes'].get(c, None) for c in columns] \
+                                  for f in features])
+                select = ", ".join(['"%s"' % oid_field.replace('"', '""')] + \
+                                   ["(%s)" % e['sqlExpression'] for e in sql])
+                try:
+                    rows = conn.execute("SELECT %s FROM batch" % select).fetchall()
+                except sqlite3.Error, e:
+                    raise ValueError("cannot evaluate the sql expressions " + \
+                                     "locally: %s" % e)
+            finally:
+                conn.close()
+            for row in rows:
+                computed[row[0]] = row[1:]
+        updates = []
+        for feature in features:
+            oid = feature['attributes'][oid_field]
+            attributes = {oid_field : oid}
+            values = computed.get(oid, None)
+            i = 0
+            for expression in self._expressions:
+                if 'sqlExpression' in expression:
+                    attributes[expression['field']] = values[i]
+                    i += 1
+                else:
+                    attributes[expression['field']] = expression['value']
+            updates.append({"attributes" : attributes})
+        return updates
+    #----------------------------------------------------------------------
+    def _process(self, oids):
+        """ queries, calculates and updates one batch """
+        oid_field = self._layer.objectIdField
+        needs_query = any(['sqlExpression' in e for e in self._expressions])
+        if needs_query:
+            res = retry_call(self._request,
+                             args=("query", {"objectIds" : ",".join(["%s" % o for o in oids]),
+                                             "outFields" : "*",
+                                             "returnGeometry" : False}),
+                             retries=self._retries, backoff=self._backoff)
+            features = res.get('features', [])
+        else:
+            features = [{"attributes" : {oid_field : oid}} for oid in oids]
+        updates = self._evaluate(oid_field, features)
+        if len(updates) == 0:
+            return {"updateResults" : []}
+        params = {"features" : json.dumps(updates, default=_date_handler)}
+        if self._gdbVersion is not None:
+            params['gdbVersion'] = self._gdbVersion
+        res = retry_call(self._request, args=("updateFeatures", params),
+                         retries=self._retries, backoff=self._backoff)
+        self._layer._invalidate_cache()
+        return res
+    #----------------------------------------------------------------------
+    def run(self):
+        """
+           calculates the fields
+           Output:
+              dictionary with success, updatedFeatureCount and the object
+              ids of the features that failed
+        """
+        res = self._layer.query(where=self._where, returnIDsOnly=True)
+        oids = sorted(res.get('objectIds') or [])
+        size = self._batch_size or self._layer.maxRecordCount
+        batches = [oids[i:i + size] for i in xrange(0, len(oids), size)]
+        updated = 0
+        failed = []
+        for batch, result, err in imap_bounded(self._process, batches,
+                                               max_workers=self._max_workers):
+            if err is not None:
+                raise err
+            for item in result.get('updateResults', []):
+                if item.get('success', False):
+                    updated += 1
+                else:
+                    failed.append(item.get('objectId', None))
+        return {"success" : len(failed) == 0,
+                "updatedFeatureCount" : updated,
+                "failed" : failed}
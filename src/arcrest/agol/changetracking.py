@@ -0,0 +1,215 @@
+"""
+
+.. module:: changetracking
+   :platform: Windows, Linux
+   :synopsis: Downloads only the features of a layer that changed since
+              the last download.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import json
+import datetime
+import threading
+########################################################################
+class CheckpointStore(object):
+    """
+       Persists the high-water marks of incremental downloads in a JSON
+       file, keyed by layer url.  The file is rewritten atomically on every
+       change.
+       Inputs:
+          path - path to the checkpoint file.  It is created if missing.
+    """
+    _path = None
+    _data = None
+    _lock = None
+    #----------------------------------------------------------------------
+    def __init__(self, path):
+        """Constructor"""
+        self._path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        if os.path.isfile(path):
+            with open(path, 'rb') as reader:
+                text = reader.read()
+            if text.strip() != "":
+                self._data = json.loads(text)
+    #----------------------------------------------------------------------
+    @property
+    def path(self):
+        """ returns the path of the checkpoint file """
+        return self._path
+    #----------------------------------------------------------------------
+    def get(self, key):
+        """ returns the checkpoint stored for key or None """
+        return self._data.get(key, None)
+    #----------------------------------------------------------------------
+    def set(self, key, value):
+        """ stores the checkpoint for key and saves the file """
+        with self._lock:
+            self._data[key] = value
+            self._save()
+    #----------------------------------------------------------------------
+    def remove(self, key):
+        """ removes the checkpoint for key and saves the file """
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self._save()
+    #----------------------------------------------------------------------
+    def _save(self):
+        """ writes the checkpoints to a temporary file, then swaps it in """
+        temp = self._path + ".tmp"
+        with open(temp, 'wb') as writer:
+            writer.write(json.dumps(self._data))
+            writer.flush()
+            os.fsync(writer.fileno())
+        if os.path.isfile(self._path):
+            os.remove(self._path)
+        os.rename(temp, self._path)
+########################################################################
+class ChangeTracker(object):
+    """
+       Downloads the features of a layer that were added or edited since
+       the last download, using the editor tracking edit date field, and
+       the object ids deleted since then when the service has change
+       tracking enabled.
+
+       The layer's editingInfo.lastEditDate is checked first, so a refresh
+       of an unchanged layer costs a single small request.  The first
+       download, and every download from a layer without editor tracking,
+       returns all features.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer
+          checkpoints - CheckpointStore or path of the checkpoint file
+          where - sql statement limiting the features that are tracked
+          out_fields - the attribute fields to return
+          returnGeometry - true means a geometry will be returned,
+                           else just the attributes
+          track_deletes - if True, deleted object ids are requested with
+                          extractChanges when the service supports it
+    """
+    _layer = None
+    _checkpoints = None
+    _where = None
+    _out_fields = None
+    _returnGeometry = None
+    _track_deletes = None
+    _full = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer, checkpoints,
+                 where="1=1",
+                 out_fields="*",
+                 returnGeometry=True,
+                 track_deletes=True):
+        """Constructor"""
+        if isinstance(checkpoints, basestring):
+            checkpoints = CheckpointStore(path=checkpoints)
+        self._layer = layer
+        self._checkpoints = checkpoints
+        self._where = where
+        self._out_fields = out_fields
+        self._returnGeometry = returnGeometry
+        self._track_deletes = track_deletes
+    #----------------------------------------------------------------------
+    @property
+    def checkpoint(self):
+        """ returns the stored checkpoint of the layer """
+        return self._checkpoints.get(self._layer.url)
+    #----------------------------------------------------------------------
+    @property
+    def full(self):
+        """ returns True when the last download returned every feature """
+        return self._full
+    #----------------------------------------------------------------------
+    def reset(self):
+        """ forgets the checkpoint, the next download returns everything """
+        self._checkpoints.remove(self._layer.url)
+    #----------------------------------------------------------------------
+    def _server_gen(self, service):
+        """ returns the current server generation or None """
+        if not self._track_deletes or service is None:
+            return None
+        service.refresh_service()
+        if service.capabilities is None or \
+           service.capabilities.find("ChangeTracking") == -1 or \
+           service.serverGens is None:
+            return None
+        return service.serverGens.get('serverGen', None)
+    #----------------------------------------------------------------------
+    def _deletes(self, service, since_gen):
+        """ yields the object ids deleted since the server generation """
+        layer_id = self._layer.id
+        res = service.extractChanges(layers=[layer_id],
+                                     layerServerGens=[{"id" : layer_id,
+                                                       "serverGen" : since_gen}],
+                                     returnDeletes=True,
+                                     returnIdsOnly=True)
+        if 'error' in res:
+            raise ValueError(res)
+        for edit in res.get('edits', []):
+            if edit.get('id', None) == layer_id:
+                for oid in edit.get('objectIds', {}).get('deletes', []) or []:
+                    yield oid
+    #----------------------------------------------------------------------
+    def iter_changes(self):
+        """
+           yields the changes since the last checkpoint.  The checkpoint
+           is only advanced once the generator is exhausted, so an
+           interrupted download is repeated by the next call.
+           Output:
+              generator of ("upsert", Feature) and ("delete", object id)
+              tuples
+        """
+        layer = self._layer
+        layer.refresh()
+        last_edit = (layer.editingInfo or {}).get('lastEditDate', None)
+        edit_field = (layer.editFieldsInfo or {}).get('editDateField', None)
+        checkpoint = self.checkpoint
+        full = checkpoint is None or edit_field is None or \
+               checkpoint.get('lastEditDate', None) is None
+        self._full = full
+        if not full and last_edit is not None and \
+           last_edit <= checkpoint['lastEditDate']:
+            return
+        # the service is only read once the layer is known to have changed
+        service = layer.parentLayer
+        server_gen = self._server_gen(service)
+        where = self._where
+        if not full:
+            since = datetime.datetime.utcfromtimestamp(
+                checkpoint['lastEditDate'] / 1000)
+            where = "(%s) AND %s >= timestamp '%s'" % \
+                    (self._where, edit_field,
+                     since.strftime("%Y-%m-%d %H:%M:%S"))
+        for page in layer.query_pages(where=where,
+                                      out_fields=self._out_fields,
+                                      returnGeometry=self._returnGeometry):
+            for feature in page:
+                yield "upsert", feature
+        if not full and server_gen is not None and \
+           checkpoint.get('serverGen', None) is not None:
+            for oid in self._deletes(service, checkpoint['serverGen']):
+                yield "delete", oid
+        self._checkpoints.set(layer.url, {"lastEditDate" : last_edit,
+                                          "serverGen" : server_gen})
+    #----------------------------------------------------------------------
+    def fetch(self):
+        """
+           downloads the changes since the last checkpoint
+           Output:
+              dictionary with the added/updated Feature objects, the
+              deleted object ids and whether the download was complete
+        """
+        changes = {"features" : [], "deletes" : []}
+        self._full = False
+        for action, value in self.iter_changes():
+            if action == "upsert":
+                changes['features'].append(value)
+            else:
+                changes['deletes'].append(value)
+        changes['full'] = self._full
+        return changes
@@ -15,6 +15,7 @@ import urllib
 import os
 import json
 import mimetypes
+import time
 from ..security import security
 from .._abstract import abstract
 from ..common.filters import LayerDefinitionFilter, GeometryFilter, TimeFilter
@@ -55,6 +56,7 @@ class FeatureService(abstract.BaseAGOLClass):
     _proxy_port = None
     _securityHandler = None
     _serverURL = None
+    _serverGens = None
     #----------------------------------------------------------------------
     def __init__(self,
                  url,
@@ -280,6 +282,14 @@ class FeatureService(abstract.BaseAGOLClass):
             self.__init()
         return self._documentInfo
     #----------------------------------------------------------------------
+    @property
+    def serverGens(self):
+        """ returns the minimum and current server generation numbers of
+            a service with change tracking enabled """
+        if self._serverGens is None:
+            self.__init()
+        return self._serverGens
+    #----------------------------------------------------------------------
     def _getLayers(self):
         """ gets layers for the featuer service """
         if self._token is None:
@@ -523,6 +533,142 @@ class FeatureService(abstract.BaseAGOLClass):
         res = self._do_get(url=quURL, param_dict=params, proxy_url=self._proxy_url, proxy_port=self._proxy_port)
         return res
     #----------------------------------------------------------------------
+    def query_statistics(self,
+                         layer_id,
+                         statistics,
+                         groupByFieldsForStatistics=None,
+                         where="1=1",
+                         having=None,
+                         orderByFields=None,
+                         timeFilter=None,
+                         geometryFilter=None,
+                         use_cache=True,
+                         cache_ttl=None):
+        """
+           calculates statistics on a layer or table of the service,
+           optionally grouped by one or more fields.  See
+           FeatureLayer.query_statistics for the inputs.
+           Inputs:
+              layer_id - id of the layer or table
+           Output:
+              list of dictionaries, one per group
+        """
+        fl = servicelayers.FeatureLayer(url=self._url + "/%s" % layer_id,
+                                        securityHandler=self._securityHandler,
+                                        proxy_port=self._proxy_port,
+                                        proxy_url=self._proxy_url)
+        if self._token is not None:
+            fl._token = self._token
+        return fl.query_statistics(statistics=statistics,
+                                   groupByFieldsForStatistics=groupByFieldsForStatistics,
+                                   where=where,
+                                   having=having,
+                                   orderByFields=orderByFields,
+                                   timeFilter=timeFilter,
+                                   geometryFilter=geometryFilter,
+                                   use_cache=use_cache,
+                                   cache_ttl=cache_ttl)
+    #----------------------------------------------------------------------
+    def related_records_index(self,
+                              objectIds,
+                              relationshipId,
+                              outFields="*",
+                              definitionExpression=None,
+                              returnGeometry=True,
+                              outWKID=None,
+                              gdbVersion=None,
+                              batch_size=500,
+                              max_workers=4,
+                              stream=False):
+        """
+           queries the related records of a large number of parent object
+           ids.  The ids are sent in concurrent batches and the
+           relatedRecordGroups are merged into a single index.
+           Inputs:
+              objectIds - list, iterable or comma separated string of
+                          parent object ids
+              relationshipId - The ID of the relationship to be queried.
+              outFields - the fields of the related records to return
+              definitionExpression - The definition expression to be
+                                     applied to the related table/layer.
+              returnGeometry - If true, the geometry of related features
+                               is returned.
+              outWKID - The spatial reference of the returned geometry.
+              gdbVersion - The geodatabase version to query.
+              batch_size - number of parent object ids per request
+              max_workers - number of concurrent requests
+              stream - if True, a generator of (parent object id, related
+                       records) tuples is returned instead of the index
+           Output:
+              dictionary of parent object id -> list of related records
+        """
+        from relationships import RelatedRecords
+        related = RelatedRecords(source=self,
+                                 relationshipId=relationshipId,
+                                 outFields=outFields,
+                                 definitionExpression=definitionExpression,
+                                 returnGeometry=returnGeometry,
+                                 outWKID=outWKID,
+                                 gdbVersion=gdbVersion,
+                                 batch_size=batch_size,
+                                 max_workers=max_workers)
+        if stream:
+            return related.iter_groups(objectIds)
+        return related.index(objectIds)
+    #----------------------------------------------------------------------
+    def extractChanges(self,
+                       layers,
+                       layerServerGens,
+                       returnInserts=False,
+                       returnUpdates=False,
+                       returnDeletes=True,
+                       returnIdsOnly=True,
+                       layerQueries=None,
+                       geometryFilter=None):
+        """
+           Returns the changes made to the layers of a service with change
+           tracking enabled since the given server generation numbers.
+           Inputs:
+              layers - list of layer ids
+              layerServerGens - list of {"id" : <layer id>,
+                                "serverGen" : <generation>} dictionaries
+                                that mark the last extracted changes
+              returnInserts - if True, added features are returned
+              returnUpdates - if True, updated features are returned
+              returnDeletes - if True, deleted object ids are returned
+              returnIdsOnly - if True, only the object ids of the changes
+                              are returned
+              layerQueries - optional per layer where clauses
+                             ex: {"0" : {"where" : "STATUS = 1"}}
+              geometryFilter - Geospatial filter applied to the changes
+           Output:
+              JSON response as dictionary
+        """
+        url = self._url + "/extractChanges"
+        params = {
+            "f" : "json",
+            "layers" : json.dumps(layers),
+            "layerServerGens" : json.dumps(layerServerGens),
+            "returnInserts" : returnInserts,
+            "returnUpdates" : returnUpdates,
+            "returnDeletes" : returnDeletes,
+            "returnIdsOnly" : returnIdsOnly,
+            "dataFormat" : "json"
+        }
+        if not self._token is None:
+            params["token"] = self._token
+        if layerQueries is not None:
+            params['layerQueries'] = json.dumps(layerQueries)
+        if not geometryFilter is None and \
+           isinstance(geometryFilter, GeometryFilter):
+            gf = geometryFilter.filter
+            params['geometryType'] = gf['geometryType']
+            params['geometry'] = gf['geometry']
+            params['inSR'] = gf['inSR']
+        return self._do_post(url=url, param_dict=params,
+                             proxy_url=self._proxy_url,
+                             proxy_port=self._proxy_port)
+    #----------------------------------------------------------------------
     @property
     def replicas(self):
         """ returns all the replicas for a feature service """
@@ -572,6 +718,45 @@ class FeatureService(abstract.BaseAGOLClass):
                             proxy_url=self._proxy_url,
                             proxy_port=self._proxy_port)
     #----------------------------------------------------------------------
+    def replicaJobStatus(self, statusUrl):
+        """
+           returns the status of an asynchronous createReplica or
+           synchronizeReplica job, or of a layer's append job
+           Inputs:
+              statusUrl - the statusUrl returned when the job was submitted
+        """
+        params = {
+            "f" : "json"
+        }
+        if not self._token is None:
+            params["token"] = self._token
+        return self._do_get(statusUrl, param_dict=params,
+                            proxy_url=self._proxy_url,
+                            proxy_port=self._proxy_port)
+    #----------------------------------------------------------------------
+    def _wait_for_job(self, statusUrl, poll_interval=2,
+                      max_poll_interval=30, timeout=None):
+        """ polls an asynchronous job (replica or append) until it
+            completes, waiting a little longer between each check, and
+            returns the final status """
+        start = time.time()
+        interval = poll_interval
+        while True:
+            status = self.replicaJobStatus(statusUrl)
+            if 'error' in status:
+                raise ValueError(status)
+            state = status.get('status', "")
+            if state in ("Completed", "CompletedWithErrors"):
+                return status
+            if state == "Failed":
+                raise ValueError(status)
+            if timeout is not None and \
+               time.time() - start + interval > timeout:
+                raise ValueError("job did not finish in %s seconds: %s" % \
+                                 (timeout, statusUrl))
+            time.sleep(interval)
+            interval = min(interval * 1.5, max_poll_interval)
+    #----------------------------------------------------------------------
     def createReplica(self,
                       replicaName,
                       layers,
@@ -581,7 +766,14 @@ class FeatureService(abstract.BaseAGOLClass):
                       returnAttachments=False,
                       returnAttachmentDatabyURL=True,
                       returnAsFeatureClass=False,
-                      out_path=None
+                      out_path=None,
+                      asynchronous=False,
+                      wait=True,
+                      poll_interval=2,
+                      max_poll_interval=30,
+                      timeout=None,
+                      syncModel=None,
+                      dataFormat=None
                       ):
         """ generates a replica
             Inputs:
@@ -610,6 +802,22 @@ class FeatureService(abstract.BaseAGOLClass):
                                       json file.
                out_path - Path where the FGDB will be saved.  Only used with returnAsFeatureClass is
                           True.
+               asynchronous - If True, the replica is created as a job on the server, which avoids
+                              gateway timeouts on large replicas.  The job status is polled until
+                              it completes.
+               wait - Only used when asynchronous is True.  If False, the job is submitted and
+                      the response holding its statusUrl is returned right away.
+               poll_interval - seconds between the first status checks.  The interval grows
+                               on each check up to max_poll_interval.
+               max_poll_interval - longest wait between status checks in seconds
+               timeout - seconds to wait for the job before a ValueError is raised. None waits
+                         until the job finishes.
+               syncModel - none, perReplica or perLayer.  Only used when returnAsFeatureClass
+                           is False; replicas that will be synchronized need perReplica or
+                           perLayer.
+               dataFormat - json, sqlite or filegdb.  Only used when returnAsFeatureClass is
+                            False.
+            The FGDB is extracted while it downloads, so no zip file is written to disk.
         """
         if self.syncEnabled:
             url = self._url + "/createReplica"
@@ -619,10 +827,12 @@ class FeatureService(abstract.BaseAGOLClass):
                 "layers": layers,
                 "returnAttachmentDatabyURL" : returnAttachmentDatabyURL,
                 "returnAttachments" : returnAttachments,
-                "async" : False
+                "async" : asynchronous
             }
             if not self._token is None:
                 params["token"] = self._token
+            if layerQueries is not None:
+                params['layerQueries'] = json.dumps(layerQueries)
             if not geometryFilter is None and \
                isinstance(geometryFilter, GeometryFilter):
                 gf = geometryFilter.filter
@@ -638,19 +848,120 @@ class FeatureService(abstract.BaseAGOLClass):
                 res = self._do_post(url=url, param_dict=params,
                                     proxy_url=self._proxy_url,
                                     proxy_port=self._proxy_port)
-                if res.has_key("responseUrl"):
+                if asynchronous:
+                    if not wait or not res.has_key("statusUrl"):
+                        return res
+                    res = self._wait_for_job(statusUrl=res['statusUrl'],
+                                             poll_interval=poll_interval,
+                                             max_poll_interval=max_poll_interval,
+                                             timeout=timeout)
+                    res['responseUrl'] = res.get('resultUrl', None)
+                if res.get("responseUrl", None) is not None:
                     zipURL = res["responseUrl"]
-                    dl_file = self._download_file(url=zipURL,
-                                        save_path=out_path,
-                                        file_name=os.path.basename(zipURL)
-                                        )
-                    self._unzip_file(zip_file=dl_file, out_folder=out_path)
-                    os.remove(dl_file)
+                    token = None
+                    if self._token is not None:
+                        token = {"token" : self._token}
+                    self._stream_unzip(url=zipURL, out_folder=out_path,
+                                       param_dict=token)
                     return self._list_files(path=out_path + os.sep + "*.gdb")
                 else:
                     return None
             else:
+                if syncModel is not None:
+                    params['syncModel'] = syncModel
+                if dataFormat is not None:
+                    params['dataFormat'] = dataFormat
                 res = self._do_post(url=url, param_dict=params, proxy_url=self._proxy_url, proxy_port=self._proxy_port)
+                if asynchronous and wait and res.has_key("statusUrl"):
+                    return self._wait_for_job(statusUrl=res['statusUrl'],
+                                              poll_interval=poll_interval,
+                                              max_poll_interval=max_poll_interval,
+                                              timeout=timeout)
                 return res
 
-        return "Not Supported"
\ No newline at end of file
+        return "Not Supported"
+    #----------------------------------------------------------------------
+    def synchronizeReplica(self,
+                           replicaID,
+                           replicaServerGen=None,
+                           syncLayers=None,
+                           syncDirection="download",
+                           edits=None,
+                           returnIdsForAdds=False,
+                           returnAttachmentDatabyURL=True,
+                           rollbackOnFailure=True,
+                           closeReplica=False,
+                           asynchronous=False,
+                           poll_interval=2,
+                           max_poll_interval=30,
+                           timeout=None):
+        """
+           downloads the changes made on the service since the last
+           synchronization of a replica, and uploads local edits
+           Inputs:
+              replicaID - the id returned when the replica was created
+              replicaServerGen - the server generation of the last sync of
+                                 a perReplica replica
+              syncLayers - list of {"id" : <layer id>, "serverGen" : <gen>,
+                           "syncDirection" : <direction>} for a perLayer
+                           replica
+              syncDirection - download, upload, bidirectional or snapshot
+              edits - list of {"id" : <layer id>, "features" : {"adds" :
+                      [...], "updates" : [...], "deleteIds" : [...]}}
+                      to upload
+              returnIdsForAdds - if True, the object ids given to uploaded
+                                 adds are returned
+              returnAttachmentDatabyURL - if True, attachments are returned
+                                          as urls
+              rollbackOnFailure - if True, uploaded edits are applied all or
+                                  none
+              closeReplica - if True, the replica is unregistered after
+                             the sync
+              asynchronous - if True, the sync runs as a job that is polled
+                             until it completes
+              poll_interval - seconds between the first status checks
+              max_poll_interval - longest wait between status checks
+              timeout - seconds to wait for the job, None waits until it
+                        finishes
+           Output:
+              dictionary with the new server generations and the edits
+        """
+        url = self._url + "/synchronizeReplica"
+        params = {
+            "f" : "json",
+            "replicaID" : replicaID,
+            "transportType" : "esriTransportTypeEmbedded",
+            "dataFormat" : "json",
+            "syncDirection" : syncDirection,
+            "returnIdsForAdds" : returnIdsForAdds,
+            "returnAttachmentDatabyURL" : returnAttachmentDatabyURL,
+            "rollbackOnFailure" : rollbackOnFailure,
+            "closeReplica" : closeReplica,
+            "async" : asynchronous
+        }
+        if not self._token is None:
+            params["token"] = self._token
+        if replicaServerGen is not None:
+            params['replicaServerGen'] = replicaServerGen
+        if syncLayers is not None:
+            params['syncLayers'] = json.dumps(syncLayers)
+        if edits is not None:
+            params['edits'] = json.dumps(edits, default=_date_handler)
+        res = self._do_post(url=url, param_dict=params,
+                            proxy_url=self._proxy_url,
+                            proxy_port=self._proxy_port)
+        if asynchronous and res.has_key("statusUrl"):
+            status = self._wait_for_job(statusUrl=res['statusUrl'],
+                                        poll_interval=poll_interval,
+                                        max_poll_interval=max_poll_interval,
+                                        timeout=timeout)
+            if status.get('resultUrl', None) is not None:
+                token = {}
+                if self._token is not None:
+                    token['token'] = self._token
+                res = self._do_get(status['resultUrl'], param_dict=token,
+                                   proxy_url=self._proxy_url,
+                                   proxy_port=self._proxy_port)
+            else:
+                res = status
+        return res
\ No newline at end of file
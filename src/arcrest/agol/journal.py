@@ -0,0 +1,263 @@
+"""
+
+.. module:: journal
+   :platform: Windows, Linux
+   :synopsis: Write-ahead journal that makes long running edit sessions
+              resumable.
+
+.. moduleauthor:: Esri
+
+
+"""
+import os
+import json
+import uuid
+import time
+import threading
+#----------------------------------------------------------------------
+def assign_global_ids(features, global_id_field):
+    """
+       gives every feature dictionary without a global id a new one
+       Inputs:
+          features - list of esri json feature dictionaries
+          global_id_field - name of the layer's global id field
+       Output:
+          the list of features
+    """
+    for feature in features:
+        attributes = feature['attributes']
+        if attributes.get(global_id_field, None) in [None, ""]:
+            attributes[global_id_field] = "{%s}" % str(uuid.uuid4()).upper()
+    return features
+########################################################################
+class EditJournal(object):
+    """
+       Append-only log of the edit requests sent to a feature layer.
+
+       Every batch is written (and flushed to disk) before it is sent, and
+       the outcome is appended once the server answered.  After a crash the
+       journal tells which batches were committed and which are pending, so
+       a run can skip the committed work and replay only the pending
+       batches.  Added features that carry a global id are checked against
+       the layer before a replay, which makes replaying them idempotent.
+
+       Inputs:
+          path - path to the journal file.  It is created if missing and
+                 appended to otherwise.
+    """
+    _path = None
+    _file = None
+    _lock = None
+    _begins = None
+    _commits = None
+    _next_id = None
+    #----------------------------------------------------------------------
+    def __init__(self, path):
+        """Constructor"""
+        self._path = path
+        self._lock = threading.Lock()
+        self._begins = {}
+        self._commits = {}
+        self._next_id = 0
+        self.__load()
+        self._file = open(path, 'ab')
+    #----------------------------------------------------------------------
+    def __load(self):
+        """ reads the records of an existing journal """
+        if not os.path.isfile(self._path):
+            return
+        with open(self._path, 'rb') as reader:
+            for line in reader:
+                line = line.strip()
+                if line == "":
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a torn last line from a crash while writing
+                    continue
+                if record['type'] == "begin":
+                    self._begins[record['id']] = record
+                elif record['type'] == "commit":
+                    self._commits[record['id']] = record
+                self._next_id = max(self._next_id, record['id'] + 1)
+    #----------------------------------------------------------------------
+    def __write(self, record):
+        """ appends a record and forces it to disk """
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    #----------------------------------------------------------------------
+    @property
+    def path(self):
+        """ returns the path of the journal file """
+        return self._path
+    #----------------------------------------------------------------------
+    def begin(self, operation, params, start=None, count=None):
+        """
+           records a batch before it is sent
+           Inputs:
+              operation - name of the layer operation, e.g. addFeatures,
+                          updateFeatures or applyEdits
+              params - request parameters.  The token is not stored.
+              start - index of the first input feature of the batch
+              count - number of input features in the batch.  With start,
+                      the input index of every feature of the batch is
+                      recorded as the offsets of the entry.
+           Output:
+              id of the journal entry
+        """
+        params = dict([(k, v) for k, v in params.iteritems() \
+                       if k not in ['token', 'f']])
+        with self._lock:
+            record = {"type" : "begin",
+                      "id" : self._next_id,
+                      "operation" : operation,
+                      "params" : params,
+                      "start" : start,
+                      "count" : count,
+                      "offsets" : None,
+                      "time" : time.time()}
+            if start is not None and count is not None:
+                record['offsets'] = range(start, start + count)
+            self._next_id += 1
+            self.__write(record)
+            self._begins[record['id']] = record
+        return record['id']
+    #----------------------------------------------------------------------
+    def commit(self, entry_id, result):
+        """
+           records the server response of a batch
+           Inputs:
+              entry_id - id returned by begin
+              result - response of the server
+        """
+        succeeded = 0
+        failed = 0
+        if isinstance(result, dict):
+            for key in ['addResults', 'updateResults', 'deleteResults']:
+                for res in result.get(key, []) or []:
+                    if res.get('success', False):
+                        succeeded += 1
+                    else:
+                        failed += 1
+        with self._lock:
+            record = {"type" : "commit",
+                      "id" : entry_id,
+                      "succeeded" : succeeded,
+                      "failed" : failed,
+                      "time" : time.time()}
+            self.__write(record)
+            self._commits[entry_id] = record
+    #----------------------------------------------------------------------
+    def pending(self):
+        """ returns the begin records without a commit, oldest first """
+        return [self._begins[k] for k in sorted(self._begins.keys()) \
+                if k not in self._commits]
+    #----------------------------------------------------------------------
+    def committed(self):
+        """ returns the begin records with a commit, oldest first """
+        return [self._begins[k] for k in sorted(self._begins.keys()) \
+                if k in self._commits]
+    #----------------------------------------------------------------------
+    def resume_index(self):
+        """
+           returns the number of input features already written to the
+           journal.  A resumed run skips that many features of its input.
+        """
+        end = 0
+        for record in self._begins.itervalues():
+            offsets = record.get('offsets', None) or []
+            if len(offsets) > 0:
+                end = max(end, max(offsets) + 1)
+        return end
+    #----------------------------------------------------------------------
+    def _existing_global_ids(self, layer, global_ids):
+        """ returns the global ids that already exist in the layer """
+        field = layer.globalIdField
+        found = set()
+        for i in xrange(0, len(global_ids), 500):
+            chunk = global_ids[i:i + 500]
+            where = "%s IN (%s)" % (field,
+                                    ",".join(["'%s'" % g for g in chunk]))
+            res = layer.query(where=where, out_fields=field,
+                              returnGeometry=False)
+            for feature in res:
+                value = feature.get_value(field)
+                if value is not None:
+                    found.add(value.upper().strip('{}'))
+        return found
+    #----------------------------------------------------------------------
+    def _drop_existing(self, layer, operation, params):
+        """ removes adds whose global id is already in the layer, returns
+            the parameters and the positions of the adds that are kept, or
+            None when all are kept """
+        field = layer.globalIdField
+        key = 'adds'
+        if operation == 'addFeatures':
+            key = 'features'
+        if field is None or field == "" or \
+           not key in params:
+            return params, None
+        features = json.loads(params[key])
+        global_ids = [f['attributes'].get(field, None) for f in features]
+        global_ids = [g for g in global_ids if g not in [None, ""]]
+        kept = None
+        if len(global_ids) > 0:
+            existing = self._existing_global_ids(layer, global_ids)
+            kept = [i for i, f in enumerate(features) \
+                    if (f['attributes'].get(field, None) or "").upper().strip('{}') \
+                    not in existing]
+            params[key] = json.dumps([features[i] for i in kept])
+        return params, kept
+    #----------------------------------------------------------------------
+    def replay(self, layer):
+        """
+           re-sends the pending batches.  Added features whose global id
+           is already in the layer are dropped first, so a batch that was
+           committed before the crash is not added twice.  Updates and
+           deletes are idempotent and are sent again as they are.
+           Inputs:
+              layer - agol.FeatureLayer or agol.TableLayer the journal
+                      belongs to
+           Output:
+              generator of (begin record, response) tuples.  The offsets
+              of the yielded record only hold the input indices of the
+              features that were sent, in the order of the response.
+        """
+        for record in self.pending():
+            operation = record['operation']
+            params = dict(record['params'])
+            params['f'] = "json"
+            if operation in ['addFeatures', 'applyEdits']:
+                params, kept = self._drop_existing(layer, operation, params)
+                if kept is not None and record.get('offsets', None) is not None:
+                    record = dict(record)
+                    record['offsets'] = [record['offsets'][i] for i in kept]
+            edits = [k for k in ['features', 'adds', 'updates', 'deletes'] \
+                     if params.get(k, None) not in [None, "", "[]"]]
+            if len(edits) == 0:
+                res = {"addResults" : []}
+            else:
+                if layer._token is not None:
+                    params['token'] = layer._token
+                res = layer._do_post(url=layer.url + "/" + operation,
+                                     param_dict=params,
+                                     proxy_url=layer._proxy_url,
+                                     proxy_port=layer._proxy_port)
+                layer._invalidate_cache()
+            if isinstance(res, dict) and not 'error' in res:
+                self.commit(record['id'], res)
+            yield record, res
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the journal file """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
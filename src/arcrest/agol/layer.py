@@ -14,11 +14,16 @@ import types
 from ..common import filters
 from ..common.geometry import SpatialReference
 from ..common.general import _date_handler, _unicode_convert, Feature
+from ..common.cache import statistics_cache, query_cache, make_key
+from ..common.statistics import StatisticsMixin
+from ..common.quantization import dequantize, quantization_parameters
+from ..common.quantization import resolution_for_scale, precision_for_resolution
+from ..common.quantization import is_geographic
 from ..common.spatial import scratchFolder, scratchGDB, json_to_featureclass
-from ..common.spatial import get_OID_field, get_records_with_attachments
-from ..common.spatial import create_feature_layer, merge_feature_class
-from ..common.spatial import featureclass_to_json, create_feature_class
-from ..common.spatial import get_attachment_data
+from ..common.spatial import get_OID_field, merge_feature_class
+from ..common.spatial import create_feature_class, iter_featureclass
+from ..common.spatial import iter_attachment_data
+from ..web._base import FileData
 import featureservice
 import os
 import json
@@ -26,9 +31,11 @@ import math
 import urlparse
 import mimetypes
 import uuid
+import time
+import warnings
 from urlparse import urlparse
 ########################################################################
-class FeatureLayer(abstract.BaseAGOLClass):
+class FeatureLayer(abstract.BaseAGOLClass, StatisticsMixin):
     """
        This contains information about a feature service's layer.
     """
@@ -87,6 +94,12 @@ class FeatureLayer(abstract.BaseAGOLClass):
     _supportsAttachmentsByUploadId = None
     _editFieldsInfo = None
     _serverURL = None
+    _query_cache = None
+    _query_cache_ttl = None
+    _query_cache_revalidate = None
+    _edit_date = None
+    _edit_date_checked = None
+    _pbf_supported = None
     #----------------------------------------------------------------------
     def __init__(self, url,
                  securityHandler=None,
@@ -169,6 +182,10 @@ class FeatureLayer(abstract.BaseAGOLClass):
         for att in attributes:
             yield (att, getattr(self, att))
     #----------------------------------------------------------------------
+    def refresh(self):
+        """ reloads the properties of the layer from the service """
+        self.__init()
+    #----------------------------------------------------------------------
     @property
     def url(self):
         """ returns the url for the feature layer"""
@@ -523,11 +540,15 @@ class FeatureLayer(abstract.BaseAGOLClass):
             else:
                 pass
     #----------------------------------------------------------------------
-    def addAttachment(self, oid, file_path):
+    def addAttachment(self, oid, file_path, file_name=None):
         """ Adds an attachment to a feature service
             Input:
               oid - string - OBJECTID value to add attachment to
-              file_path - string - path to file
+              file_path - string - path to file, a file like object, or
+                          the bytes of the file wrapped in a
+                          web._base.FileData
+              file_name - string - (optional) name of the attachment.
+                          Required when file_path is not a path.
             Output:
               JSON Repsonse
         """
@@ -536,10 +557,12 @@ class FeatureLayer(abstract.BaseAGOLClass):
             params = {'f':'json'}
             if not self._token is None:
                 params['token'] = self._token
-            parsed = urlparse.urlparse(attachURL)
+            parsed = urlparse(attachURL)
 
+            if file_name is None:
+                file_name = os.path.basename(file_path)
             files = []
-            files.append(('attachment', file_path, os.path.basename(file_path)))
+            files.append(('attachment', file_path, file_name))
             res = self._post_multipart(host=parsed.hostname,
                                        selector=parsed.path,
                                        files=files,
@@ -548,7 +571,31 @@ class FeatureLayer(abstract.BaseAGOLClass):
                                        ssl=parsed.scheme.lower() == 'https',
                                        proxy_url=self._proxy_url,
                                        proxy_port=self._proxy_port)
-            return self._unicode_convert(json.loads(res))
+            return res
+        else:
+            return "Attachments are not supported for this feature service."
+    #----------------------------------------------------------------------
+    def downloadAttachments(self, cache_folder, where="1=1",
+                            object_ids=None, max_workers=4):
+        """ downloads the attachments of many features concurrently into
+            a cache folder.  Attachments already in the cache (same id and
+            size) are not downloaded again.
+            Input:
+              cache_folder - string - folder holding the files
+              where - string - sql statement selecting the features
+              object_ids - list - (optional) object ids of the features,
+                           used instead of where
+              max_workers - integer - number of concurrent downloads
+            Output:
+              dictionary with the download counts and a record per
+              attachment holding its cache path
+        """
+        from attachments import AttachmentDownloader
+        if self.hasAttachments == True:
+            downloader = AttachmentDownloader(layer=self,
+                                              cache_folder=cache_folder,
+                                              max_workers=max_workers)
+            return downloader.download(where=where, object_ids=object_ids)
         else:
             return "Attachments are not supported for this feature service."
     #----------------------------------------------------------------------
@@ -586,7 +633,7 @@ class FeatureLayer(abstract.BaseAGOLClass):
         }
         if not self._token is None:
             params['token'] = self._token
-        parsed = urlparse.urlparse(url)
+        parsed = urlparse(url)
         port = parsed.port
         files = []
         files.append(('attachment', file_path, os.path.basename(file_path)))
@@ -598,7 +645,7 @@ class FeatureLayer(abstract.BaseAGOLClass):
                                    ssl=parsed.scheme.lower() == 'https',
                                    proxy_port=self._proxy_port,
                                    proxy_url=self._proxy_url)
-        return self._unicode_convert(json.loads(res))
+        return res
     #----------------------------------------------------------------------
     def listAttachments(self, oid):
         """ list attachements for a given OBJECT ID """
@@ -648,7 +695,14 @@ class FeatureLayer(abstract.BaseAGOLClass):
               returnIDsOnly=False,
               returnCountOnly=False,
               returnFeatureClass=False,
-              out_fc=None):
+              out_fc=None,
+              maxAllowableOffset=None,
+              geometryPrecision=None,
+              outSR=None,
+              quantizationParameters=None,
+              scale=None,
+              dpi=96,
+              use_pbf=None):
         """ queries a feature service based on a sql statement
             Inputs:
                where - the selection sql statement
@@ -670,7 +724,29 @@ class FeatureLayer(abstract.BaseAGOLClass):
                returnFeatureClass - Default False. If true, query will be
                                     returned as feature class
                out_fc - only valid if returnFeatureClass is set to True.
-                        Output location of query.
+                        Output location of query.  Paths ending in
+                        .geojson, .geojsonl, .ndjson, .csv or .gpkg are
+                        written without arcpy.
+               maxAllowableOffset - generalization tolerance of the returned
+                                    geometries, in the units of outSR
+               geometryPrecision - number of decimal places of the returned
+                                   coordinates
+               outSR - wkid of the spatial reference of the returned
+                       geometries
+               quantizationParameters - dictionary (see
+                                        quantization.quantization_parameters)
+                                        or True to quantize to the pixel
+                                        size of scale over the layer
+                                        extent.  Quantized responses are
+                                        decoded back to real coordinates.
+               scale - map scale denominator the features are drawn at.
+                       maxAllowableOffset and geometryPrecision default to
+                       the size of a pixel at this scale.
+               dpi - resolution of the display used with scale
+               use_pbf - if True, features are downloaded in the compact
+                         protocol buffer format (f=pbf).  Default (None)
+                         uses it when the layer's supportedQueryFormats
+                         lists PBF.
             Output:
                A list of Feature Objects (default) or a path to the output featureclass if
                returnFeatureClass is set to True.
@@ -694,13 +770,55 @@ class FeatureLayer(abstract.BaseAGOLClass):
             params['geometryType'] = gf['geometryType']
             params['spatialRelationship'] = gf['spatialRel']
             params['inSR'] = gf['inSR']
+        if returnGeometry:
+            params.update(self._reduction_params(maxAllowableOffset,
+                                                 geometryPrecision,
+                                                 outSR,
+                                                 quantizationParameters,
+                                                 scale, dpi))
+        cache_key = None
+        if self._query_cache is not None and \
+           not returnFeatureClass and \
+           (self._token is not None or self._securityHandler is None):
+            # entries are keyed per token, responses requested without a
+            # token through a security handler are never cached
+            cache_key = make_key(self._url, params, self._token)
+            edit_date = self._current_edit_date()
+            entry = self._query_cache.get(cache_key)
+            if entry is not None and entry[0] == edit_date:
+                # the response is cached as json text, so every caller
+                # gets its own objects
+                results = _unicode_convert(json.loads(entry[1]))
+                if not returnCountOnly and not returnIDsOnly:
+                    return [Feature(res) for res in results['features']]
+                return results
         fURL = self._url + "/query"
-        results = self._do_get(fURL, params, proxy_port=self._proxy_port,
-                               proxy_url=self._proxy_url)
+        if not returnFeatureClass and not returnCountOnly and \
+           not returnIDsOnly and self._pbf_enabled(use_pbf):
+            results = self._query_pbf(fURL, params)
+        else:
+            results = self._do_get(fURL, params, proxy_port=self._proxy_port,
+                                   proxy_url=self._proxy_url)
         if 'error' in results:
             raise ValueError (results)
+        dequantize(results)
+        if cache_key is not None:
+            if not returnCountOnly and not returnIDsOnly:
+                text = json.dumps({"features" : results['features']},
+                                  default=_date_handler)
+            else:
+                text = json.dumps(results, default=_date_handler)
+            self._query_cache.set(cache_key, (edit_date, text),
+                                  ttl=self._query_cache_ttl)
         if not returnCountOnly and not returnIDsOnly:
             if returnFeatureClass:
+                from ..common.sinks import sink_for_path
+                sink = sink_for_path(out_fc or "")
+                if sink is not None:
+                    # GeoJSON, CSV and GeoPackage outputs do not need arcpy
+                    sink.write_result(results)
+                    sink.close()
+                    return out_fc
                 json_text = json.dumps(results)
                 temp = scratchFolder() + os.sep + uuid.uuid4().get_hex() + ".json"
                 with open(temp, 'wb') as writer:
@@ -720,6 +838,305 @@ class FeatureLayer(abstract.BaseAGOLClass):
             return results
         return
     #----------------------------------------------------------------------
+    def _pbf_enabled(self, use_pbf=None):
+        """ returns True when queries should use f=pbf """
+        if use_pbf is None:
+            if self._pbf_supported is None:
+                formats = self.supportedQueryFormats
+                self._pbf_supported = isinstance(formats, basestring) and \
+                    "pbf" in [f.strip().lower() for f in formats.split(",")]
+            return self._pbf_supported
+        return use_pbf
+    #----------------------------------------------------------------------
+    def _query_pbf(self, url, params, columnar=False):
+        """ runs a query with f=pbf and decodes the response """
+        from ..common import pbf
+        params = dict(params)
+        params['f'] = "pbf"
+        data = self._do_post_raw(url, params, proxy_port=self._proxy_port,
+                                 proxy_url=self._proxy_url)
+        if data[:1] == "{":
+            # errors are returned as json
+            return json.loads(data)
+        return pbf.decode(data, columnar=columnar)
+    #----------------------------------------------------------------------
+    def query_columns(self, where="1=1", out_fields="*",
+                      returnGeometry=True, use_pbf=None, **kwargs):
+        """ queries the layer and returns the result column by column,
+            which is compact for large extracts.  The protocol buffer
+            response is decoded straight into columns when it is used.
+            Inputs:
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               returnGeometry - true means the geometries are returned
+               use_pbf - see query
+               kwargs - other query reduction options: maxAllowableOffset,
+                        geometryPrecision, outSR, quantizationParameters,
+                        scale and dpi
+            Output:
+               dictionary with the fields, a columns dictionary of field
+               name -> list of values, and the list of geometries
+        """
+        params = {"f": "json",
+                  "where": where,
+                  "outFields": out_fields,
+                  "returnGeometry" : returnGeometry
+                  }
+        if not self._token is None:
+            params["token"] = self._token
+        if returnGeometry:
+            params.update(self._reduction_params(**kwargs))
+        fURL = self._url + "/query"
+        if self._pbf_enabled(use_pbf):
+            results = self._query_pbf(fURL, params, columnar=True)
+            if 'error' in results:
+                raise ValueError (results)
+            return results
+        results = self._do_get(fURL, params, proxy_port=self._proxy_port,
+                               proxy_url=self._proxy_url)
+        if 'error' in results:
+            raise ValueError (results)
+        dequantize(results)
+        features = results.pop('features', [])
+        names = [fld['name'] for fld in results.get('fields', [])]
+        if len(names) == 0 and len(features) > 0:
+            names = features[0]['attributes'].keys()
+        results['columns'] = dict([(name, [feature['attributes'].get(name, None) \
+                                           for feature in features]) \
+                                   for name in names])
+        results['geometries'] = [feature.get('geometry', None) for feature in features]
+        return results
+    #----------------------------------------------------------------------
+    def _reduction_params(self, maxAllowableOffset=None,
+                          geometryPrecision=None, outSR=None,
+                          quantizationParameters=None, scale=None, dpi=96):
+        """ returns the query parameters that reduce the geometry payload """
+        params = {}
+        resolution = None
+        if scale is not None:
+            wkid = outSR
+            if wkid is None and self.extent is not None:
+                wkid = self.extent.get('spatialReference', None)
+            resolution = resolution_for_scale(scale, dpi,
+                                              geographic=is_geographic(wkid))
+            if maxAllowableOffset is None:
+                maxAllowableOffset = resolution
+            if geometryPrecision is None:
+                geometryPrecision = precision_for_resolution(resolution)
+        if maxAllowableOffset is not None:
+            params['maxAllowableOffset'] = maxAllowableOffset
+        if geometryPrecision is not None:
+            params['geometryPrecision'] = geometryPrecision
+        if outSR is not None:
+            params['outSR'] = json.dumps(SpatialReference(outSR).asDictionary)
+        if quantizationParameters == True:
+            if outSR is not None:
+                raise AttributeError("quantizationParameters=True uses the " + \
+                                     "layer extent and cannot be combined " + \
+                                     "with outSR")
+            tolerance = resolution or maxAllowableOffset
+            if tolerance is None:
+                raise AttributeError("scale or maxAllowableOffset is " + \
+                                     "required to quantize")
+            quantizationParameters = quantization_parameters(self.extent,
+                                                             tolerance)
+        if isinstance(quantizationParameters, dict):
+            params['quantizationParameters'] = json.dumps(quantizationParameters)
+        return params
+    #----------------------------------------------------------------------
+    def enableQueryCache(self, ttl=300, revalidate=30, cache=None):
+        """ turns on caching of query results.  Results are keyed on the
+            normalized query (layer url, where, out fields, geometry, time,
+            ...) and the token, so the results of one user are never
+            returned to another.  They are dropped when this client edits
+            the layer, and when the layer's editingInfo.lastEditDate
+            changes, which is checked at most every revalidate seconds.
+            The responses are cached as json text, so every call returns
+            new objects.
+            Inputs:
+               ttl - seconds a result stays cached
+               revalidate - seconds between checks of the lastEditDate.
+                            None turns the check off.
+               cache - common.cache.TTLCache to use.  Default is the
+                       shared common.cache.query_cache.
+        """
+        if cache is None:
+            cache = query_cache
+        self._query_cache = cache
+        self._query_cache_ttl = ttl
+        self._query_cache_revalidate = revalidate
+        self._edit_date_checked = None
+    #----------------------------------------------------------------------
+    def disableQueryCache(self):
+        """ turns off caching of query results """
+        if self._query_cache is not None:
+            self._query_cache.invalidate(self._url)
+        self._query_cache = None
+    #----------------------------------------------------------------------
+    def _current_edit_date(self):
+        """ returns the lastEditDate of the layer, read from the server at
+            most every revalidate seconds """
+        if self._query_cache_revalidate is None:
+            return None
+        now = time.time()
+        if self._edit_date_checked is None or \
+           now - self._edit_date_checked >= self._query_cache_revalidate:
+            params = {"f" : "json"}
+            if self._token is not None:
+                params['token'] = self._token
+            info = self._do_get(self._url, params,
+                                proxy_port=self._proxy_port,
+                                proxy_url=self._proxy_url)
+            self._edit_date = (info.get('editingInfo', None) or {}).get('lastEditDate', None)
+            self._edit_date_checked = now
+        return self._edit_date
+    #----------------------------------------------------------------------
+    def _invalidate_cache(self):
+        """ drops the cached query and statistics results of the layer """
+        query_cache.invalidate(self._url)
+        if self._query_cache is not None and \
+           self._query_cache is not query_cache:
+            self._query_cache.invalidate(self._url)
+        statistics_cache.invalidate(self._url + "/query")
+        self._edit_date_checked = None
+    #----------------------------------------------------------------------
+    def query_pages(self,
+                    where="1=1",
+                    out_fields="*",
+                    returnGeometry=True,
+                    page_size=None):
+        """ queries the layer one page at a time, so results larger than
+            the maxRecordCount of the service can be read.  The object ids
+            are requested first, then the features are fetched in object
+            id ranges.
+            Inputs:
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               returnGeometry - true means a geometry will be returned,
+                                else just the attributes
+               page_size - number of features per request. Defaults to the
+                           maxRecordCount of the layer.
+            Output:
+               generator of lists of Feature objects
+        """
+        res = self.query(where=where, returnIDsOnly=True)
+        oids = res.get('objectIds') or []
+        oids.sort()
+        oid_field = res['objectIdFieldName']
+        if page_size is None:
+            page_size = self.maxRecordCount
+        for i in xrange(0, len(oids), page_size):
+            chunk = oids[i:i + page_size]
+            sql = "(%s) AND %s >= %s AND %s <= %s" % (where,
+                                                      oid_field, chunk[0],
+                                                      oid_field, chunk[-1])
+            yield self.query(where=sql,
+                             out_fields=out_fields,
+                             returnGeometry=returnGeometry)
+    #----------------------------------------------------------------------
+    def query_changes(self,
+                      checkpoint_file,
+                      where="1=1",
+                      out_fields="*",
+                      returnGeometry=True,
+                      track_deletes=True):
+        """ returns the features added or edited since the last call, using
+            the editor tracking edit date, and the deleted object ids when
+            the service has change tracking enabled.  The high-water mark
+            is kept per layer in the checkpoint file.  The first call
+            returns every feature.
+            Inputs:
+               checkpoint_file - path to the JSON file holding the
+                                 checkpoints
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               returnGeometry - true means a geometry will be returned,
+                                else just the attributes
+               track_deletes - if True, deleted object ids are requested
+                               with extractChanges
+            Output:
+               dictionary with the list of Feature objects (features), the
+               deleted object ids (deletes) and if it was a full download
+               (full)
+        """
+        from changetracking import ChangeTracker
+        tracker = ChangeTracker(layer=self,
+                                checkpoints=checkpoint_file,
+                                where=where,
+                                out_fields=out_fields,
+                                returnGeometry=returnGeometry,
+                                track_deletes=track_deletes)
+        return tracker.fetch()
+    #----------------------------------------------------------------------
+    def mirror(self, store, name=None, where="1=1", track_deletes=True,
+               batch_size=1000):
+        """ copies the layer into a local SQLite FeatureStore, so repeated
+            queries can run against local disk (see FeatureStore.query and
+            FeatureStore.layer).  The first call downloads every feature
+            in object id batches; later calls only download the features
+            edited since the previous call and remove the deleted ones.
+            Inputs:
+               store - FeatureStore or path of the database file
+               name - local layer name, default is layer_<id>
+               where - sql statement limiting the mirrored features
+               track_deletes - if True, deletes are read with
+                               extractChanges when the service supports it
+               batch_size - number of changes written per transaction
+            Output:
+               dictionary with the number of features written and deleted,
+               and whether it was a full download
+        """
+        from changetracking import ChangeTracker
+        from ..common.featurestore import FeatureStore
+        if isinstance(store, basestring):
+            store = FeatureStore(store)
+        if name is None:
+            name = "layer_%s" % self.id
+        spatialReference = None
+        if self.extent is not None:
+            spatialReference = self.extent.get('spatialReference', None)
+        store.create_layer(name=name,
+                           fields=self.fields or [],
+                           objectIdField=self.objectIdField,
+                           globalIdField=self.globalIdField,
+                           geometryType=self.geometryType,
+                           spatialReference=spatialReference,
+                           url=self._url)
+        checkpoints = store.checkpoints(name)
+        tracker = ChangeTracker(layer=self,
+                                checkpoints=checkpoints,
+                                where=where,
+                                out_fields="*",
+                                returnGeometry=True,
+                                track_deletes=track_deletes)
+        summary = {"written" : 0, "deleted" : 0}
+        features = []
+        deletes = []
+        truncate = None
+        for action, value in tracker.iter_changes():
+            if truncate is None:
+                # a full download replaces the local copy
+                truncate = tracker.full
+            if action == "upsert":
+                features.append(value)
+            else:
+                deletes.append(value)
+            if len(features) + len(deletes) >= batch_size:
+                res = store.write(name, features, deletes, truncate=truncate)
+                summary['written'] += res['written']
+                summary['deleted'] += res['deleted']
+                features = []
+                deletes = []
+                truncate = False
+        if truncate is None:
+            truncate = bool(tracker.full)
+        res = store.write(name, features, deletes, truncate=truncate,
+                          state=checkpoints.commit())
+        summary['written'] += res['written']
+        summary['deleted'] += res['deleted']
+        summary['full'] = bool(tracker.full)
+        return summary
+    #----------------------------------------------------------------------
     def query_related_records(self,
                               objectIds,
                               relationshipId,
@@ -812,6 +1229,53 @@ class FeatureLayer(abstract.BaseAGOLClass):
                            proxy_url=self._proxy_url)
         return res
     #----------------------------------------------------------------------
+    def related_records_index(self,
+                              objectIds,
+                              relationshipId,
+                              outFields="*",
+                              definitionExpression=None,
+                              returnGeometry=True,
+                              outWKID=None,
+                              gdbVersion=None,
+                              batch_size=500,
+                              max_workers=4,
+                              stream=False):
+        """
+           queries the related records of a large number of parent object
+           ids.  The ids are sent in concurrent batches and the
+           relatedRecordGroups are merged into a single index.
+           Inputs:
+              objectIds - list, iterable or comma separated string of
+                          parent object ids
+              relationshipId - The ID of the relationship to be queried.
+              outFields - the fields of the related records to return
+              definitionExpression - The definition expression to be
+                                     applied to the related table/layer.
+              returnGeometry - If true, the geometry of related features
+                               is returned.
+              outWKID - The spatial reference of the returned geometry.
+              gdbVersion - The geodatabase version to query.
+              batch_size - number of parent object ids per request
+              max_workers - number of concurrent requests
+              stream - if True, a generator of (parent object id, related
+                       records) tuples is returned instead of the index
+           Output:
+              dictionary of parent object id -> list of related records
+        """
+        from relationships import RelatedRecords
+        related = RelatedRecords(source=self,
+                                 relationshipId=relationshipId,
+                                 outFields=outFields,
+                                 definitionExpression=definitionExpression,
+                                 returnGeometry=returnGeometry,
+                                 outWKID=outWKID,
+                                 gdbVersion=gdbVersion,
+                                 batch_size=batch_size,
+                                 max_workers=max_workers)
+        if stream:
+            return related.iter_groups(objectIds)
+        return related.index(objectIds)
+    #----------------------------------------------------------------------
     def getHTMLPopup(self, oid):
         """
            The htmlPopup resource provides details about the HTML pop-up
@@ -841,65 +1305,145 @@ class FeatureLayer(abstract.BaseAGOLClass):
             yield l[i*newn:i*newn+newn]
         yield l[n*newn-newn:]
     #----------------------------------------------------------------------
+    def plan_query(self, where="1=1", out_fields="*", returnGeometry=True,
+                   geometryFilter=None, featureClass=False, explain=False,
+                   use_pbf=None, max_workers=4, outSR=None):
+        """ chooses the fastest way to download the features matching a
+            query (single query, pagination, object id batches, replica or
+            spatial tiles) from the capabilities of the layer and a count
+            of the features.
+            Inputs:
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               returnGeometry - true means the geometries are returned
+               geometryFilter - a GeometryFilter limiting the features
+               featureClass - True when the result is written to a
+                              feature class
+               explain - if True, a readable report of the estimates is
+                         returned instead of the planner
+               use_pbf - see query
+               max_workers - number of concurrent requests
+               outSR - wkid of the spatial reference of the geometries
+            Output:
+               QueryPlanner (call plan() or execute()), or a string when
+               explain is True
+        """
+        from queryplanner import QueryPlanner
+        planner = QueryPlanner(layer=self,
+                               where=where,
+                               out_fields=out_fields,
+                               returnGeometry=returnGeometry,
+                               geometryFilter=geometryFilter,
+                               use_pbf=use_pbf,
+                               max_workers=max_workers,
+                               outSR=outSR)
+        if explain:
+            return planner.explain(featureClass=featureClass)
+        return planner
+    #----------------------------------------------------------------------
+    def export(self, sink, where="1=1", out_fields="*", returnGeometry=True,
+               geometryFilter=None, outSR=None, use_pbf=None, max_workers=4):
+        """ streams the features matching a query into a sink without
+            arcpy.  Pages are written as they are downloaded, so memory
+            use does not grow with the number of features.
+            Inputs:
+               sink - a common.sinks sink, or an output path ending in
+                      .geojson, .geojsonl/.ndjson, .csv or .gpkg
+               where - the selection sql statement
+               out_fields - the attribute fields to return
+               returnGeometry - true means the geometries are written
+               geometryFilter - a GeometryFilter limiting the features
+               outSR - wkid of the output spatial reference, use 4326 for
+                       GeoJSON
+               use_pbf - see query
+               max_workers - number of concurrent requests
+            Output:
+               the number of features written
+        """
+        from ..common.sinks import sink_for_path
+        if isinstance(sink, basestring):
+            path = sink
+            sink = sink_for_path(path)
+            if sink is None:
+                raise ValueError("no sink for the output %s" % path)
+        planner = self.plan_query(where=where,
+                                  out_fields=out_fields,
+                                  returnGeometry=returnGeometry,
+                                  geometryFilter=geometryFilter,
+                                  use_pbf=use_pbf,
+                                  max_workers=max_workers,
+                                  outSR=outSR)
+        try:
+            for results in planner.iter_results():
+                sink.write_result(results)
+            if sink.count == 0:
+                sink.open(fields=self.fields,
+                          geometryType=self.geometryType if returnGeometry else None,
+                          spatialReference=(self.extent or {}).get('spatialReference', None))
+        finally:
+            sink.close()
+        return sink.count
+    #----------------------------------------------------------------------
     def get_local_copy(self, out_path, includeAttachments=False):
         """ exports the whole feature service to a feature class
             Input:
                out_path - path to where the data will be placed
-               includeAttachments - default False. If sync is not supported
-                                    then the paramter is ignored.
+               includeAttachments - default False. Attachments are only
+                                    exported by a replica.  If sync is not
+                                    supported then the paramter is ignored
+                                    and a warning is issued.
             Output:
                path to exported feature class or fgdb (as list)
         """
-        if self.hasAttachments and \
-           self.parentLayer.syncEnabled:
-            return self.parentLayer.createReplica(replicaName="fgdb_dump",
-                                                  layers="%s" % self.id,
-                                                  returnAsFeatureClass=True,
-                                                  returnAttachments=includeAttachments,
-                                                  out_path=out_path)[0]
-        elif self.hasAttachments == False and \
-             self.parentLayer.syncEnabled:
+        attachments = includeAttachments and self.hasAttachments
+        if attachments and not self.parentLayer.syncEnabled:
+            warnings.warn("includeAttachments is ignored, the service is " + \
+                          "not sync enabled and the attachments are only " + \
+                          "exported by createReplica")
+            attachments = False
+        planner = self.plan_query(featureClass=True)
+        if attachments:
+            strategy = "replica"
+        else:
+            strategy = planner.plan(featureClass=True)['strategy']
+        if strategy == "replica":
+            kwargs = {}
+            if self.hasAttachments:
+                kwargs['returnAttachments'] = includeAttachments
             return self.parentLayer.createReplica(replicaName="fgdb_dump",
                                                   layers="%s" % self.id,
                                                   returnAsFeatureClass=True,
-                                                  out_path=out_path)[0]
-        else:
-            result_features = []
-            res = self.query(returnIDsOnly=True)
-            OIDS = res['objectIds']
-            OIDS.sort()
-            OIDField = res['objectIdFieldName']
-            count = len(OIDS)
-            if count <= self.maxRecordCount:
-                bins = 1
-            else:
-                bins = count / self.maxRecordCount
-                v = count % self.maxRecordCount
-                if v > 0:
-                    bins += 1
-            chunks = self._chunks(OIDS, bins)
-            for chunk in chunks:
-                chunk.sort()
-                sql = "%s >= %s and %s <= %s" % (OIDField, chunk[0],
-                                                 OIDField, chunk[len(chunk) -1])
-                temp_base = "a" + uuid.uuid4().get_hex()[:6] + "a"
-                temp_fc = r"%s\%s" % (scratchGDB(), temp_base)
-                temp_fc = self.query(where=sql,
-                                     returnFeatureClass=True,
-                                     out_fc=temp_fc)
-                result_features.append(temp_fc)
-            return merge_feature_class(merges=result_features,
-                                       out_fc=out_path)
+                                                  out_path=out_path,
+                                                  **kwargs)[0]
+        result_features = []
+        for results in planner.iter_results(strategy=strategy):
+            if len(results.get('features', [])) == 0:
+                continue
+            temp = scratchFolder() + os.sep + uuid.uuid4().get_hex() + ".json"
+            with open(temp, 'wb') as writer:
+                writer.write(json.dumps(results))
+                writer.flush()
+            del writer
+            temp_base = "a" + uuid.uuid4().get_hex()[:6] + "a"
+            temp_fc = r"%s\%s" % (scratchGDB(), temp_base)
+            result_features.append(json_to_featureclass(json_file=temp,
+                                                        out_fc=temp_fc))
+            os.remove(temp)
+        return merge_feature_class(merges=result_features,
+                                   out_fc=out_path)
     #----------------------------------------------------------------------
     def updateFeature(self,
                       features,
                       gdbVersion=None,
-                      rollbackOnFailure=True):
+                      rollbackOnFailure=True,
+                      journal=None):
         """
            updates an existing feature in a feature service layer
            Input:
               feature - feature object(s) to get updated.  A single feature
                         or a list of feature objects can be passed
+              journal - (optional) journal.EditJournal the request is
+                        recorded in before it is sent
            Output:
               dictionary of result messages
         """
@@ -921,11 +1465,9 @@ class FeatureLayer(abstract.BaseAGOLClass):
             params['features'] = json.dumps(vals)
         else:
             return {'message' : "invalid inputs"}
-        updateURL = self._url + "/updateFeatures"
-        res = self._do_post(url=updateURL,
-                            param_dict=params, proxy_port=self._proxy_port,
-                            proxy_url=self._proxy_url)
-        return res
+        return self._post_edits(operation="updateFeatures",
+                                params=params,
+                                journal=journal)
     #----------------------------------------------------------------------
     def deleteFeatures(self,
                        objectIds="",
@@ -978,15 +1520,239 @@ class FeatureLayer(abstract.BaseAGOLClass):
            
         result = self._do_post(url=dURL, param_dict=params, proxy_port=self._proxy_port,
                                proxy_url=self._proxy_url)
-        
+        self._invalidate_cache()
+
+        return result
+    #----------------------------------------------------------------------
+    def bulkDelete(self,
+                   objectIds=None,
+                   where=None,
+                   geometryFilter=None,
+                   batch_size=None,
+                   max_workers=4,
+                   gdbVersion=None,
+                   rollbackOnFailure=True):
+        """
+           deletes features in concurrent batches of object ids, so large
+           deletes do not time out or send a single huge request
+           Inputs:
+              objectIds - list or comma separated string of object ids
+              where - where clause selecting the features to delete when
+                      no objectIds are given
+              geometryFilter - filters.GeometryFilter used with where
+              batch_size - object ids per request, default is the
+                           maxRecordCount of the layer
+              max_workers - number of concurrent requests
+              gdbVersion - geodatabase version to apply the edits to
+              rollbackOnFailure - delete all features of a batch or none
+           Output:
+              dictionary with the number of deleted features, the failed
+              object ids and a report of every batch
+        """
+        from bulkdelete import BulkDeleter
+        deleter = BulkDeleter(layer=self,
+                              batch_size=batch_size,
+                              max_workers=max_workers,
+                              gdbVersion=gdbVersion,
+                              rollbackOnFailure=rollbackOnFailure)
+        if objectIds is not None:
+            return deleter.delete(objectIds)
+        return deleter.delete_where(where=where or "1=1",
+                                    geometryFilter=geometryFilter)
+    #----------------------------------------------------------------------
+    def truncate(self,
+                 attachmentOnly=False,
+                 use_admin=True,
+                 batch_size=None,
+                 max_workers=4):
+        """
+           removes all features of the layer.  Hosted layers are emptied
+           with the truncate operation of the admin layer in a single
+           request.  Other layers, or when truncate is not allowed (ex: sync
+           enabled layers), have their features deleted with bulkDelete.
+           Inputs:
+              attachmentOnly - only remove the attachments (admin truncate
+                               only)
+              use_admin - try the admin truncate operation first
+              batch_size - object ids per deleteFeatures request
+              max_workers - number of concurrent deleteFeatures requests
+           Output:
+              the truncate response, or the bulkDelete summary
+        """
+        from ..hostedservice.service import AdminFeatureServiceLayer
+        res = None
+        if use_admin and \
+           isinstance(self._securityHandler, security.AGOLTokenSecurityHandler) and \
+           '/rest/services/' in self._url:
+            admin = AdminFeatureServiceLayer(url=self._url,
+                                             securityHandler=self._securityHandler,
+                                             proxy_url=self._proxy_url,
+                                             proxy_port=self._proxy_port)
+            res = admin.truncate(attachmentOnly=attachmentOnly)
+            self._invalidate_cache()
+            if isinstance(res, dict) and res.get('success', False):
+                return res
+        if attachmentOnly:
+            raise ValueError(res or "%s does not support truncate" % self._url)
+        return self.bulkDelete(where="1=1",
+                               batch_size=batch_size,
+                               max_workers=max_workers)
+    #----------------------------------------------------------------------
+    def calculate(self,
+                  calcExpression,
+                  where="1=1",
+                  sqlFormat="standard",
+                  gdbVersion=None,
+                  use_fallback=True,
+                  batch_size=None,
+                  max_workers=4):
+        """
+           updates the values of one or more fields for the features that
+           match the where clause.  When the layer supports calculate the
+           whole update runs in a single request on the server, otherwise
+           the features are read and updated in object id batches.
+           Inputs:
+              calcExpression - list of {"field" : <name>, "value" : <value>}
+                               and {"field" : <name>, "sqlExpression" :
+                               <expression>} dictionaries.  A single
+                               dictionary can be given.
+              where - a where clause selecting the features to update
+              sqlFormat - "standard" or "native" sql in the expressions
+              gdbVersion - geodatabase version to edit
+              use_fallback - if True, layers without the calculate
+                             operation are updated with queries and
+                             updateFeatures.  SQL expressions are then
+                             evaluated locally with SQLite.
+              batch_size - features per fallback batch, default is the
+                           maxRecordCount of the layer
+              max_workers - number of fallback batches run at once
+           Output:
+              dictionary with success and updatedFeatureCount
+        """
+        from calculate import FieldCalculator, normalize_expressions
+        expressions = normalize_expressions(calcExpression)
+        if not self.supportsCalculate:
+            if not use_fallback:
+                raise ValueError("%s does not support calculate" % self._url)
+            calculator = FieldCalculator(layer=self,
+                                         calcExpression=expressions,
+                                         where=where,
+                                         batch_size=batch_size,
+                                         max_workers=max_workers,
+                                         gdbVersion=gdbVersion)
+            return calculator.run()
+        params = {
+            "f" : "json",
+            "where" : where,
+            "calcExpression" : json.dumps(expressions, default=_date_handler),
+            "sqlFormat" : sqlFormat
+        }
+        if gdbVersion is not None:
+            params['gdbVersion'] = gdbVersion
+        if self._token is not None:
+            params['token'] = self._token
+        result = self._do_post(url=self._url + "/calculate",
+                               param_dict=params,
+                               proxy_port=self._proxy_port,
+                               proxy_url=self._proxy_url)
+        self._invalidate_cache()
+        if not isinstance(result, dict) or 'error' in result:
+            raise ValueError(result)
         return result
     #----------------------------------------------------------------------
+    def append(self,
+               sourceItemId,
+               uploadFormat,
+               fieldMappings=None,
+               upsert=False,
+               upsertMatchingField=None,
+               skipUpdates=False,
+               skipInserts=False,
+               useGlobalIds=False,
+               updateGeometry=True,
+               appendFields=None,
+               rollbackOnFailure=True,
+               sourceInfo=None,
+               asynchronous=True,
+               wait=True,
+               poll_interval=2,
+               max_poll_interval=30,
+               timeout=None):
+        """
+           loads the features of an uploaded item (hosted feature layers
+           only).  The features are read and written on the server, which
+           is much faster than sending them with addFeatures.
+           Inputs:
+              sourceItemId - id of the item holding the data
+              uploadFormat - format of the item: csv, geojson, shapefile,
+                             filegdb, featureCollection or excel
+              fieldMappings - list of {"name" : <layer field>,
+                              "sourceName" : <source field>} dictionaries
+              upsert - if True, features matching an existing feature on
+                       upsertMatchingField (or the global id) are updated
+                       instead of added
+              upsertMatchingField - field used to match features on upsert
+              skipUpdates - when upserting, do not update matched features
+              skipInserts - when upserting, do not add unmatched features
+              useGlobalIds - keep the global ids of the source
+              updateGeometry - when upserting, update the geometry too
+              appendFields - list of the layer fields to load
+              rollbackOnFailure - load all features or none of them
+              sourceInfo - publishParameters from Content.analyze, needed
+                           for csv and excel items
+              asynchronous - run the append as a job
+              wait - when asynchronous, poll the job until it completes
+              poll_interval - seconds before the first status check
+              max_poll_interval - longest wait between status checks
+              timeout - seconds to wait for the job, None waits until it
+                        ends
+           Output:
+              dictionary with the final job status
+        """
+        params = {
+            "f" : "json",
+            "sourceItemId" : sourceItemId,
+            "uploadFormat" : uploadFormat,
+            "upsert" : upsert,
+            "skipUpdates" : skipUpdates,
+            "skipInserts" : skipInserts,
+            "useGlobalIds" : useGlobalIds,
+            "updateGeometry" : updateGeometry,
+            "rollbackOnFailure" : rollbackOnFailure,
+            "async" : asynchronous
+        }
+        if fieldMappings is not None:
+            params['fieldMappings'] = json.dumps(fieldMappings)
+        if upsertMatchingField is not None:
+            params['upsertMatchingField'] = upsertMatchingField
+        if appendFields is not None:
+            params['appendFields'] = json.dumps(appendFields)
+        if sourceInfo is not None:
+            params['appendSourceInfo'] = json.dumps(sourceInfo)
+        if self._token is not None:
+            params['token'] = self._token
+        res = self._do_post(url=self._url + "/append",
+                            param_dict=params,
+                            proxy_port=self._proxy_port,
+                            proxy_url=self._proxy_url)
+        self._invalidate_cache()
+        if not isinstance(res, dict) or 'error' in res:
+            raise ValueError(res)
+        if asynchronous and wait and 'statusUrl' in res:
+            res = self.parentLayer._wait_for_job(statusUrl=res['statusUrl'],
+                                                 poll_interval=poll_interval,
+                                                 max_poll_interval=max_poll_interval,
+                                                 timeout=timeout)
+            self._invalidate_cache()
+        return res
+    #----------------------------------------------------------------------
     def applyEdits(self,
                    addFeatures=[],
                    updateFeatures=[],
                    deleteFeatures=None,
                    gdbVersion=None,
-                   rollbackOnFailure=True):
+                   rollbackOnFailure=True,
+                   journal=None):
         """
            This operation adds, updates, and deletes features to the
            associated feature layer or table in a single call.
@@ -1006,10 +1772,11 @@ class FeatureLayer(abstract.BaseAGOLClass):
                                   If true, the server will apply the edits
                                   only if all edits succeed. The default
                                   value is true.
+              journal - (optional) journal.EditJournal the request is
+                        recorded in before it is sent
            Output:
               dictionary of messages
         """
-        editURL = self._url + "/applyEdits"
         params = {"f": "json"
                   }
         if self._token is not None:
@@ -1025,12 +1792,14 @@ class FeatureLayer(abstract.BaseAGOLClass):
         if deleteFeatures is not None and \
            isinstance(deleteFeatures, str):
             params['deletes'] = deleteFeatures
-        return self._do_post(url=editURL, param_dict=params, proxy_port=self._proxy_port,
-                             proxy_url=self._proxy_url)
+        return self._post_edits(operation="applyEdits",
+                                params=params,
+                                journal=journal)
     #----------------------------------------------------------------------
     def addFeature(self, features,
                    gdbVersion=None,
-                   rollbackOnFailure=True):
+                   rollbackOnFailure=True,
+                   journal=None):
         """ Adds a single feature to the service
            Inputs:
               feature - list of common.Feature object or a single
@@ -1044,10 +1813,12 @@ class FeatureLayer(abstract.BaseAGOLClass):
                                   If true, the server will apply the edits
                                   only if all edits succeed. The default
                                   value is true.
+              journal - (optional) journal.EditJournal the request is
+                        recorded in before it is sent.  Give the features
+                        global ids to make a replay idempotent.
            Output:
               JSON message as dictionary
         """
-        url = self._url + "/addFeatures"
         params = {
             "f" : "json"
         }
@@ -1065,81 +1836,114 @@ class FeatureLayer(abstract.BaseAGOLClass):
                                             default=_date_handler)
         else:
             return None
-        return self._do_post(url=url,
-                             param_dict=params, proxy_port=self._proxy_port,
-                             proxy_url=self._proxy_url)
+        return self._post_edits(operation="addFeatures",
+                                params=params,
+                                journal=journal)
+    #----------------------------------------------------------------------
+    def _post_edits(self, operation, params, journal=None):
+        """ sends an edit request, recording it in the journal first """
+        url = self._url + "/" + operation
+        entry = None
+        if journal is not None:
+            entry = journal.begin(operation, params)
+        res = self._do_post(url=url,
+                            param_dict=params, proxy_port=self._proxy_port,
+                            proxy_url=self._proxy_url)
+        self._invalidate_cache()
+        if journal is not None and \
+           isinstance(res, dict) and not 'error' in res:
+            journal.commit(entry, res)
+        return res
     #----------------------------------------------------------------------
     def addFeatures(self, fc, attachmentTable=None,
                     nameField="ATT_NAME", blobField="DATA",
                     contentTypeField="CONTENT_TYPE",
-                    rel_object_field="REL_OBJECTID"):
+                    rel_object_field="REL_OBJECTID",
+                    max_workers=4,
+                    journal=None,
+                    preprocess=None):
         """ adds a feature to the feature service
            Inputs:
-              fc - string - path to feature class data to add.
+              fc - string - path to feature class data to add, or an
+                   iterable of common.Feature objects/esri json feature
+                   dictionaries.
               attachmentTable - string - (optional) path to attachment table
               nameField - string - (optional) name of file field in attachment table
               blobField - string - (optional) name field containing blob data
               contentTypeField - string - (optional) name of field containing content type
               rel_object_field - string - (optional) name of field with OID of feature class
+              max_workers - integer - (optional) number of concurrent
+                            addFeatures requests
+              journal - (optional) journal.EditJournal or path of a journal
+                        file that makes an interrupted load resumable.  Run
+                        the load again with the same input and journal to
+                        finish it.  Not used with an attachmentTable.
+              preprocess - (optional) callable applied to every esri json
+                           feature before it is sent, such as a
+                           common.generalize.GeometryPreprocessor
            Output:
               boolean, add results message as list of dictionaries
 
         """
+        from attachments import AttachmentUploader
+        from bulkload import BulkLoader
         messages = []
         if attachmentTable is None:
-            count = 0
-            bins = 1
-            uURL = self._url + "/addFeatures"
-            max_chunk = 250
-            js = json.loads(self._unicode_convert(
-                 featureclass_to_json(fc)))
-            if not 'features' in js:
-                return "No features in input data"
-            js = js['features']
-            if len(js) <= max_chunk:
-                bins = 1
+            if isinstance(fc, (list, tuple, types.GeneratorType)) or \
+               hasattr(fc, 'next'):
+                features = fc
             else:
-                bins = int(len(js)/max_chunk)
-                if len(js) % max_chunk > 0:
-                    bins += 1
-            chunks = self._chunks(l=js, n=bins)
-            for chunk in chunks:
-                params = {
-                    "f" : 'json',
-                    "features"  : json.dumps(chunk,
-                                             default=self._date_handler)
-                }
-                if not self._token is None:
-                    params['token'] = self._token
-                result = self._do_post(url=uURL, param_dict=params, proxy_port=self._proxy_port,
-                                       proxy_url=self._proxy_url)
-                messages.append(result)
-                del params
-                del result
+                features = iter_featureclass(fc)
+            loader = BulkLoader(layer=self, max_workers=max_workers,
+                                journal=journal, preprocess=preprocess)
+            results = []
+            for offsets, result in loader.iter_batches(features):
+                results.append((min(offsets or [-1]), result))
+            if len(results) == 0:
+                return "No features in input data"
+            results.sort(key=lambda r: r[0])
+            messages = [result for start, result in results]
             return True, messages
         else:
+            # parent features are added in batches, then the attachments
+            # are streamed from the table to the new object ids
             oid_field = get_OID_field(fc)
-            OIDs = get_records_with_attachments(attachment_table=attachmentTable)
-            fl = create_feature_layer(fc, "%s not in ( %s )" % (oid_field, ",".join(OIDs)))
-            val, msgs = self.addFeatures(fl)
-            messages.append(msgs)
-            del fl
-            for oid in OIDs:
-                fl = create_feature_layer(fc, "%s = %s" % (oid_field, oid), name="layer%s" % oid)
-                val, msgs = self.addFeatures(fl)
-                for result in msgs[0]['addResults']:
-                    oid_fs = result['objectId']
-                    sends = get_attachment_data(attachmentTable, sql="%s = %s" % (rel_object_field, oid))
-                    for s in sends:
-                        messages.append(self.addAttachment(oid_fs, s['blob']))
-                        del s
-                    del sends
-                    del result
-                messages.append(msgs)
-                del fl
-                del oid
-            del OIDs
+            old_oids = {}
+            oid_map = {}
+            loader = BulkLoader(layer=self, max_workers=max_workers,
+                                preprocess=preprocess)
+            features = self._iter_with_oids(fc, oid_field, old_oids)
+            for offsets, result in loader.iter_batches(features):
+                messages.append(result)
+                for index, res in zip(offsets, result.get('addResults', [])):
+                    if res.get('success', False):
+                        oid_map[old_oids.get(index)] = res['objectId']
+                for index in offsets:
+                    old_oids.pop(index, None)
+            uploader = AttachmentUploader(layer=self, max_workers=max_workers)
+            attachments = self._iter_attachments(attachmentTable, oid_map,
+                                                 nameField=nameField,
+                                                 blobField=blobField,
+                                                 contentTypeField=contentTypeField,
+                                                 rel_object_field=rel_object_field)
+            for oid, name, res in uploader.iter_upload(attachments):
+                messages.append(res)
             return messages
+    #----------------------------------------------------------------------
+    def _iter_with_oids(self, fc, oid_field, old_oids):
+        """ yields the features of fc, recording their object ids by
+            input index in old_oids """
+        for index, feature in enumerate(iter_featureclass(fc)):
+            old_oids[index] = feature['attributes'].pop(oid_field, None)
+            yield feature
+    #----------------------------------------------------------------------
+    def _iter_attachments(self, attachmentTable, oid_map, **kwargs):
+        """ yields (new object id, file name, data) for the rows of an
+            attachment table whose parent feature was added """
+        for row in iter_attachment_data(attachmentTable, **kwargs):
+            oid = oid_map.get(row['rel_oid'], None)
+            if oid is not None:
+                yield oid, row['name'], FileData(row['data'])
 
 
 ########################################################################
@@ -0,0 +1,332 @@
+"""
+
+.. module:: layersync
+   :platform: Windows, Linux
+   :synopsis: Mirrors a local dataset into a feature layer by sending
+              only the rows that were added, changed or removed.
+
+.. moduleauthor:: Esri
+
+
+"""
+import json
+import hashlib
+import datetime
+from ..common.general import _date_handler
+from ..common.parallel import imap_bounded, retry_call
+from bulkload import as_feature_dict
+#----------------------------------------------------------------------
+def _normalize(value):
+    """ converts a value to a canonical form so local and service values
+        compare equal """
+    if isinstance(value, bool) or value is None:
+        return value
+    elif isinstance(value, datetime.datetime):
+        return repr(float(_date_handler(value)))
+    elif isinstance(value, (int, long, float)):
+        return repr(float(value))
+    elif isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+#----------------------------------------------------------------------
+def _round_geometry(value, precision):
+    """ rounds all coordinates of a geometry and drops the spatial
+        reference """
+    if isinstance(value, dict):
+        return dict([(k, _round_geometry(v, precision)) \
+                     for k, v in value.iteritems() \
+                     if k not in ['spatialReference', 'hasZ', 'hasM']])
+    elif isinstance(value, list):
+        return [_round_geometry(v, precision) for v in value]
+    elif isinstance(value, (int, long, float)) and \
+         not isinstance(value, bool):
+        return round(float(value), precision)
+    return value
+########################################################################
+class LayerSync(object):
+    """
+       Synchronizes a feature layer with a local source of features.
+
+       The rows of the layer are matched to the local rows by a key field
+       (or the global id).  A digest of the compared attributes and the
+       geometry of every row is used to find the changed rows, and only
+       the adds, updates and deletes are sent through batched, concurrent
+       applyEdits requests.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer to synchronize
+          key_field - name of the field that uniquely identifies a row in
+                      both the local data and the layer.  Local rows must
+                      have a unique, non NULL key.  Layer rows sharing a
+                      key with an earlier row, or without a key, are
+                      treated as stale copies.
+          use_global_ids - match rows by the layer's global id field
+                           instead of key_field.  New rows keep their
+                           global ids.
+          compare_fields - list of fields compared to detect changes.  The
+                           default is every editable field of the layer.
+          compare_geometry - if True, geometry changes are detected
+          geometry_precision - number of decimals coordinates are rounded
+                               to before they are compared
+          where - sql statement limiting the layer rows taking part
+          delete_missing - if True, layer rows without a local match are
+                           deleted
+          batch_size - number of edits per applyEdits request
+          max_workers - number of concurrent applyEdits requests
+          retries - number of times a failed batch is re-sent
+          backoff - seconds to wait before the first retry
+          gdbVersion - geodatabase version to apply the edits to
+          rollbackOnFailure - if True, a batch is only applied when all of
+                              its edits succeed
+    """
+    _layer = None
+    _key_field = None
+    _use_global_ids = None
+    _compare_fields = None
+    _compare_geometry = None
+    _geometry_precision = None
+    _where = None
+    _delete_missing = None
+    _batch_size = None
+    _max_workers = None
+    _retries = None
+    _backoff = None
+    _gdbVersion = None
+    _rollbackOnFailure = None
+    _oid_field = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer,
+                 key_field=None,
+                 use_global_ids=False,
+                 compare_fields=None,
+                 compare_geometry=True,
+                 geometry_precision=6,
+                 where="1=1",
+                 delete_missing=True,
+                 batch_size=500,
+                 max_workers=4,
+                 retries=3,
+                 backoff=2.0,
+                 gdbVersion=None,
+                 rollbackOnFailure=True):
+        """Constructor"""
+        if use_global_ids:
+            key_field = layer.globalIdField
+        if key_field is None:
+            raise AttributeError("key_field is required when " + \
+                                 "use_global_ids is False")
+        self._layer = layer
+        self._key_field = key_field
+        self._use_global_ids = use_global_ids
+        self._compare_fields = compare_fields
+        self._compare_geometry = compare_geometry
+        self._geometry_precision = geometry_precision
+        self._where = where
+        self._delete_missing = delete_missing
+        self._batch_size = batch_size
+        self._max_workers = max_workers
+        self._retries = retries
+        self._backoff = backoff
+        self._gdbVersion = gdbVersion
+        self._rollbackOnFailure = rollbackOnFailure
+    #----------------------------------------------------------------------
+    @property
+    def compareFields(self):
+        """ returns the fields compared to detect changed rows """
+        if self._compare_fields is None:
+            skip = ['esriFieldTypeOID', 'esriFieldTypeGlobalID',
+                    'esriFieldTypeGeometry']
+            self._compare_fields = [fld['name'] for fld in self._layer.fields \
+                                    if fld.get('editable', True) and \
+                                    fld['type'] not in skip]
+        return self._compare_fields
+    #----------------------------------------------------------------------
+    def _key(self, attributes):
+        """ returns the normalized key of a row """
+        value = _normalize(attributes.get(self._key_field, None))
+        if self._use_global_ids and value is not None:
+            value = value.upper().strip('{}')
+        return value
+    #----------------------------------------------------------------------
+    def _digest(self, feature):
+        """ returns the digest of the compared attributes and geometry """
+        attributes = feature['attributes']
+        values = [_normalize(attributes.get(name, None)) \
+                  for name in self.compareFields]
+        geometry = None
+        if self._compare_geometry:
+            geometry = _round_geometry(feature.get('geometry', None),
+                                       self._geometry_precision)
+        return hashlib.md5(json.dumps([values, geometry],
+                                      sort_keys=True)).digest()
+    #----------------------------------------------------------------------
+    def _remote_index(self):
+        """ builds a key -> list of (object id, key value, digest) index
+            of the layer, the key value is the global id as the layer
+            stores it.  Rows without a key are listed under None. """
+        self._oid_field = self._layer.objectIdField
+        out_fields = [self._oid_field, self._key_field]
+        out_fields += [name for name in self.compareFields \
+                       if name not in out_fields]
+        index = {}
+        for page in self._layer.query_pages(where=self._where,
+                                            out_fields=",".join(out_fields),
+                                            returnGeometry=self._compare_geometry):
+            for feature in page:
+                feat = feature.asDictionary
+                attributes = feat['attributes']
+                index.setdefault(self._key(attributes), []).append(
+                    (attributes[self._oid_field],
+                     attributes.get(self._key_field, None),
+                     self._digest(feat)))
+        return index
+    #----------------------------------------------------------------------
+    def _local_features(self, features, fields):
+        """ returns the local features as esri json dictionaries, raises
+            when a key is NULL or used more than once """
+        local = []
+        seen = set()
+        for feature in features:
+            feat = as_feature_dict(feature, fields)
+            key = self._key(feat['attributes'])
+            if key is None:
+                raise ValueError("local row without a value in %s: %s" % \
+                                 (self._key_field, feat['attributes']))
+            elif key in seen:
+                raise ValueError("duplicate local value in %s: %s" % \
+                                 (self._key_field, key))
+            seen.add(key)
+            local.append(feat)
+        return local
+    #----------------------------------------------------------------------
+    def diff(self, features, fields=None):
+        """
+           compares the local features with the layer
+           Inputs:
+              features - iterable of common.Feature objects, esri json
+                         feature dictionaries or rows
+              fields - field names of the rows when rows are given
+           Output:
+              generator of ("add", feature), ("update", feature) and
+              ("delete", object id) tuples.  Updated features carry the
+              object id of the matching layer row.  With use_global_ids,
+              updates carry and deletes give the global id of the layer
+              row instead.  Layer rows sharing the key of a local row with
+              an earlier layer row are deleted.  The local features are
+              checked before any edit is yielded and a ValueError is
+              raised when a local key is NULL or not unique.
+        """
+        local = self._local_features(features, fields)
+        index = self._remote_index()
+        for feat in local:
+            matches = index.pop(self._key(feat['attributes']), None)
+            if matches is None:
+                yield "add", feat
+                continue
+            # the layer holds stale copies of this row
+            for extra in matches[1:]:
+                yield "delete", self._delete_value(extra)
+            match = matches[0]
+            if match[2] != self._digest(feat):
+                feat = dict(feat)
+                feat['attributes'] = dict(feat['attributes'])
+                if self._use_global_ids:
+                    # applyEdits matches the updates by global id
+                    feat['attributes'].pop(self._oid_field, None)
+                    feat['attributes'][self._key_field] = match[1]
+                else:
+                    feat['attributes'][self._oid_field] = match[0]
+                yield "update", feat
+        if self._delete_missing:
+            for key, matches in index.iteritems():
+                for match in matches:
+                    yield "delete", self._delete_value(match)
+    #----------------------------------------------------------------------
+    def _delete_value(self, match):
+        """ returns the id applyEdits deletes a layer row by """
+        if self._use_global_ids:
+            return match[1]
+        return match[0]
+    #----------------------------------------------------------------------
+    def _batches(self, edits):
+        """ groups edits into applyEdits payloads """
+        batch = {"adds" : [], "updates" : [], "deletes" : []}
+        count = 0
+        for action, value in edits:
+            batch[action + "s"].append(value)
+            count += 1
+            if count >= self._batch_size:
+                yield batch
+                batch = {"adds" : [], "updates" : [], "deletes" : []}
+                count = 0
+        if count > 0:
+            yield batch
+    #----------------------------------------------------------------------
+    def _post(self, batch):
+        """ sends a batch of edits, raises so the batch is retried """
+        params = {
+            "f" : "json",
+            "rollbackOnFailure" : self._rollbackOnFailure
+        }
+        if self._layer._token is not None:
+            params['token'] = self._layer._token
+        if self._gdbVersion is not None:
+            params['gdbVersion'] = self._gdbVersion
+        if self._use_global_ids:
+            params['useGlobalIds'] = True
+        if len(batch['adds']) > 0:
+            params['adds'] = json.dumps(batch['adds'], default=_date_handler)
+        if len(batch['updates']) > 0:
+            params['updates'] = json.dumps(batch['updates'],
+                                           default=_date_handler)
+        if len(batch['deletes']) > 0:
+            if self._use_global_ids:
+                params['deletes'] = json.dumps(batch['deletes'])
+            else:
+                params['deletes'] = ",".join(["%s" % oid for oid in batch['deletes']])
+        res = self._layer._do_post(url=self._layer.url + "/applyEdits",
+                                   param_dict=params,
+                                   proxy_url=self._layer._proxy_url,
+                                   proxy_port=self._layer._proxy_port)
+        self._layer._invalidate_cache()
+        if not isinstance(res, dict) or 'error' in res:
+            raise ValueError(res)
+        return res
+    #----------------------------------------------------------------------
+    def _send(self, batch):
+        """ sends a batch with retries """
+        return retry_call(self._post, args=(batch,),
+                          retries=self._retries,
+                          backoff=self._backoff)
+    #----------------------------------------------------------------------
+    def apply(self, features, fields=None):
+        """
+           synchronizes the layer with the local features
+           Inputs:
+              features - iterable of common.Feature objects, esri json
+                         feature dictionaries or rows
+              fields - field names of the rows when rows are given
+           Output:
+              dictionary with the number of successful adds, updates and
+              deletes, the number of failed edits and the error messages
+        """
+        summary = {"adds" : 0, "updates" : 0, "deletes" : 0,
+                   "failed" : 0, "errors" : []}
+        keys = [("adds", "addResults"),
+                ("updates", "updateResults"),
+                ("deletes", "deleteResults")]
+        for batch, res, err in imap_bounded(self._send,
+                                            self._batches(self.diff(features, fields)),
+                                            max_workers=self._max_workers):
+            if err is not None:
+                summary['failed'] += sum([len(batch[k]) for k, r in keys])
+                summary['errors'].append(str(err))
+                continue
+            for key, result_key in keys:
+                for result in res.get(result_key, []):
+                    if result.get('success', False):
+                        summary[key] += 1
+                    else:
+                        summary['failed'] += 1
+                        summary['errors'].append(result.get('error', result))
+        return summary
@@ -0,0 +1,391 @@
+"""
+
+.. module:: queryplanner
+   :platform: Windows, Linux
+   :synopsis: Chooses how the features of a layer are downloaded.
+
+.. moduleauthor:: Esri
+
+
+"""
+import json
+import math
+import hashlib
+from ..common import filters
+from ..common.geometry import SpatialReference
+from ..common.general import Feature
+from ..common.quantization import dequantize
+from ..common.parallel import imap_bounded, retry_call
+# rough costs used to compare the strategies, in seconds
+_REQUEST_COST = 0.25
+_FEATURE_COST = {"json" : 0.0004, "pbf" : 0.00015}
+_OFFSET_COST = 0.00001
+_REPLICA_COST = 10.0
+_REPLICA_FEATURE_COST = 0.00005
+_FEATURE_CLASS_COST = 0.0002
+#----------------------------------------------------------------------
+def _feature_id(feature, oid_field):
+    """ returns the object id of a feature, or a digest of the feature
+        when it has no object id """
+    attributes = feature.get('attributes', None) or {}
+    if oid_field is not None and attributes.get(oid_field, None) is not None:
+        return attributes[oid_field]
+    return hashlib.md5(json.dumps(feature, sort_keys=True)).digest()
+########################################################################
+class QueryPlanner(object):
+    """
+       Picks the fastest way to download the features of a layer that
+       match a query, from what the service supports:
+
+          single - one query, when the count fits in maxRecordCount
+          pagination - resultOffset/resultRecordCount pages ordered by a
+                       unique field, when
+                       advancedQueryCapabilities.supportsPagination
+          objectIds - the object ids are read first, then fetched in
+                      batches of maxRecordCount
+          replica - createReplica of the layer into a file geodatabase,
+                    when the service is syncEnabled and a feature class is
+                    wanted
+          tiles - the layer extent is split into tiles small enough to be
+                  queried at once, for layers without object ids
+
+       The count of matching features is probed once, and the cost of each
+       supported strategy is estimated from the number of requests and
+       features, and the response format (pbf when the layer's
+       supportedQueryFormats lists it).  explain() reports the estimates
+       without downloading anything.
+
+       Inputs:
+          layer - agol.FeatureLayer or agol.TableLayer to download
+          where - the selection sql statement
+          out_fields - the attribute fields to return
+          returnGeometry - true means the geometries are returned
+          geometryFilter - a GeometryFilter limiting the features
+          use_pbf - see FeatureLayer.query
+          max_workers - number of concurrent requests for the paged
+                        strategies
+          outSR - wkid of the spatial reference of the returned geometries
+    """
+    _layer = None
+    _where = None
+    _out_fields = None
+    _returnGeometry = None
+    _geometryFilter = None
+    _use_pbf = None
+    _max_workers = None
+    _outSR = None
+    _count = None
+    _plan = None
+    #----------------------------------------------------------------------
+    def __init__(self, layer, where="1=1", out_fields="*",
+                 returnGeometry=True, geometryFilter=None, use_pbf=None,
+                 max_workers=4, outSR=None):
+        """Constructor"""
+        self._layer = layer
+        self._where = where
+        self._out_fields = out_fields
+        self._returnGeometry = returnGeometry
+        self._geometryFilter = geometryFilter
+        self._use_pbf = use_pbf
+        self._max_workers = max_workers
+        self._outSR = outSR
+    #----------------------------------------------------------------------
+    @property
+    def count(self):
+        """ returns the number of features matching the query """
+        if self._count is None:
+            res = self._layer.query(where=self._where,
+                                    geometryFilter=self._geometryFilter,
+                                    returnCountOnly=True)
+            self._count = res.get('count', 0)
+        return self._count
+    #----------------------------------------------------------------------
+    def _capabilities(self):
+        """ reads the layer and service properties the planner uses """
+        layer = self._layer
+        advanced = layer.advancedQueryCapabilities or {}
+        sync = False
+        try:
+            sync = layer.parentLayer is not None and \
+                 bool(layer.parentLayer.syncEnabled)
+        except Exception:
+            sync = False
+        return {
+            "maxRecordCount" : layer.maxRecordCount,
+            "supportsPagination" : bool(advanced.get('supportsPagination',
+                                                     False)),
+            "pbf" : bool(layer._pbf_enabled(self._use_pbf)),
+            "syncEnabled" : sync,
+            "objectIdField" : layer.objectIdField,
+            "sortField" : self._sort_field(),
+            "extent" : layer.extent
+        }
+    #----------------------------------------------------------------------
+    def _sort_field(self):
+        """ returns a field with unique values to order pages by: the
+            object id field, else the OID or GlobalID field, or None """
+        if self._layer.objectIdField is not None:
+            return self._layer.objectIdField
+        fields = self._layer.fields or []
+        for ftype in ("esriFieldTypeOID", "esriFieldTypeGlobalID"):
+            for field in fields:
+                if field.get('type', None) == ftype:
+                    return field['name']
+        return None
+    #----------------------------------------------------------------------
+    def candidates(self, featureClass=False):
+        """
+           estimates the cost of every strategy the layer supports
+           Inputs:
+              featureClass - True when the features are written to a
+                             feature class, which makes a replica usable
+           Output:
+              list of dictionaries (strategy, requests, estimatedSeconds),
+              cheapest first
+        """
+        caps = self._capabilities()
+        count = self.count
+        page = max(1, caps['maxRecordCount'])
+        pages = int(math.ceil(float(count) / page))
+        per_feature = _FEATURE_COST["pbf" if caps['pbf'] else "json"]
+        transfer = count * per_feature
+        if featureClass:
+            # pages are written to feature classes and merged afterwards
+            transfer += count * _FEATURE_CLASS_COST
+        workers = float(max(1, min(self._max_workers, pages)))
+        options = []
+        if count <= page:
+            options.append(("single", 1, _REQUEST_COST + transfer))
+        if caps['supportsPagination'] and caps['sortField'] is not None:
+            # the server skips the offset rows again for every page
+            skipped = page * pages * (pages - 1) / 2.0
+            options.append(("pagination", pages,
+                            pages * _REQUEST_COST / workers + transfer + \
+                            skipped * _OFFSET_COST / workers))
+        if caps['objectIdField'] is not None:
+            # the object id request comes before the pages
+            options.append(("objectIds", pages + 1,
+                            _REQUEST_COST + pages * _REQUEST_COST / workers + \
+                            transfer))
+        if featureClass and caps['syncEnabled'] and \
+           self._geometryFilter is None:
+            options.append(("replica", 3,
+                            _REPLICA_COST + count * _REPLICA_FEATURE_COST))
+        if caps['objectIdField'] is None and \
+           not (caps['supportsPagination'] and caps['sortField'] is not None) and \
+           caps['extent'] is not None and \
+           self._geometryFilter is None:
+            # one count request per tile before the tiles are fetched
+            tiles = 4 ** int(math.ceil(math.log(max(pages, 1), 4)))
+            options.append(("tiles", tiles * 2,
+                            tiles * _REQUEST_COST + \
+                            tiles * _REQUEST_COST / workers + transfer))
+        results = []
+        for strategy, requests, seconds in options:
+            results.append({"strategy" : strategy,
+                            "requests" : requests,
+                            "estimatedSeconds" : round(seconds, 3)})
+        results.sort(key=lambda c: c['estimatedSeconds'])
+        return results
+    #----------------------------------------------------------------------
+    def plan(self, featureClass=False):
+        """
+           returns the cheapest strategy
+           Inputs:
+              featureClass - True when the features are written to a
+                             feature class
+           Output:
+              dictionary with the strategy, the feature count, page size,
+              response format, number of requests and estimated seconds,
+              and the other candidates
+        """
+        caps = self._capabilities()
+        options = self.candidates(featureClass=featureClass)
+        if len(options) == 0:
+            raise ValueError("the layer supports no strategy to download " + \
+                             "%s features" % self.count)
+        best = dict(options[0])
+        best['count'] = self.count
+        best['pageSize'] = caps['maxRecordCount']
+        best['format'] = "pbf" if caps['pbf'] else "json"
+        best['candidates'] = options
+        self._plan = best
+        return best
+    #----------------------------------------------------------------------
+    def explain(self, featureClass=False):
+        """ returns a readable description of the plan """
+        plan = self.plan(featureClass=featureClass)
+        lines = ["%s features, page size %s, format %s" % (plan['count'],
+                                                           plan['pageSize'],
+                                                           plan['format'])]
+        for option in plan['candidates']:
+            lines.append("%s %-10s %6s requests  ~%ss" % \
+                         ("*" if option['strategy'] == plan['strategy'] else " ",
+                          option['strategy'],
+                          option['requests'],
+                          option['estimatedSeconds']))
+        return "\n".join(lines)
+    #----------------------------------------------------------------------
+    def _params(self):
+        """ returns the base query parameters """
+        params = {"f" : "json",
+                  "where" : self._where,
+                  "outFields" : self._out_fields,
+                  "returnGeometry" : self._returnGeometry}
+        if self._layer._token is not None:
+            params['token'] = self._layer._token
+        if self._geometryFilter is not None and \
+           isinstance(self._geometryFilter, filters.GeometryFilter):
+            gf = self._geometryFilter.filter
+            params['geometry'] = gf['geometry']
+            params['geometryType'] = gf['geometryType']
+            params['spatialRelationship'] = gf['spatialRel']
+            params['inSR'] = gf['inSR']
+        if self._outSR is not None and self._returnGeometry:
+            params['outSR'] = json.dumps(SpatialReference(self._outSR).asDictionary)
+        return params
+    #----------------------------------------------------------------------
+    def _fetch(self, params):
+        """ runs one query and returns the raw features """
+        layer = self._layer
+        url = layer.url + "/query"
+        if layer._pbf_enabled(self._use_pbf):
+            results = layer._query_pbf(url, params)
+        else:
+            results = layer._do_post(url=url, param_dict=params,
+                                     proxy_url=layer._proxy_url,
+                                     proxy_port=layer._proxy_port)
+        if not isinstance(results, dict) or 'error' in results:
+            raise ValueError(results)
+        dequantize(results)
+        return results
+    #----------------------------------------------------------------------
+    def _run(self, params):
+        """ fetches one page, with retries """
+        return retry_call(self._fetch, args=(params,))
+    #----------------------------------------------------------------------
+    def _pages(self, strategy):
+        """ yields the query parameters of every page of a strategy """
+        page = self._layer.maxRecordCount
+        if strategy == "single":
+            yield self._params()
+        elif strategy == "pagination":
+            sort_field = self._sort_field()
+            if sort_field is None:
+                raise ValueError("pagination needs a field with unique " + \
+                                 "values to order the pages by")
+            for offset in xrange(0, self.count, page):
+                params = self._params()
+                params['resultOffset'] = offset
+                params['resultRecordCount'] = page
+                params['orderByFields'] = sort_field
+                yield params
+        elif strategy == "objectIds":
+            params = self._params()
+            params['returnIdsOnly'] = True
+            params['returnGeometry'] = False
+            res = self._layer._do_post(url=self._layer.url + "/query",
+                                       param_dict=params,
+                                       proxy_url=self._layer._proxy_url,
+                                       proxy_port=self._layer._proxy_port)
+            if 'error' in res:
+                raise ValueError(res)
+            oids = sorted(res.get('objectIds') or [])
+            for i in xrange(0, len(oids), page):
+                params = self._params()
+                params['where'] = "1=1"
+                params['objectIds'] = ",".join(["%s" % oid for oid in oids[i:i + page]])
+                yield params
+        elif strategy == "tiles":
+            for envelope in self._tiles(self._layer.extent, page):
+                params = self._params()
+                params['geometry'] = json.dumps(envelope)
+                params['geometryType'] = "esriGeometryEnvelope"
+                params['spatialRel'] = "esriSpatialRelEnvelopeIntersects"
+                params['inSR'] = json.dumps(envelope['spatialReference'])
+                yield params
+        else:
+            raise ValueError("unknown strategy %s" % strategy)
+    #----------------------------------------------------------------------
+    def _tiles(self, extent, page, depth=0):
+        """ splits the extent in quarters until each holds a page """
+        params = self._params()
+        params['returnCountOnly'] = True
+        params['geometry'] = json.dumps(extent)
+        params['geometryType'] = "esriGeometryEnvelope"
+        params['spatialRel'] = "esriSpatialRelEnvelopeIntersects"
+        params['inSR'] = json.dumps(extent.get('spatialReference', {}))
+        params['f'] = "json"
+        res = self._layer._do_post(url=self._layer.url + "/query",
+                                   param_dict=params,
+                                   proxy_url=self._layer._proxy_url,
+                                   proxy_port=self._layer._proxy_port)
+        if 'error' in res:
+            raise ValueError(res)
+        count = res.get('count', 0)
+        if count == 0:
+            return
+        if count <= page or depth >= 12:
+            yield extent
+            return
+        xmid = (extent['xmin'] + extent['xmax']) / 2.0
+        ymid = (extent['ymin'] + extent['ymax']) / 2.0
+        for xmin, ymin, xmax, ymax in [(extent['xmin'], extent['ymin'], xmid, ymid),
+                                       (xmid, extent['ymin'], extent['xmax'], ymid),
+                                       (extent['xmin'], ymid, xmid, extent['ymax']),
+                                       (xmid, ymid, extent['xmax'], extent['ymax'])]:
+            quarter = {"xmin" : xmin, "ymin" : ymin,
+                       "xmax" : xmax, "ymax" : ymax,
+                       "spatialReference" : extent.get('spatialReference', {})}
+            for tile in self._tiles(quarter, page, depth + 1):
+                yield tile
+    #----------------------------------------------------------------------
+    def iter_results(self, strategy=None):
+        """
+           downloads the features with the planned (or given) strategy
+           Inputs:
+              strategy - name of the strategy to force, default is the
+                         cheapest one
+           Output:
+              generator of query responses (dictionaries), one per request
+        """
+        if strategy is None:
+            strategy = (self._plan or self.plan())['strategy']
+        if strategy == "replica":
+            raise ValueError("the replica strategy writes a feature " + \
+                             "class, use FeatureLayer.get_local_copy")
+        seen = None
+        oid_field = None
+        if strategy == "tiles":
+            # features crossing tile edges are returned more than once
+            seen = set()
+            for field in self._layer.fields or []:
+                if field.get('type', None) == "esriFieldTypeOID":
+                    oid_field = field['name']
+        for params, results, err in imap_bounded(self._run,
+                                                 self._pages(strategy),
+                                                 max_workers=self._max_workers):
+            if err is not None:
+                raise err
+            if seen is not None:
+                oid_field = results.get('objectIdFieldName', None) or oid_field
+                features = []
+                for res in results.get('features', []):
+                    key = _feature_id(res, oid_field)
+                    if key not in seen:
+                        seen.add(key)
+                        features.append(res)
+                results['features'] = features
+            yield results
+    #----------------------------------------------------------------------
+    def execute(self, strategy=None):
+        """
+           downloads the features with the planned (or given) strategy
+           Inputs:
+              strategy - name of the strategy to force, default is the
+                         cheapest one
+           Output:
+              generator of lists of Feature objects, one per request
+        """
+        for results in self.iter_results(strategy=strategy):
+            yield [Feature(res) for res in results.get('features', [])]
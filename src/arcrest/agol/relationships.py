@@ -0,0 +1,181 @@
+"""
+
+.. module:: relationships
+   :platform: Windows, Linux
+   :synopsis: Traverses relationships for large numbers of parent
+              features.
+
+.. moduleauthor:: Esri
+
+
+"""
+import json
+from ..common.geometry import SpatialReference
+from ..common.parallel import imap_bounded, retry_call
+########################################################################
+class RelatedRecords(object):
+    """
+       Runs queryRelatedRecords for any number of parent object ids.
+
+       The parents are split into batches that are posted concurrently, so
+       neither the url length nor the server's transfer limit is hit.  A
+       batch whose response exceeds the transfer limit is split in half and
+       queried again, and the related records of a single parent that
+       exceed it are read page by page.  The relatedRecordGroups of all batches are merged
+       into one parent -> related records index, or streamed group by group.
+
+       Inputs:
+          source - agol.FeatureLayer, agol.TableLayer or agol.FeatureService
+                   the relationship is queried on
+          relationshipId - the id of the relationship
+          outFields - the fields of the related records to return
+          definitionExpression - sql statement applied to the related
+                                 table/layer
+          returnGeometry - if True, the geometry of related features is
+                           returned
+          outWKID - the spatial reference of the returned geometry
+          gdbVersion - the geodatabase version to query
+          batch_size - number of parent object ids per request
+          max_workers - number of concurrent requests
+          retries - number of times a failed batch is re-sent
+          backoff - seconds to wait before the first retry
+    """
+    _source = None
+    _params = None
+    _batch_size = None
+    _max_workers = None
+    _retries = None
+    _backoff = None
+    #----------------------------------------------------------------------
+    def __init__(self, source, relationshipId,
+                 outFields="*",
+                 definitionExpression=None,
+                 returnGeometry=True,
+                 outWKID=None,
+                 gdbVersion=None,
+                 batch_size=500,
+                 max_workers=4,
+                 retries=3,
+                 backoff=2.0):
+        """Constructor"""
+        self._source = source
+        self._batch_size = batch_size
+        self._max_workers = max_workers
+        self._retries = retries
+        self._backoff = backoff
+        self._params = {
+            "f" : "json",
+            "relationshipId" : relationshipId,
+            "outFields" : outFields,
+            "returnGeometry" : returnGeometry
+        }
+        if definitionExpression is not None:
+            self._params['definitionExpression'] = definitionExpression
+        if outWKID is not None:
+            self._params['outSR'] = json.dumps(SpatialReference(outWKID).asDictionary)
+        if gdbVersion is not None:
+            self._params['gdbVersion'] = gdbVersion
+    #----------------------------------------------------------------------
+    def _batches(self, objectIds):
+        """ groups the parent object ids into batches """
+        if isinstance(objectIds, basestring):
+            objectIds = [oid.strip() for oid in objectIds.split(",") \
+                         if oid.strip() != ""]
+        batch = []
+        for oid in objectIds:
+            batch.append(oid)
+            if len(batch) >= self._batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+    #----------------------------------------------------------------------
+    def _post(self, oids, resultOffset=None):
+        """ queries the related records of one batch """
+        params = dict(self._params)
+        params['objectIds'] = ",".join(["%s" % oid for oid in oids])
+        if resultOffset is not None:
+            params['resultOffset'] = resultOffset
+        if self._source._token is not None:
+            params['token'] = self._source._token
+        res = self._source._do_post(url=self._source.url + "/queryRelatedRecords",
+                                    param_dict=params,
+                                    proxy_url=self._source._proxy_url,
+                                    proxy_port=self._source._proxy_port)
+        if not isinstance(res, dict) or 'error' in res:
+            raise ValueError(res)
+        return res
+    #----------------------------------------------------------------------
+    def _query(self, oids):
+        """ queries a batch, halving it while the transfer limit is hit """
+        res = retry_call(self._post, args=(oids,),
+                         retries=self._retries,
+                         backoff=self._backoff)
+        if res.get('exceededTransferLimit', False) and len(oids) > 1:
+            middle = len(oids) // 2
+            groups = self._query(oids[:middle])
+            groups.extend(self._query(oids[middle:]))
+            return groups
+        elif res.get('exceededTransferLimit', False):
+            return self._pages(oids[0], res)
+        return res.get('relatedRecordGroups', [])
+    #----------------------------------------------------------------------
+    def _pages(self, oid, res):
+        """ reads the related records of one parent page by page, for
+            parents with more records than the transfer limit """
+        page = []
+        for group in res.get('relatedRecordGroups', []):
+            page.extend(group.get('relatedRecords', []))
+        records = list(page)
+        while res.get('exceededTransferLimit', False):
+            res = retry_call(self._post, args=([oid],),
+                             kwargs={"resultOffset" : len(records)},
+                             retries=self._retries,
+                             backoff=self._backoff)
+            previous = page
+            page = []
+            for group in res.get('relatedRecordGroups', []):
+                page.extend(group.get('relatedRecords', []))
+            if len(page) == 0 or page == previous:
+                # servers without supportsQueryRelatedPagination ignore
+                # resultOffset and return the first page again
+                raise ValueError("the related records of %s exceed " % oid + \
+                                 "the transfer limit and the service " + \
+                                 "does not page them")
+            records.extend(page)
+        return [{"objectId" : oid, "relatedRecords" : records}]
+    #----------------------------------------------------------------------
+    def iter_groups(self, objectIds):
+        """
+           queries the related records and yields them as batches complete
+           Inputs:
+              objectIds - list, iterable or comma separated string of
+                          parent object ids
+           Output:
+              generator of (parent object id, list of related records)
+              tuples.  Parents without related records are not returned.
+        """
+        for oids, groups, err in imap_bounded(self._query,
+                                              self._batches(objectIds),
+                                              max_workers=self._max_workers):
+            if err is not None:
+                raise err
+            for group in groups:
+                yield group['objectId'], group.get('relatedRecords', [])
+    #----------------------------------------------------------------------
+    def index(self, objectIds):
+        """
+           queries the related records of all parents
+           Inputs:
+              objectIds - list, iterable or comma separated string of
+                          parent object ids
+           Output:
+              dictionary of parent object id -> list of related records
+        """
+        related = {}
+        for oid, records in self.iter_groups(objectIds):
+            if oid in related:
+                related[oid].extend(records)
+            else:
+                related[oid] = records
+        return related
@@ -0,0 +1,199 @@
+"""
+
+.. module:: replicasync
+   :platform: Windows, Linux
+   :synopsis: Keeps a local SQLite copy of feature service layers up to
+              date with replica synchronization.
+
+.. moduleauthor:: Esri
+
+
+"""
+import layer as servicelayers
+########################################################################
+class ReplicaSync(object):
+    """
+       Keeps layers of a sync enabled feature service in a local
+       FeatureStore.
+
+       The first sync creates a perLayer replica and loads its features.
+       The replica id and the server generation of every layer are saved
+       in the store, so later syncs only download the changes made since
+       the previous one, and the work is proportional to the number of
+       edits.  The changes and the new generations are written in one
+       transaction.  Local edits can be uploaded in the same request.
+
+       Inputs:
+          service - agol.FeatureService with syncEnabled
+          store - common.featurestore.FeatureStore the layers are kept in
+          layers - list of layer ids to replicate
+          replicaName - name of the replica on the service
+          layerQueries - optional per layer filters of the replica
+          geometryFilter - optional GeometryFilter of the replica
+          layer_names - dictionary of layer id -> local layer name.
+                        Defaults to layer_<id>.
+          asynchronous - if True, createReplica and synchronizeReplica run
+                         as jobs that are polled until they complete
+          timeout - seconds to wait for a job, None waits until it ends
+    """
+    _service = None
+    _store = None
+    _layers = None
+    _replicaName = None
+    _layerQueries = None
+    _geometryFilter = None
+    _layer_names = None
+    _asynchronous = None
+    _timeout = None
+    #----------------------------------------------------------------------
+    def __init__(self, service, store, layers,
+                 replicaName="arcrest_sync",
+                 layerQueries=None,
+                 geometryFilter=None,
+                 layer_names=None,
+                 asynchronous=True,
+                 timeout=None):
+        """Constructor"""
+        self._service = service
+        self._store = store
+        self._layers = [int(l) for l in layers]
+        self._replicaName = replicaName
+        self._layerQueries = layerQueries
+        self._geometryFilter = geometryFilter
+        self._layer_names = dict([(int(k), v) for k, v in (layer_names or {}).iteritems()])
+        self._asynchronous = asynchronous
+        self._timeout = timeout
+    #----------------------------------------------------------------------
+    @property
+    def state_key(self):
+        """ returns the key the replica state is saved under """
+        return "replica:%s" % self._service.url.rstrip('/').lower()
+    #----------------------------------------------------------------------
+    @property
+    def state(self):
+        """ returns the saved replica id and server generations, or None
+            before the first sync """
+        return self._store.get_state(self.state_key)
+    #----------------------------------------------------------------------
+    def layer_name(self, layer_id):
+        """ returns the local name of a service layer """
+        return self._layer_names.get(int(layer_id), "layer_%s" % layer_id)
+    #----------------------------------------------------------------------
+    def _create_tables(self):
+        """ (re)creates the local tables from the layer descriptions """
+        service = self._service
+        for layer_id in self._layers:
+            fl = servicelayers.FeatureLayer(url=service.url + "/%s" % layer_id,
+                                            securityHandler=service._securityHandler,
+                                            proxy_port=service._proxy_port,
+                                            proxy_url=service._proxy_url,
+                                            initialize=True)
+            spatialReference = None
+            if fl.extent is not None:
+                spatialReference = fl.extent.get('spatialReference', None)
+            name = self.layer_name(layer_id)
+            self._store.drop_layer(name)
+            self._store.create_layer(name=name,
+                                     fields=fl.fields or [],
+                                     objectIdField=fl.objectIdField,
+                                     globalIdField=fl.globalIdField,
+                                     geometryType=fl.geometryType,
+                                     spatialReference=spatialReference,
+                                     url=fl.url)
+    #----------------------------------------------------------------------
+    def _result(self, res):
+        """ returns the replica content of a response, downloading it when
+            the response points to it """
+        if not isinstance(res, dict) or 'error' in res:
+            raise ValueError(res)
+        url = res.get('resultUrl', None) or res.get('responseUrl', None)
+        if 'layers' not in res and 'edits' not in res and url is not None:
+            params = {}
+            if self._service._token is not None:
+                params['token'] = self._service._token
+            res = self._service._do_get(url, param_dict=params,
+                                        proxy_url=self._service._proxy_url,
+                                        proxy_port=self._service._proxy_port)
+            if not isinstance(res, dict) or 'error' in res:
+                raise ValueError(res)
+        return res
+    #----------------------------------------------------------------------
+    def _initial(self):
+        """ creates the replica and loads all of its features """
+        self._create_tables()
+        res = self._service.createReplica(replicaName=self._replicaName,
+                                          layers=",".join(["%s" % l for l in self._layers]),
+                                          layerQueries=self._layerQueries,
+                                          geometryFilter=self._geometryFilter,
+                                          returnAttachments=False,
+                                          syncModel="perLayer",
+                                          dataFormat="json",
+                                          asynchronous=self._asynchronous,
+                                          timeout=self._timeout)
+        if res == "Not Supported":
+            raise ValueError("%s is not sync enabled" % self._service.url)
+        status = res
+        res = self._result(res)
+        state = {"replicaID" : res.get('replicaID', status.get('replicaID', None)),
+                 "replicaName" : self._replicaName,
+                 "layerServerGens" : res.get('layerServerGens', [])}
+        edits = [{"id" : layer['id'],
+                  "features" : {"adds" : layer.get('features', [])}} \
+                 for layer in res.get('layers', [])]
+        summary = self._store.apply_changes(edits,
+                                            layer_names=self._layer_names,
+                                            state={self.state_key : state})
+        return {"full" : True, "layers" : summary}
+    #----------------------------------------------------------------------
+    def sync(self, edits=None):
+        """
+           brings the local layers up to date with the service
+           Inputs:
+              edits - optional local edits to upload, as a list of
+                      {"id" : <layer id>, "features" : {"adds" : [...],
+                      "updates" : [...], "deleteIds" : [...]}}
+           Output:
+              dictionary with full (True for the first download) and the
+              number of adds, updates and deletes applied per local layer
+        """
+        state = self.state
+        if state is None:
+            res = self._initial()
+            if edits is None:
+                return res
+            state = self.state
+        direction = "download" if edits is None else "bidirectional"
+        syncLayers = [{"id" : gen['id'],
+                       "serverGen" : gen['serverGen'],
+                       "syncDirection" : direction} \
+                      for gen in state['layerServerGens']]
+        res = self._service.synchronizeReplica(replicaID=state['replicaID'],
+                                               syncLayers=syncLayers,
+                                               syncDirection=direction,
+                                               edits=edits,
+                                               returnIdsForAdds=edits is not None,
+                                               asynchronous=self._asynchronous,
+                                               timeout=self._timeout)
+        res = self._result(res)
+        gens = dict([(gen['id'], gen) for gen in state['layerServerGens']])
+        for gen in res.get('layerServerGens', []):
+            gens[gen['id']] = gen
+        state = dict(state)
+        state['layerServerGens'] = [gens[k] for k in sorted(gens.keys())]
+        summary = self._store.apply_changes(res.get('edits', None) or [],
+                                            layer_names=self._layer_names,
+                                            state={self.state_key : state})
+        result = {"full" : False, "layers" : summary}
+        if 'editsResults' in res:
+            result['editsResults'] = res['editsResults']
+        return result
+    #----------------------------------------------------------------------
+    def unregister(self):
+        """ unregisters the replica on the service and forgets the local
+            sync state.  The local layers are kept. """
+        state = self.state
+        if state is None:
+            return None
+        res = self._service.unRegisterReplica(state['replicaID'])
+        self._store.set_state(self.state_key, None)
+        return res
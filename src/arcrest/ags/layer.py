@@ -6,8 +6,9 @@ from .._abstract.abstract import DynamicData, DataSource
 from ..common.spatial import scratchGDB, scratchFolder, featureclass_to_json, json_to_featureclass
 from ..common import filters
 from ..common.general import _date_handler, _unicode_convert, Feature
+from ..common.statistics import StatisticsMixin
 ########################################################################
-class FeatureLayer(BaseAGSServer):
+class FeatureLayer(BaseAGSServer, StatisticsMixin):
     """
        This contains information about a feature service's layer.
     """
@@ -0,0 +1,40 @@
+"""
+   Deferred access to arcpy.
+
+   ArcPy is only imported the first time one of its members is used.  This
+   allows the REST functionality of the package to be imported and used on
+   machines where ArcGIS Desktop/Server (and therefore arcpy) is not
+   installed.
+"""
+import sys
+########################################################################
+class _ArcPyProxy(object):
+    """ stands in for the arcpy module until it is actually needed """
+    _module = None
+    #----------------------------------------------------------------------
+    def __getattr__(self, name):
+        """ imports arcpy on first use and forwards the attribute """
+        if _ArcPyProxy._module is None:
+            try:
+                import arcpy as module
+            except ImportError:
+                raise ImportError("arcpy is required for this operation, " + \
+                                  "but it could not be imported.")
+            _ArcPyProxy._module = module
+        return getattr(_ArcPyProxy._module, name)
+#----------------------------------------------------------------------
+def arcpy_loaded():
+    """ returns True if arcpy has already been imported in this process """
+    return sys.modules.get('arcpy') is not None
+#----------------------------------------------------------------------
+def is_arcpy_geometry(value):
+    """
+       returns True if value is an arcpy.Geometry object.  arcpy is never
+       imported by this check; if it has not been loaded yet the value
+       cannot be an arcpy geometry.
+    """
+    if not arcpy_loaded():
+        return False
+    return isinstance(value, sys.modules['arcpy'].Geometry)
+
+arcpy = _ArcPyProxy()
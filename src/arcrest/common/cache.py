@@ -0,0 +1,143 @@
+"""
+   Small in-memory caches for REST responses.
+
+   TTLCache combines least recently used eviction with a time to live per
+   entry and is safe to share between threads.  Keys are tuples whose
+   first element is the url of the resource, so all entries of a resource
+   can be dropped at once.
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+#----------------------------------------------------------------------
+def make_key(url, params, token=None):
+    """
+       builds a cache key from a resource url and request parameters.  The
+       token and output format parameters are ignored, and parameter
+       values are normalized so equal requests produce equal keys.
+       Inputs:
+          url - url of the resource
+          params - dictionary of request parameters
+          token - token the request is sent with.  A digest of it is part
+                  of the key, so responses are never shared between
+                  credentials.
+       Output:
+          hashable tuple
+    """
+    items = []
+    for k in sorted(params.keys()):
+        if k in ['token', 'f']:
+            continue
+        value = params[k]
+        if isinstance(value, (dict, list, tuple)):
+            value = json.dumps(value, sort_keys=True)
+        elif isinstance(value, basestring):
+            value = value.strip()
+        else:
+            value = json.dumps(value)
+        items.append((k, value))
+    if isinstance(token, unicode):
+        token = token.encode('utf-8')
+    if token is not None:
+        token = hashlib.sha1(token).hexdigest()
+    return (url.rstrip('/').lower(), tuple(items), token)
+########################################################################
+class TTLCache(object):
+    """
+       Thread safe least recently used cache with expiring entries.
+       Inputs:
+          maxsize - maximum number of entries kept
+          ttl - default number of seconds an entry is valid
+    """
+    _maxsize = None
+    _ttl = None
+    _data = None
+    _lock = None
+    _hits = None
+    _misses = None
+    #----------------------------------------------------------------------
+    def __init__(self, maxsize=256, ttl=60):
+        """Constructor"""
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+    #----------------------------------------------------------------------
+    @property
+    def ttl(self):
+        """ returns the default time to live in seconds """
+        return self._ttl
+    #----------------------------------------------------------------------
+    @property
+    def stats(self):
+        """ returns the number of entries, hits and misses """
+        return {"size" : len(self._data),
+                "hits" : self._hits,
+                "misses" : self._misses}
+    #----------------------------------------------------------------------
+    def get(self, key, default=None):
+        """ returns the cached value of key or default """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self._misses += 1
+                return default
+            self._data[key] = entry
+            self._hits += 1
+            return entry[1]
+    #----------------------------------------------------------------------
+    def set(self, key, value, ttl=None):
+        """ stores value under key for ttl seconds """
+        if ttl is None:
+            ttl = self._ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + ttl, value)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+    #----------------------------------------------------------------------
+    def get_or_call(self, key, func, ttl=None):
+        """
+           returns the cached value of key, or calls func and caches what
+           it returns
+        """
+        marker = self._data
+        value = self.get(key, marker)
+        if value is marker:
+            value = func()
+            self.set(key, value, ttl)
+        return value
+    #----------------------------------------------------------------------
+    def invalidate(self, url):
+        """ removes every entry of the resource at url """
+        url = url.rstrip('/').lower()
+        with self._lock:
+            for key in [k for k in self._data.keys() \
+                        if isinstance(k, tuple) and k[0] == url]:
+                del self._data[key]
+    #----------------------------------------------------------------------
+    def clear(self):
+        """ removes all entries """
+        with self._lock:
+            self._data.clear()
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return len(self._data)
+    #----------------------------------------------------------------------
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key, None)
+            return entry is not None and entry[0] >= time.time()
+
+# shared cache of statistics query results
+statistics_cache = TTLCache(maxsize=256, ttl=60)
+# shared cache of feature layer query results, used by layers that
+# enabled query caching
+query_cache = TTLCache(maxsize=512, ttl=300)
+# shared cache of geometries projected by a geometry service, used by
+# projection.Projector
+project_cache = TTLCache(maxsize=4096, ttl=3600)
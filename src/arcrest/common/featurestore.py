@@ -0,0 +1,630 @@
+"""
+   Local copy of feature layers in a SQLite database.
+
+   Each layer is stored in its own table with one typed column per
+   attribute field and the geometry as esri JSON text.  Changes downloaded
+   from a service (replica synchronization, change extraction) are applied
+   in a single transaction together with the bookkeeping that records how
+   far the copy is synchronized, so an interrupted sync never leaves the
+   two out of step.  Layers with geometries get an R-tree index of the
+   feature envelopes, and can be queried with the same arguments as
+   FeatureLayer.query.  Only the python standard library is used, except
+   for exact geometry filters, which use the numpy based predicates module.
+"""
+import json
+import sqlite3
+import threading
+from general import Feature
+from filters import GeometryFilter
+import predicates
+_COLUMN_TYPES = {"esriFieldTypeOID" : "INTEGER",
+                 "esriFieldTypeSmallInteger" : "INTEGER",
+                 "esriFieldTypeInteger" : "INTEGER",
+                 "esriFieldTypeSingle" : "REAL",
+                 "esriFieldTypeDouble" : "REAL",
+                 "esriFieldTypeDate" : "INTEGER",
+                 "esriFieldTypeString" : "TEXT",
+                 "esriFieldTypeGUID" : "TEXT",
+                 "esriFieldTypeGlobalID" : "TEXT",
+                 "esriFieldTypeXML" : "TEXT",
+                 "esriFieldTypeBlob" : "BLOB"}
+_GEOMETRY_COLUMN = "_geometry"
+# predicates.relate relation of the stored feature to the filter geometry
+# for the spatialRel values a geometry filter is refined with
+_SPATIAL_RELATIONS = {"esriSpatialRelIntersects" : "intersects",
+                      "esriSpatialRelContains" : "contains",
+                      "esriSpatialRelWithin" : "within"}
+_prepared = {}
+#----------------------------------------------------------------------
+def _st_relate(geometry, relation, filter_geometry):
+    """ SQLite function that tests the relation of a stored geometry to
+        the filter geometry, both as esri JSON text """
+    if geometry is None:
+        return 0
+    shape = _prepared.get(filter_geometry, None)
+    if shape is None:
+        _prepared.clear()
+        shape = predicates.prepare(json.loads(filter_geometry))
+        _prepared[filter_geometry] = shape
+    return int(predicates.relate([json.loads(geometry)], shape, relation)[0])
+#----------------------------------------------------------------------
+def _quote(name):
+    """ quotes a table or column name """
+    return '"%s"' % name.replace('"', '""')
+#----------------------------------------------------------------------
+def envelope(geometry):
+    """
+       returns the (xmin, xmax, ymin, ymax) of an esri json geometry, or
+       None for empty geometries
+    """
+    if geometry is None:
+        return None
+    if 'xmin' in geometry:
+        if geometry['xmin'] is None:
+            return None
+        return (geometry['xmin'], geometry['xmax'],
+                geometry['ymin'], geometry['ymax'])
+    if 'x' in geometry:
+        if geometry['x'] is None:
+            return None
+        return (geometry['x'], geometry['x'], geometry['y'], geometry['y'])
+    if 'points' in geometry:
+        vertices = geometry['points']
+    else:
+        vertices = [v for part in geometry.get('rings', geometry.get('paths', [])) \
+                    for v in part]
+    if len(vertices) == 0:
+        return None
+    xs = [v[0] for v in vertices]
+    ys = [v[1] for v in vertices]
+    return (min(xs), max(xs), min(ys), max(ys))
+########################################################################
+class FeatureStore(object):
+    """
+       SQLite database holding local copies of feature layers.
+       Inputs:
+          path - path of the database file, or ':memory:'
+    """
+    _path = None
+    _conn = None
+    _lock = None
+    _layers = None
+    #----------------------------------------------------------------------
+    def __init__(self, path):
+        """Constructor"""
+        self._path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.create_function("_st_relate", 3, _st_relate)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS _layers (" + \
+                           "name TEXT PRIMARY KEY, definition TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS _state (" + \
+                           "key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._layers = {}
+        for name, definition in self._conn.execute("SELECT name, definition FROM _layers"):
+            self._layers[name] = json.loads(definition)
+    #----------------------------------------------------------------------
+    @property
+    def path(self):
+        """ returns the path of the database """
+        return self._path
+    #----------------------------------------------------------------------
+    @property
+    def layers(self):
+        """ returns the names of the stored layers """
+        return sorted(self._layers.keys())
+    #----------------------------------------------------------------------
+    def definition(self, name):
+        """ returns the fields, object id field, global id field, geometry
+            type and spatial reference of a stored layer """
+        if name not in self._layers:
+            raise ValueError("layer %s is not in the store" % name)
+        return self._layers[name]
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the database """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, type, value, traceback):
+        self.close()
+    #----------------------------------------------------------------------
+    def create_layer(self, name, fields, objectIdField,
+                     globalIdField=None, geometryType=None,
+                     spatialReference=None, url=None):
+        """
+           creates the table of a layer, or returns if it exists
+           Inputs:
+              name - name of the local layer
+              fields - list of field dictionaries (name, type) as in the
+                       layer's REST description
+              objectIdField - name of the object id field
+              globalIdField - name of the global id field, if any
+              geometryType - esri geometry type, None for tables
+              spatialReference - spatial reference dictionary
+              url - url of the service layer the data comes from
+        """
+        with self._lock:
+            if name in self._layers:
+                return self._layers[name]
+            columns = []
+            names = []
+            for field in fields:
+                ftype = field.get('type', "esriFieldTypeString")
+                if ftype not in _COLUMN_TYPES:
+                    continue
+                if field['name'] == objectIdField:
+                    columns.append("%s INTEGER PRIMARY KEY" % _quote(field['name']))
+                else:
+                    columns.append("%s %s" % (_quote(field['name']),
+                                              _COLUMN_TYPES[ftype]))
+                names.append(field['name'])
+            if objectIdField not in names:
+                columns.insert(0, "%s INTEGER PRIMARY KEY" % _quote(objectIdField))
+                names.insert(0, objectIdField)
+            if geometryType is not None:
+                columns.append("%s TEXT" % _quote(_GEOMETRY_COLUMN))
+            definition = {"fields" : [f for f in fields if f['name'] in names],
+                          "columns" : names,
+                          "objectIdField" : objectIdField,
+                          "globalIdField" : globalIdField,
+                          "geometryType" : geometryType,
+                          "spatialReference" : spatialReference,
+                          "url" : url}
+            self._conn.execute("CREATE TABLE IF NOT EXISTS %s (%s)" % \
+                               (_quote(name), ", ".join(columns)))
+            if geometryType is not None:
+                definition['spatialIndex'] = "%s_rtree" % name
+                self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS %s " % \
+                                   _quote(definition['spatialIndex']) + \
+                                   "USING rtree(id, xmin, xmax, ymin, ymax)")
+            if globalIdField is not None and globalIdField in names:
+                self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS %s ON %s (%s)" % \
+                                   (_quote("%s_globalid" % name), _quote(name),
+                                    _quote(globalIdField)))
+            self._conn.execute("INSERT OR REPLACE INTO _layers VALUES (?, ?)",
+                               (name, json.dumps(definition)))
+            self._conn.commit()
+            self._layers[name] = definition
+            return definition
+    #----------------------------------------------------------------------
+    def drop_layer(self, name):
+        """ removes a layer and its data from the store """
+        with self._lock:
+            self._conn.execute("DROP TABLE IF EXISTS %s" % _quote(name))
+            self._conn.execute("DROP TABLE IF EXISTS %s" % _quote("%s_rtree" % name))
+            self._conn.execute("DELETE FROM _layers WHERE name = ?", (name,))
+            self._conn.commit()
+            self._layers.pop(name, None)
+    #----------------------------------------------------------------------
+    def _row(self, definition, feature):
+        """ converts an esri json feature to a row of the layer table """
+        attributes = feature.get('attributes', {})
+        row = [attributes.get(column, None) for column in definition['columns']]
+        if definition['geometryType'] is not None:
+            geometry = feature.get('geometry', None)
+            row.append(json.dumps(geometry) if geometry is not None else None)
+        return row
+    #----------------------------------------------------------------------
+    def _upsert(self, name, features):
+        """ inserts or replaces features, inside the current transaction """
+        definition = self.definition(name)
+        columns = list(definition['columns'])
+        if definition['geometryType'] is not None:
+            columns.append(_GEOMETRY_COLUMN)
+        sql = "INSERT OR REPLACE INTO %s (%s) VALUES (%s)" % \
+              (_quote(name), ", ".join([_quote(c) for c in columns]),
+               ", ".join(["?"] * len(columns)))
+        index = definition.get('spatialIndex', None)
+        oid_field = definition['objectIdField']
+        count = 0
+        rows = []
+        boxes = []
+        empty = []
+        for feature in features:
+            if not isinstance(feature, dict):
+                feature = feature.asDictionary
+            rows.append(self._row(definition, feature))
+            if index is not None:
+                oid = feature['attributes'][oid_field]
+                box = envelope(feature.get('geometry', None))
+                if box is None:
+                    empty.append((oid,))
+                else:
+                    boxes.append((oid,) + tuple(box))
+            if len(rows) >= 1000:
+                count += self._write(sql, rows, index, boxes, empty)
+                rows = []
+                boxes = []
+                empty = []
+        if len(rows) > 0:
+            count += self._write(sql, rows, index, boxes, empty)
+        return count
+    #----------------------------------------------------------------------
+    def _write(self, sql, rows, index, boxes, empty):
+        """ writes a batch of rows and their envelopes """
+        self._conn.executemany(sql, rows)
+        if index is not None:
+            if len(empty) > 0:
+                self._conn.executemany("DELETE FROM %s WHERE id = ?" % _quote(index),
+                                       empty)
+            if len(boxes) > 0:
+                self._conn.executemany("INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?)" % \
+                                       _quote(index), boxes)
+        return len(rows)
+    #----------------------------------------------------------------------
+    def _delete(self, name, ids):
+        """ deletes features by object id or global id (strings), inside
+            the current transaction """
+        definition = self.definition(name)
+        oids = [i for i in ids if not isinstance(i, basestring)]
+        gids = [i for i in ids if isinstance(i, basestring)]
+        if len(gids) > 0 and definition['globalIdField'] is None:
+            raise ValueError("layer %s has no global id field" % name)
+        index = definition.get('spatialIndex', None)
+        count = 0
+        for field, values in [(definition['objectIdField'], oids),
+                              (definition['globalIdField'], gids)]:
+            for i in xrange(0, len(values), 500):
+                chunk = values[i:i + 500]
+                marks = ", ".join(["?"] * len(chunk))
+                if index is not None:
+                    if field == definition['objectIdField']:
+                        self._conn.execute("DELETE FROM %s WHERE id IN (%s)" % \
+                                           (_quote(index), marks), chunk)
+                    else:
+                        self._conn.execute("DELETE FROM %s WHERE id IN (SELECT %s FROM %s WHERE %s IN (%s))" % \
+                                           (_quote(index),
+                                            _quote(definition['objectIdField']),
+                                            _quote(name), _quote(field), marks),
+                                           chunk)
+                cursor = self._conn.execute("DELETE FROM %s WHERE %s IN (%s)" % \
+                                            (_quote(name), _quote(field), marks),
+                                            chunk)
+                count += cursor.rowcount
+        return count
+    #----------------------------------------------------------------------
+    def _truncate(self, name):
+        """ deletes all features of a layer, inside the current
+            transaction """
+        definition = self.definition(name)
+        self._conn.execute("DELETE FROM %s" % _quote(name))
+        if definition.get('spatialIndex', None) is not None:
+            self._conn.execute("DELETE FROM %s" % _quote(definition['spatialIndex']))
+    #----------------------------------------------------------------------
+    def upsert(self, name, features):
+        """
+           adds or replaces features of a layer
+           Inputs:
+              name - name of the local layer
+              features - iterable of esri json feature dictionaries
+           Output:
+              number of features written
+        """
+        with self._lock:
+            with self._conn:
+                return self._upsert(name, features)
+    #----------------------------------------------------------------------
+    def delete(self, name, ids):
+        """
+           deletes features of a layer
+           Inputs:
+              name - name of the local layer
+              ids - object ids, or global ids (strings)
+           Output:
+              number of features deleted
+        """
+        with self._lock:
+            with self._conn:
+                return self._delete(name, list(ids))
+    #----------------------------------------------------------------------
+    def apply_changes(self, edits, layer_names=None, state=None):
+        """
+           applies the changes of a synchronizeReplica or extractChanges
+           response in one transaction
+           Inputs:
+              edits - list of {"id" : <layer id>, "features" : {"adds" :
+                      [...], "updates" : [...], "deleteIds" : [...]}}
+              layer_names - dictionary of layer id -> local layer name.
+                            Defaults to layer_<id>.
+              state - optional dictionary of state keys and values saved
+                      in the same transaction
+           Output:
+              dictionary of local layer name -> {"adds", "updates",
+              "deletes"} counts
+        """
+        layer_names = layer_names or {}
+        summary = {}
+        with self._lock:
+            with self._conn:
+                for layer in edits:
+                    name = layer_names.get(layer['id'],
+                                           layer_names.get(str(layer['id']),
+                                                           "layer_%s" % layer['id']))
+                    features = layer.get('features', {})
+                    summary[name] = {
+                        "adds" : self._upsert(name, features.get('adds', None) or []),
+                        "updates" : self._upsert(name, features.get('updates', None) or []),
+                        "deletes" : self._delete(name, features.get('deleteIds', None) or [])
+                    }
+                if state is not None:
+                    for key, value in state.iteritems():
+                        self._set_state(key, value)
+        return summary
+    #----------------------------------------------------------------------
+    def _set_state(self, key, value):
+        """ saves a state value, inside the current transaction """
+        if value is None:
+            self._conn.execute("DELETE FROM _state WHERE key = ?", (key,))
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO _state VALUES (?, ?)",
+                               (key, json.dumps(value)))
+    #----------------------------------------------------------------------
+    def get_state(self, key, default=None):
+        """ returns a saved state value, such as a replica id and its
+            server generations """
+        row = self._conn.execute("SELECT value FROM _state WHERE key = ?",
+                                 (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+    #----------------------------------------------------------------------
+    def set_state(self, key, value):
+        """ saves a state value.  None removes it. """
+        with self._lock:
+            with self._conn:
+                self._set_state(key, value)
+    #----------------------------------------------------------------------
+    def count(self, name):
+        """ returns the number of features of a layer """
+        self.definition(name)
+        return self._conn.execute("SELECT COUNT(*) FROM %s" % _quote(name)).fetchone()[0]
+    #----------------------------------------------------------------------
+    def features(self, name):
+        """ yields the features of a layer as esri json dictionaries """
+        definition = self.definition(name)
+        columns = definition['columns']
+        select = [_quote(c) for c in columns]
+        has_geometry = definition['geometryType'] is not None
+        if has_geometry:
+            select.append(_quote(_GEOMETRY_COLUMN))
+        cursor = self._conn.execute("SELECT %s FROM %s" % (", ".join(select),
+                                                           _quote(name)))
+        for row in cursor:
+            feature = {"attributes" : dict(zip(columns, row[:len(columns)]))}
+            if has_geometry and row[-1] is not None:
+                feature['geometry'] = json.loads(row[-1])
+            yield feature
+    #----------------------------------------------------------------------
+    def write(self, name, features=None, deletes=None, truncate=False,
+              state=None):
+        """
+           writes features and deletes of one layer in one transaction
+           Inputs:
+              name - name of the local layer
+              features - esri json features (or Feature objects) to add
+                         or replace
+              deletes - object ids or global ids to delete
+              truncate - if True, all features are removed first
+              state - optional dictionary of state keys and values saved
+                      in the same transaction
+           Output:
+              dictionary with the number of features written and deleted
+        """
+        with self._lock:
+            with self._conn:
+                if truncate:
+                    self._truncate(name)
+                result = {"written" : self._upsert(name, features or []),
+                          "deleted" : self._delete(name, list(deletes or []))}
+                if state is not None:
+                    for key, value in state.iteritems():
+                        self._set_state(key, value)
+                return result
+    #----------------------------------------------------------------------
+    def checkpoints(self, name):
+        """ returns a checkpoint store, usable by
+            agol.changetracking.ChangeTracker, that keeps the sync
+            checkpoint of a layer in the database """
+        return StoreCheckpoints(store=self, key="checkpoint:%s" % name)
+    #----------------------------------------------------------------------
+    def query(self, name, where="1=1", out_fields="*", geometryFilter=None,
+              returnGeometry=True, returnIDsOnly=False,
+              returnCountOnly=False, objectIds=None, orderByFields=None,
+              exact=False):
+        """
+           queries a stored layer with the arguments of FeatureLayer.query.
+           The where clause is evaluated by SQLite.  A geometry filter
+           selects the features whose envelope intersects the envelope of
+           the filter geometry using the R-tree index.  With exact, the
+           features found are then tested with the spatial relation of the
+           filter (intersects, contains or within; other relations keep the
+           envelope test).
+           Inputs:
+              name - name of the local layer
+              where - the selection sql statement
+              out_fields - comma separated field names or *
+              geometryFilter - GeometryFilter, or an esri json geometry
+              returnGeometry - true means the geometries are returned
+              returnIDsOnly - if True, only the object ids are returned
+              returnCountOnly - if True, only the count is returned
+              objectIds - optional list of object ids to limit the query
+              orderByFields - optional sql order by clause
+              exact - if True, geometry filters test the geometries and not
+                      only their envelopes.  Requires numpy.
+           Output:
+              list of Feature objects, or the objectIdFieldName/objectIds
+              or count dictionary of the REST query
+        """
+        definition = self.definition(name)
+        oid_field = definition['objectIdField']
+        table = _quote(name)
+        clauses = ["(%s)" % (where or "1=1")]
+        args = []
+        if geometryFilter is not None:
+            spatialRel = "esriSpatialRelIntersects"
+            if isinstance(geometryFilter, GeometryFilter):
+                geometry = geometryFilter.filter['geometry']
+                spatialRel = geometryFilter.spatialRelation
+            else:
+                geometry = geometryFilter
+            box = envelope(geometry)
+            index = definition.get('spatialIndex', None)
+            if box is None or index is None:
+                clauses.append("0")
+            else:
+                clauses.append("%s IN (SELECT id FROM %s WHERE xmax >= ? AND xmin <= ? AND ymax >= ? AND ymin <= ?)" % \
+                               (_quote(oid_field), _quote(index)))
+                args.extend([box[0], box[1], box[2], box[3]])
+                if exact and spatialRel in _SPATIAL_RELATIONS:
+                    # fails here without numpy, errors raised in SQLite
+                    # functions only surface as OperationalError
+                    predicates.prepare(geometry)
+                    clauses.append("_st_relate(%s, ?, ?)" % _quote(_GEOMETRY_COLUMN))
+                    args.extend([_SPATIAL_RELATIONS[spatialRel], json.dumps(geometry)])
+        if objectIds is not None:
+            if isinstance(objectIds, basestring):
+                objectIds = [int(oid) for oid in objectIds.split(",") if oid.strip() != ""]
+            objectIds = list(objectIds)
+            clauses.append("%s IN (%s)" % (_quote(oid_field),
+                                           ", ".join(["?"] * len(objectIds)) or "NULL"))
+            args.extend(objectIds)
+        sql_where = " AND ".join(clauses)
+        if returnCountOnly:
+            row = self._conn.execute("SELECT COUNT(*) FROM %s WHERE %s" % (table, sql_where),
+                                     args).fetchone()
+            return {"count" : row[0]}
+        if returnIDsOnly:
+            cursor = self._conn.execute("SELECT %s FROM %s WHERE %s" % (_quote(oid_field),
+                                                                       table, sql_where),
+                                        args)
+            return {"objectIdFieldName" : oid_field,
+                    "objectIds" : [oid[0] for oid in cursor]}
+        if out_fields is None or out_fields.strip() == "*":
+            columns = list(definition['columns'])
+        else:
+            lookup = dict([(c.lower(), c) for c in definition['columns']])
+            columns = []
+            for field in out_fields.split(","):
+                field = field.strip()
+                if field.lower() not in lookup:
+                    raise ValueError("field %s is not in layer %s" % (field, name))
+                columns.append(lookup[field.lower()])
+        select = [_quote(c) for c in columns]
+        has_geometry = returnGeometry and definition['geometryType'] is not None
+        if has_geometry:
+            select.append(_quote(_GEOMETRY_COLUMN))
+        sql = "SELECT %s FROM %s WHERE %s" % (", ".join(select), table, sql_where)
+        if orderByFields is not None:
+            sql += " ORDER BY %s" % orderByFields
+        features = []
+        for row in self._conn.execute(sql, args):
+            feature = {"attributes" : dict(zip(columns, row[:len(columns)]))}
+            if has_geometry and row[-1] is not None:
+                feature['geometry'] = json.loads(row[-1])
+            features.append(Feature(feature))
+        return features
+    #----------------------------------------------------------------------
+    def layer(self, name):
+        """ returns a StoreLayer, which queries a stored layer like a
+            FeatureLayer """
+        self.definition(name)
+        return StoreLayer(store=self, name=name)
+########################################################################
+class StoreCheckpoints(object):
+    """
+       Checkpoint store (get/set/remove) that saves into the state table of
+       a FeatureStore.  set() is deferred until commit() so the checkpoint
+       is written with the last batch of features.
+       Inputs:
+          store - the FeatureStore
+          key - state key of the checkpoint
+    """
+    _store = None
+    _key = None
+    _pending = None
+    #----------------------------------------------------------------------
+    def __init__(self, store, key):
+        """Constructor"""
+        self._store = store
+        self._key = key
+    #----------------------------------------------------------------------
+    def get(self, url):
+        """ returns the saved checkpoint """
+        return self._store.get_state(self._key)
+    #----------------------------------------------------------------------
+    def set(self, url, value):
+        """ keeps the checkpoint until commit() """
+        self._pending = value
+    #----------------------------------------------------------------------
+    def remove(self, url):
+        """ removes the checkpoint """
+        self._pending = None
+        self._store.set_state(self._key, None)
+    #----------------------------------------------------------------------
+    def commit(self):
+        """ returns the pending checkpoint as a state dictionary for
+            FeatureStore.write, or None """
+        if self._pending is None:
+            return None
+        state = {self._key : self._pending}
+        self._pending = None
+        return state
+########################################################################
+class StoreLayer(object):
+    """
+       A layer of a FeatureStore with the query interface of
+       FeatureLayer, so code can switch between the service and the local
+       copy.
+       Inputs:
+          store - the FeatureStore
+          name - name of the local layer
+    """
+    _store = None
+    _name = None
+    #----------------------------------------------------------------------
+    def __init__(self, store, name):
+        """Constructor"""
+        self._store = store
+        self._name = name
+    #----------------------------------------------------------------------
+    @property
+    def name(self):
+        """ returns the local layer name """
+        return self._name
+    #----------------------------------------------------------------------
+    @property
+    def fields(self):
+        """ returns the fields of the layer """
+        return self._store.definition(self._name)['fields']
+    #----------------------------------------------------------------------
+    @property
+    def objectIdField(self):
+        """ returns the object id field """
+        return self._store.definition(self._name)['objectIdField']
+    #----------------------------------------------------------------------
+    @property
+    def geometryType(self):
+        """ returns the geometry type """
+        return self._store.definition(self._name)['geometryType']
+    #----------------------------------------------------------------------
+    def query(self, where="1=1", out_fields="*", timeFilter=None,
+              geometryFilter=None, returnGeometry=True, returnIDsOnly=False,
+              returnCountOnly=False, exact=False, **kwargs):
+        """ queries the local layer, see FeatureStore.query.  timeFilter
+            and the service only options are ignored. """
+        return self._store.query(self._name,
+                                 where=where,
+                                 out_fields=out_fields,
+                                 geometryFilter=geometryFilter,
+                                 returnGeometry=returnGeometry,
+                                 returnIDsOnly=returnIDsOnly,
+                                 returnCountOnly=returnCountOnly,
+                                 exact=exact)
@@ -74,7 +74,7 @@ class GeometryFilter(BaseFilter):
     #----------------------------------------------------------------------
     def __init__(self, geomObject, spatialFilter="esriSpatialRelIntersects"):
         """Constructor"""
-        if isinstance(geomObject, ) and \
+        if isinstance(geomObject, AbstractGeometry) and \
            spatialFilter in self._allowedFilters:
             self._geomObject = geomObject
             self._spatialAction = spatialFilter
@@ -144,4 +144,47 @@ class TimeFilter(BaseFilter):
             val = "%s, %s" % (self._startTime, self._endTime)
             return val
         else:
-            return "%s" % self._startTime
\ No newline at end of file
+            return "%s" % self._startTime
+########################################################################
+class StatisticFilter(BaseFilter):
+    """
+       Creates the outStatistics definitions of a statistics query.
+       Example:
+          sf = StatisticFilter()
+          sf.add(statisticType="count", onStatisticField="OBJECTID",
+                 outStatisticFieldName="total")
+          sf.add(statisticType="avg", onStatisticField="POP")
+    """
+    _filter = None
+    _types = ["count", "sum", "min", "max", "avg", "stddev", "var"]
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self._filter = []
+    #----------------------------------------------------------------------
+    def add(self, statisticType, onStatisticField, outStatisticFieldName=None):
+        """ adds a statistic definition
+            Inputs:
+               statisticType - count, sum, min, max, avg, stddev or var
+               onStatisticField - field the statistic is calculated on
+               outStatisticFieldName - name of the output field.  Default
+                                       is <statisticType>_<field>.
+        """
+        statisticType = statisticType.lower()
+        if not statisticType in self._types:
+            raise AttributeError("Invalid statisticType, must be one of: " + \
+                                 ",".join(self._types))
+        if outStatisticFieldName is None:
+            outStatisticFieldName = "%s_%s" % (statisticType, onStatisticField)
+        self._filter.append({"statisticType" : statisticType,
+                             "onStatisticField" : onStatisticField,
+                             "outStatisticFieldName" : outStatisticFieldName})
+    #----------------------------------------------------------------------
+    def removeAll(self):
+        """ removes all statistic definitions """
+        self._filter = []
+    #----------------------------------------------------------------------
+    @property
+    def filter(self):
+        """ returns the list of statistic definitions """
+        return self._filter
@@ -1,7 +1,7 @@
 import datetime
 import time
 import json
-import arcpy
+from _arcpy import arcpy, is_arcpy_geometry
 import copy
 from geometry import Point, MultiPoint, Polygon, Polyline
 from .._abstract.abstract import AbstractGeometry
@@ -107,7 +107,7 @@ class Feature(object):
                 else:
                     return False
                 self._json = json.dumps(self._dict, default=_date_handler)
-            elif isinstance(value, arcpy.Geometry):
+            elif is_arcpy_geometry(value):
                 if isinstance(value, arcpy.PointGeometry):
                     self.set_value( field_name, Point(value,value.spatialReference.factoryCode))
                 elif isinstance(value, arcpy.Multipoint):
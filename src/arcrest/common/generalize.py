@@ -0,0 +1,338 @@
+"""
+   Local generalization and cleaning of geometries.
+
+   Removes vertices from dense polylines and polygons with the
+   Douglas-Peucker or Visvalingam-Whyatt algorithms, removes duplicate
+   vertices, closes rings and orients them the way the REST API expects
+   (exterior rings clockwise, holes counterclockwise).  The geometries are
+   processed on the client, so they can be thinned before they are sent
+   in edits without a generalize or simplify call to a geometry service.
+
+   The functions accept esri json dictionaries or common.geometry objects
+   and return the same type.  Z and M values are kept for the remaining
+   vertices.  numpy is only imported when a geometry is processed.
+"""
+import heapq
+import geometry as _geometry
+from .._abstract.abstract import AbstractGeometry
+
+METHODS = ("douglas-peucker", "visvalingam")
+#----------------------------------------------------------------------
+def _numpy():
+    """ imports numpy, raising a clear error when it is missing """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required for generalization, " + \
+                          "but it could not be imported.")
+    return numpy
+#----------------------------------------------------------------------
+def _segment_distances(points, start, end):
+    """ returns the distances of the points to the segment start-end """
+    np = _numpy()
+    d = end - start
+    norm = d[0] * d[0] + d[1] * d[1]
+    if norm == 0:
+        return np.hypot(points[:, 0] - start[0], points[:, 1] - start[1])
+    t = ((points[:, 0] - start[0]) * d[0] + (points[:, 1] - start[1]) * d[1]) / norm
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(points[:, 0] - (start[0] + t * d[0]),
+                    points[:, 1] - (start[1] + t * d[1]))
+#----------------------------------------------------------------------
+def douglas_peucker(coords, tolerance, ring=False):
+    """
+       generalizes a path or ring with the Douglas-Peucker algorithm
+       Inputs:
+          coords - (vertices, dimensions) numpy array
+          tolerance - largest distance a removed vertex may be from the
+                      generalized line
+          ring - True for closed rings, which keep at least 4 vertices
+       Output:
+          numpy array of the remaining vertices
+    """
+    np = _numpy()
+    n = len(coords)
+    if n < 3:
+        return coords
+    xy = coords[:, :2]
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[n - 1] = True
+    stack = [(0, n - 1)]
+    if ring:
+        # a closed ring starts and ends on the same vertex, split it at
+        # the vertex farthest from it
+        far = int(np.argmax(np.hypot(xy[:, 0] - xy[0, 0], xy[:, 1] - xy[0, 1])))
+        keep[far] = True
+        stack = [(0, far), (far, n - 1)]
+    while len(stack) > 0:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dist = _segment_distances(xy[start + 1:end], xy[start], xy[end])
+        index = int(np.argmax(dist))
+        if dist[index] > tolerance:
+            index += start + 1
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    if ring and np.count_nonzero(keep) < 4 and n >= 4:
+        kept = np.nonzero(keep)[0]
+        dist = _segment_distances(xy, xy[kept[0]], xy[kept[1]])
+        dist[keep] = -1
+        keep[int(np.argmax(dist))] = True
+    return coords[keep]
+#----------------------------------------------------------------------
+def _triangle_area(xy, a, b, c):
+    """ returns the area of the triangle of the vertices a, b and c """
+    return abs((xy[b, 0] - xy[a, 0]) * (xy[c, 1] - xy[a, 1]) - \
+               (xy[c, 0] - xy[a, 0]) * (xy[b, 1] - xy[a, 1])) / 2.0
+#----------------------------------------------------------------------
+def visvalingam(coords, tolerance, ring=False):
+    """
+       generalizes a path or ring with the Visvalingam-Whyatt algorithm,
+       repeatedly removing the vertex that forms the smallest triangle
+       with its neighbors
+       Inputs:
+          coords - (vertices, dimensions) numpy array
+          tolerance - smallest triangle area of a remaining vertex, in
+                      square units of the coordinates
+          ring - True for closed rings, which keep at least 4 vertices
+       Output:
+          numpy array of the remaining vertices
+    """
+    np = _numpy()
+    n = len(coords)
+    if n < 3:
+        return coords
+    xy = coords[:, :2]
+    minimum = 4 if ring else 2
+    previous = np.arange(-1, n - 1)
+    following = np.arange(1, n + 1)
+    areas = np.empty(n)
+    areas[0] = areas[n - 1] = np.inf
+    areas[1:n - 1] = np.abs((xy[1:-1, 0] - xy[:-2, 0]) * (xy[2:, 1] - xy[:-2, 1]) - \
+                            (xy[2:, 0] - xy[:-2, 0]) * (xy[1:-1, 1] - xy[:-2, 1])) / 2.0
+    heap = [(areas[i], i) for i in xrange(1, n - 1)]
+    heapq.heapify(heap)
+    keep = np.ones(n, dtype=bool)
+    remaining = n
+    largest = 0.0
+    while len(heap) > 0 and remaining > minimum:
+        area, i = heapq.heappop(heap)
+        if not keep[i] or area != areas[i]:
+            continue
+        # an area is never smaller than the one of a vertex removed before
+        # it, so vertices are removed in the order of their significance
+        largest = max(largest, area)
+        if largest >= tolerance:
+            break
+        keep[i] = False
+        remaining -= 1
+        p, f = previous[i], following[i]
+        following[p] = f
+        previous[f] = p
+        for j in (p, f):
+            if 0 < j < n - 1:
+                areas[j] = max(_triangle_area(xy, previous[j], j, following[j]),
+                               largest)
+                heapq.heappush(heap, (areas[j], j))
+    return coords[keep]
+#----------------------------------------------------------------------
+def remove_duplicates(coords, tolerance=0.0):
+    """ removes vertices closer than tolerance to the previous vertex """
+    np = _numpy()
+    if len(coords) < 2:
+        return coords
+    xy = coords[:, :2]
+    step = np.hypot(np.diff(xy[:, 0]), np.diff(xy[:, 1]))
+    keep = np.concatenate([[True], step > tolerance])
+    return coords[keep]
+#----------------------------------------------------------------------
+def close_ring(coords):
+    """ appends the first vertex of a ring when it is not closed """
+    np = _numpy()
+    if len(coords) > 0 and \
+       (coords[0, 0] != coords[-1, 0] or coords[0, 1] != coords[-1, 1]):
+        return np.vstack([coords, coords[:1]])
+    return coords
+#----------------------------------------------------------------------
+def signed_area(coords):
+    """ returns the signed area of a closed ring, negative when it is
+        clockwise """
+    np = _numpy()
+    x = coords[:, 0] - coords[0, 0]
+    y = coords[:, 1] - coords[0, 1]
+    return float(np.sum(x[:-1] * y[1:] - x[1:] * y[:-1]) / 2.0)
+#----------------------------------------------------------------------
+def _contains(ring, x, y):
+    """ returns True if the point is inside the closed ring (even-odd) """
+    np = _numpy()
+    x0, y0 = ring[:-1, 0], ring[:-1, 1]
+    x1, y1 = ring[1:, 0], ring[1:, 1]
+    straddles = (y0 > y) != (y1 > y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xcross = x0 + (y - y0) / (y1 - y0) * (x1 - x0)
+    return bool(np.count_nonzero(straddles & (x < xcross)) % 2)
+#----------------------------------------------------------------------
+def orient_rings(rings):
+    """
+       orients the closed rings of a polygon: rings inside an even number
+       of other rings are exterior rings and made clockwise, the others are
+       holes and made counterclockwise
+    """
+    result = []
+    for i, ring in enumerate(rings):
+        depth = 0
+        for j, other in enumerate(rings):
+            if i != j and _contains(other, ring[0, 0], ring[0, 1]):
+                depth += 1
+        clockwise = signed_area(ring) < 0
+        if clockwise != (depth % 2 == 0):
+            ring = ring[::-1]
+        result.append(ring)
+    return result
+#----------------------------------------------------------------------
+def _kind(geometry):
+    """ returns the parts key of a geometry and its parts as arrays """
+    np = _numpy()
+    if isinstance(geometry, _geometry._PartGeometry):
+        values = np.asarray(geometry.coordinates, dtype=np.float64)
+        offsets = geometry.partOffsets
+        parts = [values[offsets[i]:offsets[i + 1]].copy() \
+                 for i in xrange(len(offsets) - 1)]
+        key = {"esriGeometryPolygon" : "rings",
+               "esriGeometryPolyline" : "paths",
+               "esriGeometryMultipoint" : "points"}[geometry.type]
+        return key, parts
+    for key in ("rings", "paths"):
+        if key in geometry:
+            return key, [np.array(part, dtype=np.float64).reshape(len(part), -1) \
+                         for part in geometry[key]]
+    if 'points' in geometry:
+        return "points", [np.array(geometry['points'], dtype=np.float64).reshape(len(geometry['points']), -1)]
+    return None, None
+#----------------------------------------------------------------------
+def _rebuild(geometry, key, parts):
+    """ returns a geometry of the same type with the new parts """
+    np = _numpy()
+    lists = []
+    for part in parts:
+        values = part.tolist()
+        if np.isnan(part).any():
+            values = [[None if v != v else v for v in row] for row in values]
+        lists.append(values)
+    if isinstance(geometry, AbstractGeometry):
+        cls = type(geometry)
+        wkid = geometry.spatialReference['wkid']
+        if key == "points":
+            return cls(lists[0] if len(lists) > 0 else [], wkid,
+                       hasZ=geometry._hasZ, hasM=geometry._hasM)
+        return cls(lists, wkid, hasZ=geometry._hasZ, hasM=geometry._hasM)
+    result = dict(geometry)
+    if key == "points":
+        result[key] = lists[0] if len(lists) > 0 else []
+    else:
+        result[key] = lists
+    return result
+#----------------------------------------------------------------------
+def generalize(geometry, tolerance, method="douglas-peucker"):
+    """
+       removes vertices from the paths of a polyline or the rings of a
+       polygon.  Points and multipoints are returned unchanged.
+       Inputs:
+          geometry - esri json dictionary or common.geometry object
+          tolerance - maximum deviation for douglas-peucker, smallest
+                      triangle area for visvalingam
+          method - douglas-peucker or visvalingam
+       Output:
+          generalized geometry of the same type
+    """
+    if method not in METHODS:
+        raise AttributeError("method must be one of: %s" % ", ".join(METHODS))
+    if geometry is None:
+        return None
+    key, parts = _kind(geometry)
+    if key not in ("rings", "paths"):
+        return geometry
+    func = douglas_peucker if method == "douglas-peucker" else visvalingam
+    ring = key == "rings"
+    parts = [func(part, tolerance, ring=ring) for part in parts]
+    return _rebuild(geometry, key, parts)
+#----------------------------------------------------------------------
+def clean(geometry, tolerance=0.0):
+    """
+       removes duplicate vertices (vertices within tolerance of the
+       previous one), closes and orients the rings of polygons and drops
+       parts that are left without a length or area
+       Inputs:
+          geometry - esri json dictionary or common.geometry object
+          tolerance - distance below which consecutive vertices are
+                      duplicates
+       Output:
+          cleaned geometry of the same type
+    """
+    if geometry is None:
+        return None
+    key, parts = _kind(geometry)
+    if key is None:
+        return geometry
+    if key == "points":
+        return _rebuild(geometry, key, parts)
+    parts = [remove_duplicates(part, tolerance) for part in parts]
+    if key == "rings":
+        parts = [close_ring(part) for part in parts]
+        parts = [part for part in parts \
+                 if len(part) >= 4 and signed_area(part) != 0]
+        parts = orient_rings(parts)
+    else:
+        parts = [part for part in parts if len(part) >= 2]
+    return _rebuild(geometry, key, parts)
+########################################################################
+class GeometryPreprocessor(object):
+    """
+       Cleans and optionally generalizes the geometry of features before
+       they are sent in edits.  Instances are callables that take an esri
+       json feature dictionary and return the processed feature; pass one
+       as the preprocess argument of agol.bulkload.BulkLoader or
+       FeatureLayer.addFeatures.
+
+       Inputs:
+          tolerance - generalization tolerance, None only cleans
+          method - douglas-peucker or visvalingam
+          duplicate_tolerance - distance below which consecutive vertices
+                                are duplicates
+          clean - if True, duplicates are removed and rings are closed and
+                  oriented
+    """
+    _tolerance = None
+    _method = None
+    _duplicate_tolerance = None
+    _clean = None
+    #----------------------------------------------------------------------
+    def __init__(self, tolerance=None, method="douglas-peucker",
+                 duplicate_tolerance=0.0, clean=True):
+        """Constructor"""
+        if method not in METHODS:
+            raise AttributeError("method must be one of: %s" % ", ".join(METHODS))
+        self._tolerance = tolerance
+        self._method = method
+        self._duplicate_tolerance = duplicate_tolerance
+        self._clean = clean
+    #----------------------------------------------------------------------
+    def process(self, geometry):
+        """ returns the processed geometry """
+        if geometry is None:
+            return None
+        if self._clean:
+            geometry = clean(geometry, self._duplicate_tolerance)
+        if self._tolerance is not None:
+            geometry = generalize(geometry, self._tolerance, self._method)
+        return geometry
+    #----------------------------------------------------------------------
+    def __call__(self, feature):
+        """ returns the feature with its geometry processed """
+        if feature.get('geometry', None) is None:
+            return feature
+        feature = dict(feature)
+        feature['geometry'] = self.process(feature['geometry'])
+        return feature
@@ -1,9 +1,23 @@
 import os
+import sys
 import json
-import arcpy
+from array import array
+from _arcpy import arcpy, is_arcpy_geometry
 import types
 import general
 from .._abstract import abstract
+_NAN = float('nan')
+#----------------------------------------------------------------------
+def _numpy(load=True):
+    """ returns numpy, or None when it is not installed.  With load
+        False, numpy is only returned when it is imported already. """
+    if not load:
+        return sys.modules.get('numpy', None)
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
 ########################################################################
 class SpatialReference(abstract.AbstractGeometry):
     """ creates a spatial reference instance """
@@ -40,21 +54,19 @@ class Point(abstract.AbstractGeometry):
            z - is the Z coordinate value
            m - m value
     """
-    _x = None
-    _y = None
-    _z = None
-    _m = None
-    _wkid = None
-    _json = None
-    _geom = None
-    _dict = None
+    __slots__ = ('_x', '_y', '_z', '_m', '_wkid', '_geom')
     #----------------------------------------------------------------------
     def __init__(self, coord, wkid, z=None, m=None):
         """Constructor"""
-        if isinstance(coord, list):
+        self._x = None
+        self._y = None
+        self._z = None
+        self._m = None
+        self._geom = None
+        if isinstance(coord, (list, tuple)):
             self._x = float(coord[0])
             self._y = float(coord[1])
-        elif isinstance(coord, arcpy.Geometry):
+        elif is_arcpy_geometry(coord):
             self._x = coord.centroid.X
             self._y = coord.centroid.Y
             self._z = coord.centroid.Z
@@ -67,6 +79,19 @@ class Point(abstract.AbstractGeometry):
         if not m is None:
             self._m = m
     #----------------------------------------------------------------------
+    def __getstate__(self):
+        """ returns the attributes to pickle, pickle protocols 0 and 1
+            cannot read __slots__ """
+        state = dict(getattr(self, '__dict__', {}))
+        for name in self.__slots__:
+            state[name] = getattr(self, name, None)
+        return state
+    #----------------------------------------------------------------------
+    def __setstate__(self, state):
+        """ restores the pickled attributes """
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+    #----------------------------------------------------------------------
     def __str__(self):
         """ returns the object as a string """
         return json.dumps(self.asDictionary,
@@ -85,12 +110,8 @@ class Point(abstract.AbstractGeometry):
     @property
     def asJSON(self):
         """ returns a geometry as JSON """
-        value = self._json
-        if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=general._date_handler)
-            self._json = value
-        return self._json
+        return json.dumps(self.asDictionary,
+                          default=general._date_handler)
     #----------------------------------------------------------------------
     @property
     def asArcPyObject(self):
@@ -108,7 +129,7 @@ class Point(abstract.AbstractGeometry):
         if not self._z is None:
             template['z'] = self._z
         if not self._m is None:
-            template['z'] = self._m
+            template['m'] = self._m
         return template
     #----------------------------------------------------------------------
     @property
@@ -169,44 +190,155 @@ class Point(abstract.AbstractGeometry):
                               long)):
             self._wkid = value
 ########################################################################
-class MultiPoint(abstract.AbstractGeometry):
-    """ Implements the ArcGIS JSON MultiPoint Geometry Object """
-    _geom = None
-    _json = None
-    _dict = None
+class _PartGeometry(abstract.AbstractGeometry):
+    """
+       Base of the geometries made of parts of vertices (MultiPoint,
+       Polyline and Polygon).  The vertices of all parts are kept in one
+       array of doubles, x, y[, z][, m] per vertex, and partOffsets holds
+       the index of the first vertex of every part followed by the number
+       of vertices.  coordinates returns the array as a (vertices,
+       dimensions) numpy view when numpy is installed.
+    """
     _wkid = None
-    _points = None
-    _hasZ = False
-    _hasM = False
+    _hasZ = None
+    _hasM = None
+    _coords = None
+    _offsets = None
+    _dims = None
+    _missing = None
+    #----------------------------------------------------------------------
+    def _row(self, vertex):
+        """ returns the coordinates of a vertex as a list """
+        if isinstance(vertex, Point):
+            if self._hasZ or self._hasM:
+                row = [vertex.X, vertex.Y]
+                if self._hasZ:
+                    row.append(vertex.Z)
+                if self._hasM:
+                    row.append(vertex._m)
+                return row
+            return vertex.asList
+        return vertex
+    #----------------------------------------------------------------------
+    def _load(self, parts):
+        """ stores the vertices of a list of parts """
+        rows = [[self._row(v) for v in part] for part in parts]
+        dims = 2
+        if self._hasZ:
+            dims += 1
+        if self._hasM:
+            dims += 1
+        if not self._hasZ and not self._hasM:
+            for part in rows:
+                for row in part:
+                    if len(row) > dims:
+                        dims = min(len(row), 4)
+        coords = array('d')
+        offsets = array('l', [0])
+        missing = False
+        for part in rows:
+            for row in part:
+                if len(row) == dims and not None in row:
+                    coords.extend(row)
+                else:
+                    row = list(row[:dims]) + [None] * (dims - len(row))
+                    coords.extend([_NAN if v is None else v for v in row])
+                    missing = True
+            offsets.append(offsets[-1] + len(part))
+        self._coords = coords
+        self._offsets = offsets
+        self._dims = dims
+        self._missing = missing
+    #----------------------------------------------------------------------
+    @property
+    def coordinates(self):
+        """ returns the vertices as a (vertices, dimensions) numpy array
+            view, or as the flat array of doubles without numpy """
+        np = _numpy()
+        if np is None:
+            return self._coords
+        view = np.frombuffer(self._coords, dtype=np.float64) \
+            if len(self._coords) > 0 else np.zeros(0)
+        return view.reshape(-1, self._dims)
+    #----------------------------------------------------------------------
+    @property
+    def partOffsets(self):
+        """ returns the index of the first vertex of every part, followed
+            by the number of vertices """
+        return list(self._offsets)
+    #----------------------------------------------------------------------
+    @property
+    def dimensions(self):
+        """ returns the number of values per vertex """
+        return self._dims
+    #----------------------------------------------------------------------
+    @property
+    def pointCount(self):
+        """ returns the number of vertices """
+        return self._offsets[-1]
+    #----------------------------------------------------------------------
+    def _parts(self):
+        """ returns the parts as lists of coordinate lists """
+        dims = self._dims
+        offsets = self._offsets
+        # numpy is faster for large geometries, but not worth importing
+        # just to serialize one
+        if _numpy(load=False) is not None and len(self._coords) > 0:
+            values = self.coordinates
+            parts = [values[offsets[i]:offsets[i + 1]].tolist() \
+                     for i in xrange(len(offsets) - 1)]
+        else:
+            values = self._coords.tolist()
+            parts = [[values[j:j + dims] \
+                      for j in xrange(offsets[i] * dims, offsets[i + 1] * dims, dims)] \
+                     for i in xrange(len(offsets) - 1)]
+        if self._missing:
+            parts = [[[None if v != v else v for v in row] for row in part] \
+                     for part in parts]
+        return parts
+    #----------------------------------------------------------------------
+    def _with_coordinates(self, coords, wkid):
+        """ returns a copy of the geometry with new vertex values, coords
+            is an array of doubles laid out like the vertices """
+        geom = object.__new__(type(self))
+        geom._wkid = wkid
+        geom._hasZ = self._hasZ
+        geom._hasM = self._hasM
+        geom._coords = coords
+        geom._offsets = array('l', self._offsets)
+        geom._dims = self._dims
+        geom._missing = self._missing
+        return geom
+    #----------------------------------------------------------------------
+    @property
+    def spatialReference(self):
+        """returns the geometry spatial reference"""
+        return {'wkid' : self._wkid}
+    #----------------------------------------------------------------------
+    @property
+    def asJSON(self):
+        """ returns a geometry as JSON """
+        return json.dumps(self.asDictionary,
+                          default=general._date_handler)
+########################################################################
+class MultiPoint(_PartGeometry):
+    """ Implements the ArcGIS JSON MultiPoint Geometry Object """
     #----------------------------------------------------------------------
     def __init__(self, points, wkid, hasZ=False, hasM=False):
         """Constructor"""
-        if isinstance(points, list):
-            self._points = points
-        elif isinstance(points, arcpy.Geometry):
-            self._points = self.__geomToPointList(points)
         self._wkid = wkid
         self._hasZ = hasZ
         self._hasM = hasM
+        if isinstance(points, list):
+            self._load([points])
+        elif is_arcpy_geometry(points):
+            self._load(self.__geomToPointList(points))
     #----------------------------------------------------------------------
     def __geomToPointList(self, geom):
-        """ converts a geometry object to a common.Geometry object """
-        if isinstance(geom, arcpy.Multipoint):
-            feature_geom = []
-            fPart = []
-            for part in geom:
-                fPart = []
-                for pnt in part:
-                    fPart.append(Point(coord=[pnt.X, pnt.Y],
-                          wkid=geom.spatialReference.factoryCode,
-                          z=pnt.Z, m=pnt.M))
-                feature_geom.append(fPart)
-            return feature_geom
-    #----------------------------------------------------------------------
-    @property
-    def spatialReference(self):
-        """returns the geometry spatial reference"""
-        return {'wkid' : self._wkid}
+        """ converts a geometry object to a list of coordinate lists """
+        if geom.spatialReference is not None:
+            self._wkid = geom.spatialReference.factoryCode
+        return [json.loads(geom.JSON)['points']]
     #----------------------------------------------------------------------
     @property
     def type(self):
@@ -214,16 +346,6 @@ class MultiPoint(abstract.AbstractGeometry):
         return "esriGeometryMultipoint"
     #----------------------------------------------------------------------
     @property
-    def asJSON(self):
-        """ returns a geometry as JSON """
-        value = self._json
-        if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=general._date_handler)
-            self._json = value
-        return self._json
-    #----------------------------------------------------------------------
-    @property
     def asArcPyObject(self):
         """ returns the Point as an ESRI arcpy.MultiPoint object """
         return arcpy.AsShape(self.asDictionary, True)
@@ -231,21 +353,14 @@ class MultiPoint(abstract.AbstractGeometry):
     @property
     def asDictionary(self):
         """ returns the object as a python dictionary """
-        #
-        value = self._dict
-        if value is None:
-            template = {
-                "hasM" : self._hasM,
-                "hasZ" : self._hasZ,
-                "points" : [],
-                "spatialReference" : {"wkid" : self._wkid}
-            }
-            for pt in self._points:
-                template['points'].append(pt.asList)
-            self._dict = template
-        return self._dict
+        return {
+            "hasM" : self._hasM,
+            "hasZ" : self._hasZ,
+            "points" : self._parts()[0],
+            "spatialReference" : {"wkid" : self._wkid}
+        }
 ########################################################################
-class Polyline(abstract.AbstractGeometry):
+class Polyline(_PartGeometry):
     """ Implements the ArcGIS REST API Polyline Object
         Inputs:
            paths - list - list of lists of Point objects
@@ -253,46 +368,22 @@ class Polyline(abstract.AbstractGeometry):
            hasZ - boolean -
            hasM - boolean -
     """
-    _paths = None
-    _wkid = None
-    _json = None
-    _dict = None
-    _geom = None
-    _hasZ = None
-    _hasM = None
     #----------------------------------------------------------------------
     def __init__(self, paths, wkid, hasZ=False, hasM=False):
         """Constructor"""
-        if isinstance(paths, list):
-            self._paths = paths
-        elif isinstance(paths, arcpy.Geometry):
-            self._paths = self.__geomToPointList(paths)
         self._wkid = wkid
         self._hasM = hasM
         self._hasZ = hasZ
+        if isinstance(paths, list):
+            self._load(paths)
+        elif is_arcpy_geometry(paths):
+            self._load(self.__geomToPointList(paths))
     #----------------------------------------------------------------------
     def __geomToPointList(self, geom):
-        """ converts a geometry object to a common.Geometry object """
-        if isinstance(geom, arcpy.Polyline):
-            feature_geom = []
-            fPart = []
-            for part in geom:
-                fPart = []
-                for pnt in part:
-                    if geom.spatialReference is None:
-                        wkid = self._wkid
-                    else:
-                        wkid = geom.spatialReference.factoryCode
-                    fPart.append(Point(coord=[pnt.X, pnt.Y],
-                          wkid=wkid,
-                          z=pnt.Z, m=pnt.M))
-                feature_geom.append(fPart)
-            return feature_geom
-    #----------------------------------------------------------------------
-    @property
-    def spatialReference(self):
-        """returns the geometry spatial reference"""
-        return {'wkid' : self._wkid}
+        """ converts a geometry object to a list of paths """
+        if geom.spatialReference is not None:
+            self._wkid = geom.spatialReference.factoryCode
+        return json.loads(geom.JSON)['paths']
     #----------------------------------------------------------------------
     @property
     def type(self):
@@ -300,16 +391,6 @@ class Polyline(abstract.AbstractGeometry):
         return "esriGeometryPolyline"
     #----------------------------------------------------------------------
     @property
-    def asJSON(self):
-        """ returns a geometry as JSON """
-        value = self._json
-        if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=general._date_handler)
-            self._json = value
-        return self._json
-    #----------------------------------------------------------------------
-    @property
     def asArcPyObject(self):
         """ returns the Polyline as an ESRI arcpy.Polyline object """
         return arcpy.AsShape(self.asDictionary, True)
@@ -317,80 +398,32 @@ class Polyline(abstract.AbstractGeometry):
     @property
     def asDictionary(self):
         """ returns the object as a python dictionary """
-        value = self._dict
-        if value is None:
-            template = {
-                "hasM" : self._hasM,
-                "hasZ" : self._hasZ,
-                "paths" : [],
-                "spatialReference" : {"wkid" : self._wkid}
-            }
-            for part in self._paths:
-                lpart = []
-                for pt in part:
-                    lpart.append(pt.asList)
-                template['paths'].append(lpart)
-                del lpart
-            self._dict = template
-        return self._dict
+        return {
+            "hasM" : self._hasM,
+            "hasZ" : self._hasZ,
+            "paths" : self._parts(),
+            "spatialReference" : {"wkid" : self._wkid}
+        }
 ########################################################################
-class Polygon(abstract.AbstractGeometry):
+class Polygon(_PartGeometry):
     """ Implements the ArcGIS REST JSON for Polygon Object """
-    _rings = None
-    _wkid = None
-    _json = None
-    _dict = None
-    _geom = None
-    _hasZ = None
-    _hasM = None
     #----------------------------------------------------------------------
     def __init__(self, rings, wkid, hasZ=False, hasM=False):
         """Constructor"""
-        if isinstance(rings, list):
-            self._rings = rings
-        elif isinstance(rings, arcpy.Geometry):
-            self._rings = self.__geomToPointList(rings)
-##            self._json = rings.JSON
-##            self._dict = _unicode_convert(json.loads(self._json))
         self._wkid = wkid
         self._hasM = hasM
         self._hasZ = hasZ
+        if isinstance(rings, list):
+            self._load(rings)
+        elif is_arcpy_geometry(rings):
+            self._load(self.__geomToPointList(rings))
     #----------------------------------------------------------------------
     def __geomToPointList(self, geom):
-        """ converts a geometry object to a common.Geometry object """
+        """ converts a geometry object to a list of rings """
         sr = geom.spatialReference
-        if sr is None:
-            wkid = self._wkid
-        else:
-            wkid = sr.factoryCode
-        g = json.loads(geom.JSON)
-        top = []
-        for gring in g['rings']:
-            ring = []
-            for g in gring:
-                ring.append(Point(coord=g, wkid=wkid, z=None, m=None))
-            top.append(ring)
-        return top
-        #if isinstance(geom, arcpy.Polygon):
-            #feature_geom = []
-            #fPart = []
-            #for part in geom:
-                #fPart = []
-                #for pnt in part:
-                    #if geom.spatialReference is None:
-                        #wkid = self._wkid
-                    #else:
-                        #wkid = geom.spatialReference.factoryCode
-                    #fPart.append(Point(coord=[pnt.X, pnt.Y],
-                          #wkid=wkid,
-                          #z=pnt.Z, m=pnt.M))
-                #feature_geom.append(fPart)
-            #return feature_geom
-    #----------------------------------------------------------------------
-    @property
-    def spatialReference(self):
-        """returns the geometry spatial reference"""
-        return {'wkid' : self._wkid}
+        if sr is not None:
+            self._wkid = sr.factoryCode
+        return json.loads(geom.JSON)['rings']
     #----------------------------------------------------------------------
     @property
     def type(self):
@@ -398,16 +431,6 @@ class Polygon(abstract.AbstractGeometry):
         return "esriGeometryPolygon"
     #----------------------------------------------------------------------
     @property
-    def asJSON(self):
-        """ returns a geometry as JSON """
-        value = self._json
-        if value is None:
-            value = json.dumps(self.asDictionary,
-                               default=general._date_handler)
-            self._json = value
-        return self._json
-    #----------------------------------------------------------------------
-    @property
     def asArcPyObject(self):
         """ returns the Polyline as an ESRI arcpy.Polyline object """
         return arcpy.AsShape(self.asDictionary, True)
@@ -415,25 +438,12 @@ class Polygon(abstract.AbstractGeometry):
     @property
     def asDictionary(self):
         """ returns the object as a python dictionary """
-        value = self._dict
-        if value is None:
-            template = {
-                "hasM" : self._hasM,
-                "hasZ" : self._hasZ,
-                "rings" : [],
-                "spatialReference" : {"wkid" : self._wkid}
-            }
-            for part in self._rings:
-                lpart = []
-                for pt in part:
-                    if isinstance(pt, list):
-                        lpart.append(pt)
-                    elif isinstance(pt, Point):
-                        lpart.append(pt.asList)
-                template['rings'].append(lpart)
-                del lpart
-            self._dict = template
-        return self._dict
+        return {
+            "hasM" : self._hasM,
+            "hasZ" : self._hasZ,
+            "rings" : self._parts(),
+            "spatialReference" : {"wkid" : self._wkid}
+        }
 ########################################################################
 class Envelope(abstract.AbstractGeometry):
     """
@@ -0,0 +1,101 @@
+"""
+   Helpers to run many independent REST requests concurrently.
+
+   Requests are I/O bound, so plain threads are used.  Input items are
+   pulled from the (possibly lazy) iterable by the calling thread only, and
+   never more than max_pending items are in flight, which keeps memory
+   bounded no matter how large the input is.
+"""
+import time
+import Queue
+import threading
+#----------------------------------------------------------------------
+def _worker(func, in_queue, out_queue):
+    """ processes items until the None sentinel is received """
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+        try:
+            out_queue.put((item, func(item), None))
+        except Exception, e:
+            out_queue.put((item, None, e))
+#----------------------------------------------------------------------
+def imap_bounded(func, items, max_workers=4, max_pending=None):
+    """
+       calls func on every item using a pool of worker threads
+       Inputs:
+          func - callable taking a single item
+          items - iterable or generator of items.  It is only consumed by
+                  the calling thread.
+          max_workers - number of worker threads
+          max_pending - maximum number of items queued or running at any
+                        time.  Default is twice the number of workers.
+       Output:
+          generator of (item, result, error) tuples in completion order.
+          error is the exception raised by func or None.
+    """
+    if max_workers < 1:
+        max_workers = 1
+    if max_pending is None or max_pending < max_workers:
+        max_pending = max_workers * 2
+    in_queue = Queue.Queue()
+    out_queue = Queue.Queue()
+    threads = []
+    for i in xrange(max_workers):
+        t = threading.Thread(target=_worker,
+                             args=(func, in_queue, out_queue))
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    pending = 0
+    try:
+        for item in items:
+            while pending >= max_pending:
+                yield out_queue.get()
+                pending -= 1
+            in_queue.put(item)
+            pending += 1
+            while pending > 0:
+                try:
+                    res = out_queue.get_nowait()
+                except Queue.Empty:
+                    break
+                pending -= 1
+                yield res
+        while pending > 0:
+            yield out_queue.get()
+            pending -= 1
+    finally:
+        for t in threads:
+            in_queue.put(None)
+        for t in threads:
+            t.join()
+#----------------------------------------------------------------------
+def retry_call(func, args=(), kwargs=None, retries=3, backoff=1.0,
+               retry_on=(Exception,)):
+    """
+       calls func and retries it with exponential backoff when it raises
+       Inputs:
+          func - callable to run
+          args - positional arguments for func
+          kwargs - keyword arguments for func
+          retries - number of retries after the first attempt
+          backoff - seconds to wait before the first retry, doubled on
+                    every following retry
+          retry_on - tuple of exception types that trigger a retry
+       Output:
+          value returned by func.  The last exception is re-raised once
+          the retries are exhausted.
+    """
+    if kwargs is None:
+        kwargs = {}
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except retry_on:
+            if attempt >= retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
@@ -0,0 +1,323 @@
+"""
+   Decoder for query responses in the ArcGIS protocol buffer format
+   (f=pbf, esriPBuffer.FeatureCollectionPBuffer).
+
+   Only the wire format is needed, so no protobuf package is required.
+   Geometries are quantized and delta encoded in the payload; they are
+   converted back to real coordinates while decoding.  The result is a
+   dictionary shaped like the JSON response of the query operation, or a
+   column oriented dictionary for large extracts.
+"""
+import struct
+_DOUBLE = struct.Struct('<d').unpack_from
+_FLOAT = struct.Struct('<f').unpack_from
+_GEOMETRY_TYPES = {0 : "esriGeometryPoint",
+                   1 : "esriGeometryMultipoint",
+                   2 : "esriGeometryPolyline",
+                   3 : "esriGeometryPolygon",
+                   4 : "esriGeometryMultiPatch",
+                   127 : "esriGeometryNull"}
+_FIELD_TYPES = ["esriFieldTypeSmallInteger", "esriFieldTypeInteger",
+                "esriFieldTypeSingle", "esriFieldTypeDouble",
+                "esriFieldTypeString", "esriFieldTypeDate",
+                "esriFieldTypeOID", "esriFieldTypeGeometry",
+                "esriFieldTypeBlob", "esriFieldTypeRaster",
+                "esriFieldTypeGUID", "esriFieldTypeGlobalID",
+                "esriFieldTypeXML"]
+#----------------------------------------------------------------------
+def _varint(buf, pos):
+    """ reads a varint, returns (value, new position) """
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    result = b & 0x7f
+    shift = 7
+    pos += 1
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+#----------------------------------------------------------------------
+def _fields(buf, pos, end):
+    """
+       yields (field number, wire type, value) for the fields of a
+       message.  value is the integer of a varint, the (start, end) of a
+       length delimited field, or the position of a fixed size field.
+    """
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        number = key >> 3
+        wire = key & 7
+        if wire == 0:
+            value, pos = _varint(buf, pos)
+        elif wire == 2:
+            size, pos = _varint(buf, pos)
+            value = (pos, pos + size)
+            pos += size
+        elif wire == 1:
+            value = pos
+            pos += 8
+        elif wire == 5:
+            value = pos
+            pos += 4
+        else:
+            raise ValueError("unsupported protocol buffer wire type %s" % wire)
+        yield number, wire, value
+#----------------------------------------------------------------------
+def _string(buf, span):
+    """ decodes a length delimited utf-8 string """
+    return str(buf[span[0]:span[1]]).decode('utf-8')
+#----------------------------------------------------------------------
+def _signed64(value):
+    """ converts an unsigned varint to a two's complement int64 """
+    if value >= 0x8000000000000000:
+        value -= 0x10000000000000000
+    return value
+#----------------------------------------------------------------------
+def _packed(buf, span, zigzag=False):
+    """ decodes a packed repeated varint field """
+    pos, end = span
+    values = []
+    append = values.append
+    while pos < end:
+        b = buf[pos]
+        if b < 0x80:
+            value = b
+            pos += 1
+        else:
+            value, pos = _varint(buf, pos)
+        if zigzag:
+            value = (value >> 1) ^ -(value & 1)
+        append(value)
+    return values
+#----------------------------------------------------------------------
+def _value(buf, span):
+    """ decodes a Value message """
+    for number, wire, value in _fields(buf, span[0], span[1]):
+        if number == 1:
+            return _string(buf, value)
+        elif number == 2:
+            return _FLOAT(buf, value)[0]
+        elif number == 3:
+            return _DOUBLE(buf, value)[0]
+        elif number in (4, 8):
+            return (value >> 1) ^ -(value & 1)
+        elif number in (5, 7):
+            return value
+        elif number == 6:
+            return _signed64(value)
+        elif number == 9:
+            return value != 0
+    return None
+#----------------------------------------------------------------------
+def _transform(buf, span):
+    """ decodes a Transform message """
+    transform = {"originPosition" : "upperLeft",
+                 "scale" : [1.0, 1.0, 1.0, 1.0],
+                 "translate" : [0.0, 0.0, 0.0, 0.0]}
+    for number, wire, value in _fields(buf, span[0], span[1]):
+        if number == 1:
+            if value == 1:
+                transform['originPosition'] = "lowerLeft"
+        elif number in (2, 3):
+            # Scale and Translate: x, y, m, z doubles
+            key = "scale" if number == 2 else "translate"
+            for n, w, v in _fields(buf, value[0], value[1]):
+                index = {1 : 0, 2 : 1, 3 : 3, 4 : 2}.get(n, None)
+                if index is not None:
+                    transform[key][index] = _DOUBLE(buf, v)[0]
+    return transform
+#----------------------------------------------------------------------
+def _spatial_reference(buf, span):
+    """ decodes a SpatialReference message """
+    sr = {}
+    names = {1 : "wkid", 2 : "latestWkid", 3 : "vcsWkid",
+             4 : "latestVcsWkid"}
+    for number, wire, value in _fields(buf, span[0], span[1]):
+        if number in names:
+            sr[names[number]] = value
+        elif number == 5:
+            sr['wkt'] = _string(buf, value)
+    return sr
+#----------------------------------------------------------------------
+def _field(buf, span):
+    """ decodes a Field message """
+    # zero values are left out of the payload, so a missing type is the
+    # first one
+    field = {"type" : _FIELD_TYPES[0]}
+    for number, wire, value in _fields(buf, span[0], span[1]):
+        if number == 1:
+            field['name'] = _string(buf, value)
+        elif number == 2:
+            if value < len(_FIELD_TYPES):
+                field['type'] = _FIELD_TYPES[value]
+        elif number == 3:
+            field['alias'] = _string(buf, value)
+    return field
+#----------------------------------------------------------------------
+def _geometry(buf, span, geometry_type, has_z, has_m, transform):
+    """ decodes a Geometry message into an esri json geometry """
+    lengths = None
+    coords = []
+    for number, wire, value in _fields(buf, span[0], span[1]):
+        if number == 2:
+            lengths = _packed(buf, value)
+        elif number == 3:
+            coords = _packed(buf, value, zigzag=True)
+    sx, sy, sz, sm = transform['scale']
+    tx, ty, tz, tm = transform['translate']
+    if transform['originPosition'] == "upperLeft":
+        sy = -sy
+    x = 0
+    y = 0
+    z = 0
+    m = 0
+    vertices = []
+    append = vertices.append
+    if not has_z and not has_m:
+        for i in xrange(0, len(coords), 2):
+            x += coords[i]
+            y += coords[i + 1]
+            append([tx + x * sx, ty + y * sy])
+    else:
+        stride = 2 + has_z + has_m
+        for i in xrange(0, len(coords), stride):
+            x += coords[i]
+            y += coords[i + 1]
+            vertex = [tx + x * sx, ty + y * sy]
+            if has_z:
+                z += coords[i + 2]
+                vertex.append(tz + z * sz)
+            if has_m:
+                m += coords[i + stride - 1]
+                vertex.append(tm + m * sm)
+            append(vertex)
+    if geometry_type == "esriGeometryPoint":
+        if len(vertices) == 0:
+            return None
+        vertex = vertices[0]
+        point = {"x" : vertex[0], "y" : vertex[1]}
+        if has_z:
+            point['z'] = vertex[2]
+        if has_m:
+            point['m'] = vertex[-1]
+        return point
+    elif geometry_type == "esriGeometryMultipoint":
+        return {"points" : vertices}
+    if lengths is None:
+        lengths = [len(vertices)]
+    parts = []
+    start = 0
+    for length in lengths:
+        parts.append(vertices[start:start + length])
+        start += length
+    if geometry_type == "esriGeometryPolygon":
+        return {"rings" : parts}
+    return {"paths" : parts}
+#----------------------------------------------------------------------
+def _feature_result(buf, span, columnar):
+    """ decodes a FeatureResult message """
+    result = {"fields" : [], "features" : []}
+    transform = {"originPosition" : "upperLeft",
+                 "scale" : [1.0, 1.0, 1.0, 1.0],
+                 "translate" : [0.0, 0.0, 0.0, 0.0]}
+    geometry_type = None
+    names = []
+    columns = None
+    geometries = []
+    for number, wire, value in _fields(buf, span[0], span[1]):
+        if number == 1:
+            result['objectIdFieldName'] = _string(buf, value)
+        elif number == 3:
+            result['globalIdFieldName'] = _string(buf, value)
+        elif number == 7:
+            geometry_type = _GEOMETRY_TYPES.get(value, None)
+            result['geometryType'] = geometry_type
+        elif number == 8:
+            result['spatialReference'] = _spatial_reference(buf, value)
+        elif number == 9:
+            result['exceededTransferLimit'] = value != 0
+        elif number == 10:
+            result['hasZ'] = value != 0
+        elif number == 11:
+            result['hasM'] = value != 0
+        elif number == 12:
+            transform = _transform(buf, value)
+        elif number == 13:
+            field = _field(buf, value)
+            result['fields'].append(field)
+            names.append(field.get('name', None))
+        elif number == 15:
+            # hasZ/hasM precede the features in the payload
+            has_z = result.get('hasZ', False)
+            has_m = result.get('hasM', False)
+            values = []
+            geometry = None
+            for n, w, v in _fields(buf, value[0], value[1]):
+                if n == 1:
+                    values.append(_value(buf, v))
+                elif n == 2:
+                    if geometry_type is None:
+                        # the point type is 0, which is left out of the
+                        # payload like every zero value
+                        geometry_type = _GEOMETRY_TYPES[0]
+                        result['geometryType'] = geometry_type
+                    geometry = _geometry(buf, v, geometry_type, has_z,
+                                         has_m, transform)
+            if columnar:
+                if columns is None:
+                    columns = dict([(name, []) for name in names])
+                for name, val in zip(names, values):
+                    columns[name].append(val)
+                geometries.append(geometry)
+            else:
+                feature = {"attributes" : dict(zip(names, values))}
+                if geometry is not None:
+                    feature['geometry'] = geometry
+                result['features'].append(feature)
+    if columnar:
+        del result['features']
+        result['columns'] = columns or dict([(name, []) for name in names])
+        result['geometries'] = geometries
+    return result
+#----------------------------------------------------------------------
+def decode(data, columnar=False):
+    """
+       decodes a f=pbf query response
+       Inputs:
+          data - the response body (str or bytearray)
+          columnar - if True, attributes are returned as one list per
+                     field under 'columns' and the geometries as a list
+                     under 'geometries' instead of a list of features
+       Output:
+          dictionary shaped like the JSON query response.  Count and
+          object id queries return {"count" : n} and
+          {"objectIdFieldName" : name, "objectIds" : [...]}.
+    """
+    buf = bytearray(data)
+    result = {}
+    for number, wire, value in _fields(buf, 0, len(buf)):
+        if number == 2:
+            for n, w, v in _fields(buf, value[0], value[1]):
+                if n == 1:
+                    result = _feature_result(buf, v, columnar)
+                elif n == 2:
+                    for n2, w2, v2 in _fields(buf, v[0], v[1]):
+                        if n2 == 1:
+                            result = {"count" : v2}
+                    if result == {}:
+                        result = {"count" : 0}
+                elif n == 3:
+                    result = {"objectIds" : []}
+                    for n2, w2, v2 in _fields(buf, v[0], v[1]):
+                        if n2 == 1:
+                            result['objectIdFieldName'] = _string(buf, v2)
+                        elif n2 == 3:
+                            if w2 == 2:
+                                result['objectIds'].extend(_packed(buf, v2))
+                            else:
+                                result['objectIds'].append(v2)
+    return result
@@ -0,0 +1,610 @@
+"""
+   Local spatial predicates and point in polygon tests.
+
+   intersects, contains and within test the relation of two geometries on
+   the client, without GeometryService.relation or a query with a
+   GeometryFilter.  relate tests a whole list of geometries, such as the
+   geometries of a columnar query result (FeatureLayer.query_columns), at
+   once, and PolygonIndex joins large numbers of points to polygons with
+   an STR packed R-tree over the polygon envelopes.
+
+   Geometries are common.geometry objects or esri json dictionaries in the
+   same spatial reference.  The tests are planar and vectorized with
+   numpy.  Polygons use the even-odd rule, so holes and multiple exterior
+   rings are handled without looking at the ring orientation.
+"""
+import math
+from .._abstract.abstract import AbstractGeometry
+
+RELATIONS = ("intersects", "contains", "within")
+# number of array elements evaluated at once by the chunked tests
+_CHUNK = 1 << 20
+#----------------------------------------------------------------------
+def _numpy():
+    """ imports numpy, raising a clear error when it is missing """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required for spatial predicates, " + \
+                          "but it could not be imported.")
+    return numpy
+#----------------------------------------------------------------------
+def _as_dict(geometry):
+    """ returns the esri json dictionary of a geometry, envelopes are
+        returned as polygons """
+    if isinstance(geometry, AbstractGeometry):
+        geometry = geometry.asDictionary
+    if geometry is not None and 'xmin' in geometry:
+        if geometry['xmin'] is None:
+            return None
+        xmin, ymin = geometry['xmin'], geometry['ymin']
+        xmax, ymax = geometry['xmax'], geometry['ymax']
+        return {"rings" : [[[xmin, ymin], [xmin, ymax], [xmax, ymax],
+                            [xmax, ymin], [xmin, ymin]]]}
+    return geometry
+########################################################################
+class Shape(object):
+    """
+       A geometry prepared for the predicates: its vertices, its segments
+       as (x0, y0, x1, y1) rows and its envelope.  Prepare a geometry that
+       is tested many times once with prepare().
+    """
+    kind = None
+    x = None
+    y = None
+    segments = None
+    box = None
+    #----------------------------------------------------------------------
+    def __init__(self, kind, x, y, segments):
+        """Constructor"""
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.segments = segments
+        self.box = (float(x.min()), float(y.min()),
+                    float(x.max()), float(y.max()))
+#----------------------------------------------------------------------
+def _segments(parts, close):
+    """ returns the segments of a list of vertex arrays """
+    np = _numpy()
+    segments = []
+    for part in parts:
+        if close and len(part) > 0 and \
+           (part[0, 0] != part[-1, 0] or part[0, 1] != part[-1, 1]):
+            part = np.vstack([part, part[:1]])
+        if len(part) > 1:
+            segments.append(np.hstack([part[:-1], part[1:]]))
+    if len(segments) == 0:
+        return np.zeros((0, 4))
+    return np.vstack(segments)
+#----------------------------------------------------------------------
+def prepare(geometry):
+    """
+       returns the Shape of a common.geometry object or esri json
+       dictionary, or None for an empty geometry
+    """
+    np = _numpy()
+    if isinstance(geometry, Shape):
+        return geometry
+    geometry = _as_dict(geometry)
+    if geometry is None:
+        return None
+    if 'x' in geometry:
+        if geometry['x'] is None:
+            return None
+        return Shape("point", np.array([geometry['x']], dtype=np.float64),
+                     np.array([geometry['y']], dtype=np.float64), None)
+    if 'points' in geometry:
+        kind, close, parts = "point", False, [geometry['points']]
+    elif 'paths' in geometry:
+        kind, close, parts = "line", False, geometry['paths']
+    elif 'rings' in geometry:
+        kind, close, parts = "polygon", True, geometry['rings']
+    else:
+        return None
+    parts = [np.array([v[:2] for v in part], dtype=np.float64).reshape(-1, 2) \
+             for part in parts]
+    parts = [part for part in parts if len(part) > 0]
+    if len(parts) == 0:
+        return None
+    vertices = np.vstack(parts)
+    segments = None
+    if kind != "point":
+        segments = _segments(parts, close)
+    return Shape(kind, vertices[:, 0], vertices[:, 1], segments)
+#----------------------------------------------------------------------
+def _tolerance(a, b):
+    """ returns the distance below which two locations are equal """
+    span = max(a.box[2], b.box[2]) - min(a.box[0], b.box[0]) + \
+           max(a.box[3], b.box[3]) - min(a.box[1], b.box[1])
+    return 1e-10 * span
+#----------------------------------------------------------------------
+def _points_in_rings(x, y, segments):
+    """ returns True for the points inside the rings (even-odd) """
+    np = _numpy()
+    result = np.zeros(len(x), dtype=bool)
+    if segments is None or len(segments) == 0 or len(x) == 0:
+        return result
+    x0, y0, x1, y1 = segments[:, 0], segments[:, 1], segments[:, 2], segments[:, 3]
+    step = max(1, _CHUNK // len(segments))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for start in xrange(0, len(x), step):
+            px = x[start:start + step, None]
+            py = y[start:start + step, None]
+            straddles = (y0 > py) != (y1 > py)
+            xcross = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+            crossings = np.count_nonzero(straddles & (px < xcross), axis=1)
+            result[start:start + step] = crossings % 2 == 1
+    return result
+#----------------------------------------------------------------------
+def _near_segments(x, y, segments, tolerance):
+    """ returns True for the points within tolerance of a segment """
+    np = _numpy()
+    result = np.zeros(len(x), dtype=bool)
+    if segments is None or len(segments) == 0 or len(x) == 0:
+        return result
+    x0, y0 = segments[:, 0], segments[:, 1]
+    dx, dy = segments[:, 2] - x0, segments[:, 3] - y0
+    norm = dx * dx + dy * dy
+    norm[norm == 0] = 1.0
+    step = max(1, _CHUNK // len(segments))
+    for start in xrange(0, len(x), step):
+        px = x[start:start + step, None]
+        py = y[start:start + step, None]
+        t = np.clip(((px - x0) * dx + (py - y0) * dy) / norm, 0.0, 1.0)
+        dist = np.hypot(px - (x0 + t * dx), py - (y0 + t * dy))
+        result[start:start + step] = dist.min(axis=1) <= tolerance
+    return result
+#----------------------------------------------------------------------
+def _near_points(x, y, vx, vy, tolerance):
+    """ returns True for the points within tolerance of a vertex """
+    np = _numpy()
+    result = np.zeros(len(x), dtype=bool)
+    step = max(1, _CHUNK // max(len(vx), 1))
+    for start in xrange(0, len(x), step):
+        dist = np.hypot(x[start:start + step, None] - vx,
+                        y[start:start + step, None] - vy)
+        result[start:start + step] = dist.min(axis=1) <= tolerance
+    return result
+#----------------------------------------------------------------------
+def _segments_intersect(a, b):
+    """ returns True if a segment of a touches or crosses one of b """
+    np = _numpy()
+    if len(a) == 0 or len(b) == 0:
+        return False
+    bx0, by0, bx1, by1 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    step = max(1, _CHUNK // len(b))
+    for start in xrange(0, len(a), step):
+        chunk = a[start:start + step]
+        ax0, ay0 = chunk[:, 0:1], chunk[:, 1:2]
+        ax1, ay1 = chunk[:, 2:3], chunk[:, 3:4]
+        o1 = (ax1 - ax0) * (by0 - ay0) - (ay1 - ay0) * (bx0 - ax0)
+        o2 = (ax1 - ax0) * (by1 - ay0) - (ay1 - ay0) * (bx1 - ax0)
+        o3 = (bx1 - bx0) * (ay0 - by0) - (by1 - by0) * (ax0 - bx0)
+        o4 = (bx1 - bx0) * (ay1 - by0) - (by1 - by0) * (ax1 - bx0)
+        # the envelope test rejects collinear segments that do not overlap
+        hit = (o1 * o2 <= 0) & (o3 * o4 <= 0) & \
+              (np.minimum(ax0, ax1) <= np.maximum(bx0, bx1)) & \
+              (np.minimum(bx0, bx1) <= np.maximum(ax0, ax1)) & \
+              (np.minimum(ay0, ay1) <= np.maximum(by0, by1)) & \
+              (np.minimum(by0, by1) <= np.maximum(ay0, ay1))
+        if hit.any():
+            return True
+    return False
+#----------------------------------------------------------------------
+def _split_midpoints(b, a, tolerance):
+    """
+       splits the segments of b where they meet the segments of a and
+       returns the midpoints of the pieces, which lie either inside or
+       outside of a, as x and y arrays
+    """
+    np = _numpy()
+    if len(a) == 0:
+        return (b[:, 0] + b[:, 2]) / 2, (b[:, 1] + b[:, 3]) / 2
+    qx, qy = a[:, 0], a[:, 1]
+    sx, sy = a[:, 2] - qx, a[:, 3] - qy
+    xs = []
+    ys = []
+    step = max(1, _CHUNK // (4 * len(a)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for start in xrange(0, len(b), step):
+            chunk = b[start:start + step]
+            px, py = chunk[:, 0:1], chunk[:, 1:2]
+            rx, ry = chunk[:, 2:3] - px, chunk[:, 3:4] - py
+            denom = rx * sy - ry * sx
+            t = ((qx - px) * sy - (qy - py) * sx) / denom
+            u = ((qx - px) * ry - (qy - py) * rx) / denom
+            crossing = np.where((denom != 0) & (t >= 0) & (t <= 1) & \
+                                (u >= 0) & (u <= 1), t, np.nan)
+            # vertices of a on the segments of b split them as well, which
+            # covers collinear overlaps
+            norm = rx * rx + ry * ry
+            columns = [np.zeros((len(chunk), 1)), np.ones((len(chunk), 1)), crossing]
+            for ex, ey in ((qx, qy), (a[:, 2], a[:, 3])):
+                tp = ((ex - px) * rx + (ey - py) * ry) / norm
+                dist = np.hypot(ex - (px + tp * rx), ey - (py + tp * ry))
+                columns.append(np.where((tp >= 0) & (tp <= 1) & (dist <= tolerance),
+                                        tp, np.nan))
+            splits = np.sort(np.hstack(columns), axis=1)
+            lower, upper = splits[:, :-1], splits[:, 1:]
+            valid = np.isfinite(upper) & (upper - lower > 1e-12)
+            mid = (lower + upper) / 2
+            rows = np.nonzero(valid)[0]
+            mid = mid[valid]
+            xs.append(px[rows, 0] + mid * rx[rows, 0])
+            ys.append(py[rows, 0] + mid * ry[rows, 0])
+    return np.concatenate(xs), np.concatenate(ys)
+#----------------------------------------------------------------------
+def _on(shape, x, y, tolerance):
+    """ returns True for the points on the boundary or path of shape, or
+        on a point of shape """
+    if shape.kind == "point":
+        return _near_points(x, y, shape.x, shape.y, tolerance)
+    return _near_segments(x, y, shape.segments, tolerance)
+#----------------------------------------------------------------------
+def _covered(shape, x, y, tolerance):
+    """ returns True for the points inside or on shape """
+    if shape.kind == "polygon":
+        return _points_in_rings(x, y, shape.segments) | \
+               _on(shape, x, y, tolerance)
+    return _on(shape, x, y, tolerance)
+#----------------------------------------------------------------------
+def _interior(shape, x, y, tolerance):
+    """ returns True for the points in the interior of shape """
+    if shape.kind == "polygon":
+        return _points_in_rings(x, y, shape.segments) & \
+               ~_on(shape, x, y, tolerance)
+    return _on(shape, x, y, tolerance)
+#----------------------------------------------------------------------
+def _boxes_intersect(a, b, tolerance=0.0):
+    return a[0] <= b[2] + tolerance and b[0] <= a[2] + tolerance and \
+           a[1] <= b[3] + tolerance and b[1] <= a[3] + tolerance
+#----------------------------------------------------------------------
+def intersects(geometry1, geometry2):
+    """
+       returns True if the geometries share at least one location,
+       touching included
+       Inputs:
+          geometry1, geometry2 - common.geometry objects, esri json
+                                 dictionaries or prepared Shapes
+    """
+    a = prepare(geometry1)
+    b = prepare(geometry2)
+    if a is None or b is None:
+        return False
+    tolerance = _tolerance(a, b)
+    if not _boxes_intersect(a.box, b.box, tolerance):
+        return False
+    if a.segments is not None and b.segments is not None and \
+       _segments_intersect(a.segments, b.segments):
+        return True
+    if _covered(b, a.x, a.y, tolerance).any():
+        return True
+    return bool(_covered(a, b.x, b.y, tolerance).any())
+#----------------------------------------------------------------------
+def contains(geometry1, geometry2):
+    """
+       returns True if no part of geometry2 lies outside of geometry1 and
+       their interiors meet, so a polygon does not contain a point or a
+       line on its boundary
+       Inputs:
+          geometry1, geometry2 - common.geometry objects, esri json
+                                 dictionaries or prepared Shapes
+    """
+    np = _numpy()
+    a = prepare(geometry1)
+    b = prepare(geometry2)
+    if a is None or b is None:
+        return False
+    tolerance = _tolerance(a, b)
+    if b.box[0] < a.box[0] - tolerance or b.box[1] < a.box[1] - tolerance or \
+       b.box[2] > a.box[2] + tolerance or b.box[3] > a.box[3] + tolerance:
+        return False
+    if (a.kind == "point" and b.kind != "point") or \
+       (a.kind == "line" and b.kind == "polygon"):
+        return False
+    if not _covered(a, b.x, b.y, tolerance).all():
+        return False
+    x, y = b.x, b.y
+    if b.segments is not None and len(b.segments) > 0:
+        mx, my = _split_midpoints(b.segments, a.segments, tolerance)
+        if not _covered(a, mx, my, tolerance).all():
+            return False
+        x, y = np.concatenate([x, mx]), np.concatenate([y, my])
+    if a.kind == "polygon":
+        if b.kind == "polygon":
+            # a hole of a inside of b leaves part of b outside of a
+            return not _interior(b, a.x, a.y, tolerance).any()
+        return bool(_interior(a, x, y, tolerance).any())
+    return True
+#----------------------------------------------------------------------
+def within(geometry1, geometry2):
+    """ returns True if geometry1 lies within geometry2, see contains """
+    return contains(geometry2, geometry1)
+#----------------------------------------------------------------------
+_PREDICATES = {"intersects" : intersects,
+               "contains" : contains,
+               "within" : within}
+#----------------------------------------------------------------------
+def _point_arrays(geometries):
+    """ returns the x and y arrays of a list of points, or None when the
+        list holds other geometries.  Empty geometries are NaN. """
+    np = _numpy()
+    x = np.empty(len(geometries))
+    y = np.empty(len(geometries))
+    for i, g in enumerate(geometries):
+        if g is None:
+            x[i] = y[i] = np.nan
+        elif isinstance(g, dict) and 'x' in g:
+            x[i] = np.nan if g['x'] is None else g['x']
+            y[i] = np.nan if g['y'] is None else g['y']
+        elif isinstance(g, AbstractGeometry) and g.type == "esriGeometryPoint":
+            x[i], y[i] = g.X, g.Y
+        else:
+            return None
+    return x, y
+#----------------------------------------------------------------------
+def relate(geometries, geometry, relation="intersects"):
+    """
+       tests the relation of every geometry of a list to one geometry
+       Inputs:
+          geometries - list of common.geometry objects or esri json
+                       dictionaries, such as the geometries of a columnar
+                       query result.  None entries never match.
+          geometry - the geometry the list is tested against
+          relation - intersects (the geometries intersect geometry),
+                     contains (the geometries contain geometry) or within
+                     (the geometries lie within geometry)
+       Output:
+          numpy boolean array
+    """
+    np = _numpy()
+    if relation not in _PREDICATES:
+        raise AttributeError("relation must be one of: %s" % ", ".join(RELATIONS))
+    result = np.zeros(len(geometries), dtype=bool)
+    other = prepare(geometry)
+    if other is None or len(geometries) == 0:
+        return result
+    points = _point_arrays(geometries)
+    if points is not None:
+        x, y = points
+        box = other.box
+        with np.errstate(invalid='ignore'):
+            candidates = np.nonzero((x >= box[0]) & (x <= box[2]) & \
+                                    (y >= box[1]) & (y <= box[3]))[0]
+        if len(candidates) == 0:
+            return result
+        x, y = x[candidates], y[candidates]
+        tolerance = 1e-10 * (box[2] - box[0] + box[3] - box[1])
+        if relation == "intersects":
+            result[candidates] = _covered(other, x, y, tolerance)
+        elif relation == "within":
+            result[candidates] = _interior(other, x, y, tolerance)
+        elif other.kind == "point" and box[0] == box[2] and box[1] == box[3]:
+            # a point only contains points at its own location
+            result[candidates] = True
+        return result
+    func = _PREDICATES[relation]
+    for i, g in enumerate(geometries):
+        if g is not None:
+            result[i] = func(g, other)
+    return result
+#----------------------------------------------------------------------
+def filter_columns(results, geometry, relation="intersects"):
+    """
+       returns the rows of a columnar query result (query_columns) whose
+       geometries have the relation to geometry, see relate
+    """
+    np = _numpy()
+    mask = relate(results.get('geometries', []), geometry, relation)
+    rows = np.nonzero(mask)[0]
+    filtered = dict(results)
+    filtered['columns'] = dict([(name, [values[i] for i in rows]) \
+                                for name, values in results.get('columns', {}).items()])
+    filtered['geometries'] = [results['geometries'][i] for i in rows]
+    return filtered
+########################################################################
+class STRtree(object):
+    """
+       Static R-tree packed with the Sort-Tile-Recursive algorithm.  The
+       envelopes are sorted into vertical slices by their x center and
+       into nodes by their y center, level by level, so the nodes are full
+       and overlap little.  Queries walk the tree for many envelopes at
+       once with numpy.
+       Inputs:
+          boxes - (n, 4) array of xmin, ymin, xmax, ymax.  Rows with
+                  xmin > xmax or NaN values are never returned.
+          node_capacity - number of children per node
+    """
+    _items = None
+    _leaves = None
+    _levels = None
+    _capacity = None
+    #----------------------------------------------------------------------
+    def __init__(self, boxes, node_capacity=8):
+        """Constructor"""
+        np = _numpy()
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self._capacity = node_capacity
+        with np.errstate(invalid='ignore'):
+            valid = (boxes[:, 0] <= boxes[:, 2]) & (boxes[:, 1] <= boxes[:, 3])
+        items = np.nonzero(valid)[0]
+        self._items = items[self._order(boxes[items])]
+        level = boxes[self._items]
+        # the envelopes are kept as columns in tree order
+        self._leaves = tuple([np.ascontiguousarray(level[:, i]) for i in xrange(4)])
+        self._levels = []
+        while len(level) > 0:
+            starts = np.arange(0, len(level), node_capacity)
+            ends = np.minimum(starts + node_capacity, len(level))
+            nodes = np.column_stack([np.minimum.reduceat(level[:, 0], starts),
+                                     np.minimum.reduceat(level[:, 1], starts),
+                                     np.maximum.reduceat(level[:, 2], starts),
+                                     np.maximum.reduceat(level[:, 3], starts)])
+            if len(nodes) > node_capacity:
+                order = self._order(nodes)
+                nodes, starts, ends = nodes[order], starts[order], ends[order]
+            self._levels.append(tuple([np.ascontiguousarray(nodes[:, i]) for i in xrange(4)]) + \
+                                (starts, ends - starts))
+            if len(nodes) <= node_capacity:
+                break
+            level = nodes
+    #----------------------------------------------------------------------
+    def _order(self, boxes):
+        """ returns the Sort-Tile-Recursive order of the boxes """
+        np = _numpy()
+        count = len(boxes)
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        leaves = int(math.ceil(count / float(self._capacity)))
+        per_slice = int(math.ceil(math.sqrt(leaves))) * self._capacity
+        rank = np.empty(count, dtype=np.int64)
+        rank[np.argsort(cx, kind='mergesort')] = np.arange(count)
+        return np.lexsort((cy, rank // per_slice))
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return len(self._items)
+    #----------------------------------------------------------------------
+    def _walk(self, xmin, ymin, xmax, ymax):
+        """ returns the pairs of query and tree envelopes that intersect
+            for one chunk of query envelope columns """
+        np = _numpy()
+        top = len(self._levels[-1][0])
+        qi = np.repeat(np.arange(len(xmin)), top)
+        node = np.tile(np.arange(top), len(xmin))
+        for level in list(reversed(self._levels)) + [self._leaves]:
+            keep = (level[0][node] <= xmax[qi]) & (xmin[qi] <= level[2][node]) & \
+                   (level[1][node] <= ymax[qi]) & (ymin[qi] <= level[3][node])
+            qi, node = qi[keep], node[keep]
+            if len(level) == 4:
+                break
+            starts, counts = level[4][node], level[5][node]
+            firsts = np.cumsum(counts) - counts
+            qi = np.repeat(qi, counts)
+            node = np.repeat(starts - firsts, counts) + np.arange(len(qi))
+        return qi, self._items[node]
+    #----------------------------------------------------------------------
+    def query_boxes(self, boxes, chunk_size=4096):
+        """
+           finds the envelopes that intersect the query envelopes
+           Inputs:
+              boxes - (k, 4) array of query envelopes
+              chunk_size - number of query envelopes walked at once
+           Output:
+              tuple of two arrays, the index of the query envelope and the
+              index of the tree envelope of every intersecting pair
+        """
+        np = _numpy()
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        return self._query(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3],
+                           chunk_size)
+    #----------------------------------------------------------------------
+    def query_points(self, x, y, chunk_size=4096):
+        """ finds the envelopes that hold the points, see query_boxes """
+        np = _numpy()
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        return self._query(x, y, x, y, chunk_size)
+    #----------------------------------------------------------------------
+    def _query(self, xmin, ymin, xmax, ymax, chunk_size):
+        """ walks the tree in chunks of query envelopes """
+        np = _numpy()
+        found_queries = []
+        found_items = []
+        if len(self._levels) > 0:
+            for offset in xrange(0, len(xmin), chunk_size):
+                end = offset + chunk_size
+                qi, items = self._walk(xmin[offset:end], ymin[offset:end],
+                                       xmax[offset:end], ymax[offset:end])
+                found_queries.append(qi + offset)
+                found_items.append(items)
+        if len(found_queries) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(found_queries), np.concatenate(found_items)
+    #----------------------------------------------------------------------
+    def query(self, xmin, ymin, xmax, ymax):
+        """ returns the indexes of the envelopes intersecting a box """
+        return self.query_boxes([[xmin, ymin, xmax, ymax]])[1]
+########################################################################
+class PolygonIndex(object):
+    """
+       Joins points to polygons in process.  The envelopes of the polygons
+       are packed into an STRtree, so every point is only tested against
+       the few polygons whose envelope holds it, and the point in polygon
+       tests of each polygon run vectorized over all of its candidate
+       points.  Points exactly on a polygon edge may be reported inside
+       or outside of it.
+       Inputs:
+          polygons - list of polygons (common.geometry objects or esri json
+                     dictionaries), None entries never match
+          node_capacity - number of children per R-tree node
+    """
+    _segments = None
+    _offsets = None
+    _tree = None
+    #----------------------------------------------------------------------
+    def __init__(self, polygons, node_capacity=8):
+        """Constructor"""
+        np = _numpy()
+        segments = []
+        offsets = [0]
+        boxes = np.empty((len(polygons), 4))
+        boxes[:] = np.nan
+        for i, polygon in enumerate(polygons):
+            shape = prepare(polygon)
+            if shape is not None and shape.kind == "polygon":
+                segments.append(shape.segments)
+                boxes[i] = shape.box
+                offsets.append(offsets[-1] + len(shape.segments))
+            else:
+                offsets.append(offsets[-1])
+        self._segments = np.vstack(segments) if len(segments) > 0 else np.zeros((0, 4))
+        self._offsets = np.array(offsets)
+        self._tree = STRtree(boxes, node_capacity)
+    #----------------------------------------------------------------------
+    @property
+    def tree(self):
+        """ returns the STRtree of the polygon envelopes """
+        return self._tree
+    #----------------------------------------------------------------------
+    def join(self, x, y):
+        """
+           finds the polygons that contain each point
+           Inputs:
+              x, y - sequences or numpy arrays of point coordinates
+           Output:
+              tuple of two arrays, the point index and the polygon index of
+              every point in polygon pair, ordered by polygon
+        """
+        np = _numpy()
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        points, polygons = self._tree.query_points(x, y)
+        order = np.argsort(polygons, kind='mergesort')
+        points, polygons = points[order], polygons[order]
+        keep = np.zeros(len(points), dtype=bool)
+        bounds = np.concatenate([[0], np.nonzero(np.diff(polygons))[0] + 1,
+                                 [len(polygons)]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            polygon = polygons[start]
+            segments = self._segments[self._offsets[polygon]:self._offsets[polygon + 1]]
+            candidates = points[start:end]
+            keep[start:end] = _points_in_rings(x[candidates], y[candidates], segments)
+        return points[keep], polygons[keep]
+    #----------------------------------------------------------------------
+    def locate(self, x, y):
+        """
+           returns a numpy array with the index of the first polygon that
+           contains each point, or -1 for points outside of all polygons
+        """
+        np = _numpy()
+        count = len(x)
+        points, polygons = self.join(x, y)
+        result = np.full(count, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(result, points, polygons)
+        result[result == np.iinfo(np.int64).max] = -1
+        return result
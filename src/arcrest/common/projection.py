@@ -0,0 +1,588 @@
+"""
+   Local projection of geometries between common spatial references.
+
+   Converts the coordinates of geometries between WGS84 (4326), NAD83
+   (4269), Web Mercator (102100/3857), the UTM zones of WGS84 and NAD83 and
+   a set of NAD83 state plane zones in one vectorized numpy call per
+   request, without a round trip to a geometry service.  Spatial
+   references that are not supported locally, and projections with a
+   datum transformation, are sent to the project operation of a
+   GeometryService in batches, and the results are memoized in a shared
+   cache.TTLCache.
+
+   As the project operation does when no transformation is given, WGS84
+   and NAD83 coordinates are treated as equal; the two datums differ by
+   about a meter.  The transverse Mercator series are accurate to well
+   below a millimeter within a zone.
+"""
+import math
+from array import array
+import geometry as _geometry
+from cache import make_key, project_cache
+
+_FOOT_US = 1200.0 / 3937.0
+_WGS84 = (6378137.0, 1 / 298.257223563)
+_GRS80 = (6378137.0, 1 / 298.257222101)
+_MAX_MERCATOR_LAT = 85.0511287798066
+GEOGRAPHIC = (4326, 4269)
+WEB_MERCATOR = (102100, 3857, 102113, 900913)
+# NAD83 state plane zones:
+# (esri wkid, epsg wkid) : (projection, parameters, linear unit in meters)
+# lcc parameters are the standard parallels, the latitude and longitude of
+# origin and the false easting and northing in meters, tm parameters are
+# the latitude and longitude of origin, the scale factor and the false
+# easting and northing in meters
+_STATE_PLANES = {
+    # California III, V and VI
+    (102643, 2227) : ("lcc", (38.43333333333333, 37.06666666666667, 36.5,
+                              -120.5, 2000000.0001016, 500000.0001016), _FOOT_US),
+    (102645, 2229) : ("lcc", (35.46666666666667, 34.03333333333333, 33.5,
+                              -118.0, 2000000.0001016, 500000.0001016), _FOOT_US),
+    (102646, 2230) : ("lcc", (33.88333333333333, 32.78333333333333, 32.16666666666666,
+                              -116.25, 2000000.0001016, 500000.0001016), _FOOT_US),
+    (26943,) : ("lcc", (38.43333333333333, 37.06666666666667, 36.5,
+                        -120.5, 2000000.0, 500000.0), 1.0),
+    (26945,) : ("lcc", (35.46666666666667, 34.03333333333333, 33.5,
+                        -118.0, 2000000.0, 500000.0), 1.0),
+    (26946,) : ("lcc", (33.88333333333333, 32.78333333333333, 32.16666666666666,
+                        -116.25, 2000000.0, 500000.0), 1.0),
+    # Colorado Central
+    (102654, 2232) : ("lcc", (39.75, 38.45, 37.83333333333334,
+                              -105.5, 914401.8288036576, 304800.6096012192), _FOOT_US),
+    # Florida East, Georgia West
+    (102658, 2236) : ("tm", (24.33333333333333, -81.0, 0.999941177,
+                             200000.0001016, 0.0), _FOOT_US),
+    (102667, 2240) : ("tm", (30.0, -84.16666666666667, 0.9999,
+                             699999.9998984, 0.0), _FOOT_US),
+    # Massachusetts Mainland
+    (102686, 2249) : ("lcc", (42.68333333333333, 41.71666666666667, 41.0,
+                              -71.5, 200000.0001016, 750000.0), _FOOT_US),
+    # New York Long Island
+    (102718, 2263) : ("lcc", (41.03333333333333, 40.66666666666666, 40.16666666666666,
+                              -74.0, 300000.0, 0.0), _FOOT_US),
+    (32118,) : ("lcc", (41.03333333333333, 40.66666666666666, 40.16666666666666,
+                        -74.0, 300000.0, 0.0), 1.0),
+    # North Carolina
+    (102719, 2264) : ("lcc", (36.16666666666666, 34.33333333333334, 33.75,
+                              -79.0, 609601.2192024384, 0.0), _FOOT_US),
+    # Pennsylvania South
+    (102729, 2272) : ("lcc", (40.96666666666667, 39.93333333333333, 39.33333333333334,
+                              -77.75, 600000.0, 0.0), _FOOT_US),
+    # Texas Central and South Central
+    (102739, 2277) : ("lcc", (31.88333333333333, 30.11666666666667, 29.66666666666667,
+                              -100.3333333333333, 699999.9998984, 3000000.0), _FOOT_US),
+    (102740, 2278) : ("lcc", (30.28333333333333, 28.38333333333333, 27.83333333333333,
+                              -99.0, 600000.0, 3999999.9998984), _FOOT_US),
+    # Washington North and South
+    (102748, 2285) : ("lcc", (48.73333333333333, 47.5, 47.0,
+                              -120.8333333333333, 500000.0001016, 0.0), _FOOT_US),
+    (102749, 2286) : ("lcc", (47.33333333333334, 45.83333333333334, 45.33333333333334,
+                              -120.5, 500000.0001016, 0.0), _FOOT_US),
+}
+#----------------------------------------------------------------------
+def _numpy():
+    """ imports numpy, raising a clear error when it is missing """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required for local projection, " + \
+                          "but it could not be imported.")
+    return numpy
+########################################################################
+class _Geographic(object):
+    """ longitude and latitude in degrees """
+    #----------------------------------------------------------------------
+    def forward(self, lon, lat):
+        return lon, lat
+    #----------------------------------------------------------------------
+    def inverse(self, x, y):
+        return x, y
+########################################################################
+class _WebMercator(object):
+    """ spherical Mercator on the WGS84 semi-major axis """
+    _a = _WGS84[0]
+    #----------------------------------------------------------------------
+    def forward(self, lon, lat):
+        np = _numpy()
+        lat = np.clip(lat, -_MAX_MERCATOR_LAT, _MAX_MERCATOR_LAT)
+        return self._a * np.radians(lon), \
+               self._a * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    #----------------------------------------------------------------------
+    def inverse(self, x, y):
+        np = _numpy()
+        return np.degrees(x / self._a), \
+               np.degrees(np.pi / 2 - 2 * np.arctan(np.exp(-y / self._a)))
+########################################################################
+class _TransverseMercator(object):
+    """ ellipsoidal transverse Mercator with the Kruger series to n^4 """
+    #----------------------------------------------------------------------
+    def __init__(self, ellipsoid, lat0, lon0, k0, x0, y0, unit=1.0):
+        """Constructor"""
+        a, f = ellipsoid
+        n = f / (2 - f)
+        self._lon0 = lon0
+        self._k0 = k0
+        self._x0 = x0
+        self._y0 = y0
+        self._unit = unit
+        self._e = 2 * math.sqrt(n) / (1 + n)
+        self._A = a / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+        self._alpha = (n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16 + 41 * n ** 4 / 180,
+                       13 * n ** 2 / 48 - 3 * n ** 3 / 5 + 557 * n ** 4 / 1440,
+                       61 * n ** 3 / 240 - 103 * n ** 4 / 140,
+                       49561 * n ** 4 / 161280)
+        self._beta = (n / 2 - 2 * n ** 2 / 3 + 37 * n ** 3 / 96 - n ** 4 / 360,
+                      n ** 2 / 48 + n ** 3 / 15 - 437 * n ** 4 / 1440,
+                      17 * n ** 3 / 480 - 37 * n ** 4 / 840,
+                      4397 * n ** 4 / 161280)
+        self._delta = (2 * n - 2 * n ** 2 / 3 - 2 * n ** 3 + 116 * n ** 4 / 45,
+                       7 * n ** 2 / 3 - 8 * n ** 3 / 5 - 227 * n ** 4 / 45,
+                       56 * n ** 3 / 15 - 136 * n ** 4 / 35,
+                       4279 * n ** 4 / 630)
+        # northing of the latitude of origin on the central meridian
+        phi = math.radians(lat0)
+        t = math.sinh(math.atanh(math.sin(phi)) - \
+                      self._e * math.atanh(self._e * math.sin(phi)))
+        xi = math.atan2(t, 1.0)
+        self._m0 = self._A * (xi + sum([alpha * math.sin(2 * j * xi) \
+                                        for j, alpha in enumerate(self._alpha, 1)]))
+    #----------------------------------------------------------------------
+    def forward(self, lon, lat):
+        np = _numpy()
+        phi = np.radians(lat)
+        lam = np.radians(lon - self._lon0)
+        t = np.sinh(np.arctanh(np.sin(phi)) - \
+                    self._e * np.arctanh(self._e * np.sin(phi)))
+        xi1 = np.arctan2(t, np.cos(lam))
+        eta1 = np.arctanh(np.sin(lam) / np.sqrt(1 + t * t))
+        xi = xi1.copy()
+        eta = eta1.copy()
+        for j, alpha in enumerate(self._alpha, 1):
+            xi += alpha * np.sin(2 * j * xi1) * np.cosh(2 * j * eta1)
+            eta += alpha * np.cos(2 * j * xi1) * np.sinh(2 * j * eta1)
+        x = self._x0 + self._k0 * self._A * eta
+        y = self._y0 + self._k0 * (self._A * xi - self._m0)
+        return x / self._unit, y / self._unit
+    #----------------------------------------------------------------------
+    def inverse(self, x, y):
+        np = _numpy()
+        xi = (y * self._unit - self._y0 + self._k0 * self._m0) / (self._k0 * self._A)
+        eta = (x * self._unit - self._x0) / (self._k0 * self._A)
+        xi1 = xi.copy()
+        eta1 = eta.copy()
+        for j, beta in enumerate(self._beta, 1):
+            xi1 -= beta * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+            eta1 -= beta * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        chi = np.arcsin(np.sin(xi1) / np.cosh(eta1))
+        phi = chi.copy()
+        for j, delta in enumerate(self._delta, 1):
+            phi += delta * np.sin(2 * j * chi)
+        lam = np.arctan2(np.sinh(eta1), np.cos(xi1))
+        return np.degrees(lam) + self._lon0, np.degrees(phi)
+########################################################################
+class _LambertConformal(object):
+    """ ellipsoidal Lambert conformal conic with two standard parallels """
+    #----------------------------------------------------------------------
+    def __init__(self, ellipsoid, lat1, lat2, lat0, lon0, x0, y0, unit=1.0):
+        """Constructor"""
+        a, f = ellipsoid
+        self._a = a
+        self._e = math.sqrt(f * (2 - f))
+        self._lon0 = lon0
+        self._x0 = x0
+        self._y0 = y0
+        self._unit = unit
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        m1, m2 = self._m(phi1), self._m(phi2)
+        t1, t2 = self._t(phi1), self._t(phi2)
+        if lat1 == lat2:
+            self._n = math.sin(phi1)
+        else:
+            self._n = (math.log(m1) - math.log(m2)) / (math.log(t1) - math.log(t2))
+        self._F = m1 / (self._n * t1 ** self._n)
+        self._rho0 = a * self._F * self._t(math.radians(lat0)) ** self._n
+    #----------------------------------------------------------------------
+    def _m(self, phi):
+        return math.cos(phi) / math.sqrt(1 - (self._e * math.sin(phi)) ** 2)
+    #----------------------------------------------------------------------
+    def _t(self, phi):
+        es = self._e * math.sin(phi)
+        return math.tan(math.pi / 4 - phi / 2) / ((1 - es) / (1 + es)) ** (self._e / 2)
+    #----------------------------------------------------------------------
+    def forward(self, lon, lat):
+        np = _numpy()
+        phi = np.radians(lat)
+        es = self._e * np.sin(phi)
+        t = np.tan(np.pi / 4 - phi / 2) / ((1 - es) / (1 + es)) ** (self._e / 2)
+        rho = self._a * self._F * t ** self._n
+        theta = self._n * np.radians(lon - self._lon0)
+        x = self._x0 + rho * np.sin(theta)
+        y = self._y0 + self._rho0 - rho * np.cos(theta)
+        return x / self._unit, y / self._unit
+    #----------------------------------------------------------------------
+    def inverse(self, x, y):
+        np = _numpy()
+        dx = x * self._unit - self._x0
+        dy = self._rho0 - (y * self._unit - self._y0)
+        sign = 1.0 if self._n > 0 else -1.0
+        rho = sign * np.hypot(dx, dy)
+        theta = np.arctan2(sign * dx, sign * dy)
+        t = (rho / (self._a * self._F)) ** (1 / self._n)
+        phi = np.pi / 2 - 2 * np.arctan(t)
+        for i in xrange(8):
+            es = self._e * np.sin(phi)
+            phi = np.pi / 2 - 2 * np.arctan(t * ((1 - es) / (1 + es)) ** (self._e / 2))
+        return np.degrees(theta / self._n) + self._lon0, np.degrees(phi)
+#----------------------------------------------------------------------
+_PROJECTIONS = {}
+def get_projection(wkid):
+    """
+       returns the local projection of a well known id, None when it is
+       not supported locally
+    """
+    try:
+        wkid = int(wkid)
+    except (TypeError, ValueError):
+        return None
+    if wkid in _PROJECTIONS:
+        return _PROJECTIONS[wkid]
+    projection = None
+    if wkid in GEOGRAPHIC:
+        projection = _Geographic()
+    elif wkid in WEB_MERCATOR:
+        projection = _WebMercator()
+    elif 32601 <= wkid <= 32660 or 32701 <= wkid <= 32760:
+        zone = wkid % 100
+        projection = _TransverseMercator(_WGS84, 0.0, zone * 6 - 183.0, 0.9996,
+                                         500000.0,
+                                         10000000.0 if wkid > 32700 else 0.0)
+    elif 26901 <= wkid <= 26923:
+        zone = wkid % 100
+        projection = _TransverseMercator(_GRS80, 0.0, zone * 6 - 183.0, 0.9996,
+                                         500000.0, 0.0)
+    else:
+        for wkids, (kind, params, unit) in _STATE_PLANES.items():
+            if wkid in wkids:
+                if kind == "lcc":
+                    projection = _LambertConformal(_GRS80, *params, unit=unit)
+                else:
+                    projection = _TransverseMercator(_GRS80, *params, unit=unit)
+                break
+    _PROJECTIONS[wkid] = projection
+    return projection
+#----------------------------------------------------------------------
+def is_supported(wkid):
+    """ returns True if the well known id can be projected locally """
+    return get_projection(wkid) is not None
+#----------------------------------------------------------------------
+def project_xy(x, y, inSR, outSR):
+    """
+       projects coordinate arrays
+       Inputs:
+          x, y - sequences or numpy arrays of coordinates
+          inSR - well known id of the input coordinates
+          outSR - well known id of the output coordinates
+       Output:
+          tuple of the projected x and y numpy arrays
+    """
+    np = _numpy()
+    source = get_projection(inSR)
+    target = get_projection(outSR)
+    if source is None or target is None:
+        raise ValueError("projection from %s to %s is not supported locally" % (inSR, outSR))
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if int(inSR) == int(outSR) or \
+       (int(inSR) in WEB_MERCATOR and int(outSR) in WEB_MERCATOR) or \
+       (int(inSR) in GEOGRAPHIC and int(outSR) in GEOGRAPHIC):
+        return x.copy(), y.copy()
+    lon, lat = source.inverse(x, y)
+    return target.forward(lon, lat)
+#----------------------------------------------------------------------
+def project_coordinates(coords, inSR, outSR):
+    """
+       projects a (vertices, dimensions) array of x, y[, z][, m] rows and
+       returns a new numpy array, z and m values are copied
+    """
+    np = _numpy()
+    result = np.array(coords, dtype=np.float64).reshape(len(coords), -1)
+    if len(result) > 0:
+        result[:, 0], result[:, 1] = project_xy(result[:, 0], result[:, 1],
+                                                inSR, outSR)
+    return result
+#----------------------------------------------------------------------
+def _wkid(geometry):
+    """ returns the well known id of a geometry or None """
+    if isinstance(geometry, dict):
+        sr = geometry.get('spatialReference', None) or {}
+    else:
+        sr = geometry.spatialReference or {}
+    return sr.get('latestWkid', None) or sr.get('wkid', None)
+#----------------------------------------------------------------------
+def _to_geometry(geometry, wkid):
+    """ converts an esri json dictionary to a common.geometry object """
+    if 'x' in geometry:
+        return _geometry.Point([geometry['x'], geometry['y']], wkid,
+                               z=geometry.get('z', None),
+                               m=geometry.get('m', None))
+    if 'xmin' in geometry:
+        return _geometry.Envelope(geometry['xmin'], geometry['ymin'],
+                                  geometry['xmax'], geometry['ymax'], wkid,
+                                  zmin=geometry.get('zmin', None),
+                                  zmax=geometry.get('zmax', None),
+                                  mmin=geometry.get('mmin', None),
+                                  mmax=geometry.get('mmax', None))
+    hasZ = geometry.get('hasZ', False)
+    hasM = geometry.get('hasM', False)
+    if 'points' in geometry:
+        return _geometry.MultiPoint(geometry['points'], wkid, hasZ=hasZ, hasM=hasM)
+    if 'paths' in geometry:
+        return _geometry.Polyline(geometry['paths'], wkid, hasZ=hasZ, hasM=hasM)
+    if 'rings' in geometry:
+        return _geometry.Polygon(geometry['rings'], wkid, hasZ=hasZ, hasM=hasM)
+    raise AttributeError("Invalid geometry type")
+#----------------------------------------------------------------------
+def _envelope_outline(xmin, ymin, xmax, ymax, count=16):
+    """ returns points along the edges of an envelope, so the extent of a
+        projected envelope includes its curved edges """
+    np = _numpy()
+    steps = np.linspace(0.0, 1.0, count)
+    xs = xmin + (xmax - xmin) * steps
+    ys = ymin + (ymax - ymin) * steps
+    x = np.concatenate([xs, xs, np.repeat(xmin, count), np.repeat(xmax, count)])
+    y = np.concatenate([np.repeat(ymin, count), np.repeat(ymax, count), ys, ys])
+    return x, y
+########################################################################
+class Projector(object):
+    """
+       Projects geometries from one spatial reference to another.
+
+       When both spatial references are supported locally, the coordinates
+       of all geometries of a call are projected together in one vectorized
+       call.  Otherwise, or when a transformation is given, the geometries
+       are sent to the project operation of the geometry service in
+       batches, and every projected geometry is memoized in cache.
+
+       Inputs:
+          inSR - well known id of the input geometries, None reads it from
+                 the first geometry
+          outSR - well known id of the output geometries
+          geometryService - (optional) geometryservice.GeometryService used
+                            for spatial references that are not supported
+                            locally
+          transformation - (optional) datum transformation, always projected
+                           by the geometry service
+          batch_size - number of geometries per project request
+          cache - TTLCache of the remote results, default is project_cache,
+                  None turns the memoization off
+    """
+    _inSR = None
+    _outSR = None
+    _geometryService = None
+    _transformation = None
+    _batch_size = None
+    _cache = None
+    #----------------------------------------------------------------------
+    def __init__(self, inSR, outSR, geometryService=None,
+                 transformation=None, batch_size=100,
+                 cache=project_cache):
+        """Constructor"""
+        self._inSR = inSR
+        self._outSR = outSR
+        self._geometryService = geometryService
+        self._transformation = transformation
+        self._batch_size = batch_size
+        self._cache = cache
+    #----------------------------------------------------------------------
+    def isLocal(self, inSR=None):
+        """ returns True if the geometries are projected locally """
+        inSR = inSR or self._inSR
+        return self._transformation is None and \
+               is_supported(inSR) and is_supported(self._outSR)
+    #----------------------------------------------------------------------
+    def project(self, geometries):
+        """
+           projects common.geometry objects or esri json dictionaries
+           Inputs:
+              geometries - a geometry or a list of geometries
+           Output:
+              the projected geometry or list of geometries, of the same
+              types as the input
+        """
+        single = not isinstance(geometries, (list, tuple))
+        if single:
+            geometries = [geometries]
+        if len(geometries) == 0:
+            return []
+        inSR = self._inSR or _wkid(geometries[0])
+        if inSR is None:
+            raise AttributeError("inSR is required for geometries without a spatial reference")
+        if self.isLocal(inSR):
+            results = self._project_local(geometries, inSR)
+        elif self._geometryService is not None:
+            results = self._project_remote(geometries, inSR)
+        else:
+            raise ValueError("projection from %s to %s is not supported " % (inSR, self._outSR) + \
+                             "locally and no geometryService was given")
+        if single:
+            return results[0]
+        return results
+    #----------------------------------------------------------------------
+    def _project_local(self, geometries, inSR):
+        """ projects the coordinates of all geometries in one call """
+        np = _numpy()
+        xs = []
+        ys = []
+        for g in geometries:
+            if isinstance(g, dict):
+                if 'x' in g:
+                    xs.append([g['x']])
+                    ys.append([g['y']])
+                elif 'xmin' in g:
+                    x, y = _envelope_outline(g['xmin'], g['ymin'], g['xmax'], g['ymax'])
+                    xs.append(x)
+                    ys.append(y)
+                else:
+                    for key in ('points', 'paths', 'rings'):
+                        if key in g:
+                            parts = [g[key]] if key == 'points' else g[key]
+                            for part in parts:
+                                xs.append([row[0] for row in part])
+                                ys.append([row[1] for row in part])
+            elif isinstance(g, _geometry.Point):
+                xs.append([g.X])
+                ys.append([g.Y])
+            elif isinstance(g, _geometry.Envelope):
+                x, y = _envelope_outline(g._xmin, g._ymin, g._xmax, g._ymax)
+                xs.append(x)
+                ys.append(y)
+            elif isinstance(g, _geometry._PartGeometry):
+                values = np.asarray(g.coordinates, dtype=np.float64).reshape(-1, g.dimensions)
+                xs.append(values[:, 0])
+                ys.append(values[:, 1])
+            else:
+                raise AttributeError("Invalid geometry type")
+        x = y = np.zeros(0)
+        if len(xs) > 0:
+            x, y = project_xy(np.concatenate([np.asarray(v, dtype=np.float64) for v in xs]),
+                              np.concatenate([np.asarray(v, dtype=np.float64) for v in ys]),
+                              inSR, self._outSR)
+        pos = [0]
+        def take(count):
+            start = pos[0]
+            pos[0] += count
+            return x[start:pos[0]], y[start:pos[0]]
+        sr = {"wkid" : self._outSR}
+        results = []
+        for g in geometries:
+            if isinstance(g, dict):
+                g = dict(g)
+                g['spatialReference'] = sr
+                if 'x' in g:
+                    px, py = take(1)
+                    g['x'], g['y'] = float(px[0]), float(py[0])
+                elif 'xmin' in g:
+                    px, py = take(len(_envelope_outline(0, 0, 0, 0)[0]))
+                    g['xmin'], g['xmax'] = float(px.min()), float(px.max())
+                    g['ymin'], g['ymax'] = float(py.min()), float(py.max())
+                else:
+                    for key in ('points', 'paths', 'rings'):
+                        if key in g:
+                            parts = [g[key]] if key == 'points' else g[key]
+                            projected = []
+                            for part in parts:
+                                px, py = take(len(part))
+                                projected.append([[float(px[i]), float(py[i])] + list(row[2:]) \
+                                                  for i, row in enumerate(part)])
+                            g[key] = projected[0] if key == 'points' else projected
+                results.append(g)
+            elif isinstance(g, _geometry.Point):
+                px, py = take(1)
+                results.append(_geometry.Point([float(px[0]), float(py[0])],
+                                               self._outSR, z=g._z, m=g._m))
+            elif isinstance(g, _geometry.Envelope):
+                px, py = take(len(_envelope_outline(0, 0, 0, 0)[0]))
+                results.append(_geometry.Envelope(float(px.min()), float(py.min()),
+                                                  float(px.max()), float(py.max()),
+                                                  self._outSR,
+                                                  zmin=g._zmin, zmax=g._zmax,
+                                                  mmin=g._mmin, mmax=g._mmax))
+            else:
+                values = np.array(g.coordinates, dtype=np.float64).reshape(-1, g.dimensions)
+                px, py = take(len(values))
+                values[:, 0] = px
+                values[:, 1] = py
+                coords = array('d')
+                coords.fromstring(values.tostring())
+                results.append(g._with_coordinates(coords, self._outSR))
+        return results
+    #----------------------------------------------------------------------
+    def _key(self, inSR, geometry):
+        """ returns the memoization key of a geometry """
+        return make_key(self._geometryService.url + "/project",
+                        {"inSR" : inSR,
+                         "outSR" : self._outSR,
+                         "transformation" : self._transformation or "",
+                         "geometry" : geometry})
+    #----------------------------------------------------------------------
+    def _project_remote(self, geometries, inSR):
+        """ projects the geometries with the geometry service, in batches
+            of the same geometry type, reusing memoized results """
+        templates = []
+        for g in geometries:
+            if isinstance(g, dict):
+                g = _to_geometry(g, inSR)
+            templates.append(g)
+        results = [None] * len(geometries)
+        pending = {}
+        for i, g in enumerate(templates):
+            value = g.asDictionary
+            value.pop('spatialReference', None)
+            key = self._key(inSR, value)
+            cached = self._cache.get(key) if self._cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(g.type, []).append((i, key, g))
+        for geometryType, items in pending.items():
+            for start in xrange(0, len(items), self._batch_size):
+                batch = items[start:start + self._batch_size]
+                res = self._geometryService.project(geometries=[item[2] for item in batch],
+                                                    inSR=inSR,
+                                                    outSR=self._outSR,
+                                                    transformation=self._transformation or "")
+                if not isinstance(res, dict) or \
+                   len(res.get('geometries', [])) != len(batch):
+                    raise ValueError(res)
+                for (i, key, g), projected in zip(batch, res['geometries']):
+                    results[i] = projected
+                    if self._cache is not None:
+                        self._cache.set(key, projected)
+        sr = {"wkid" : self._outSR}
+        output = []
+        for g, projected in zip(geometries, results):
+            projected = dict(projected)
+            if isinstance(g, dict):
+                for key in ('hasZ', 'hasM'):
+                    if key in g:
+                        projected[key] = g[key]
+                projected['spatialReference'] = sr
+                output.append(projected)
+            else:
+                projected.setdefault('hasZ', getattr(g, '_hasZ', False))
+                projected.setdefault('hasM', getattr(g, '_hasM', False))
+                output.append(_to_geometry(projected, self._outSR))
+        return output
+#----------------------------------------------------------------------
+def project(geometries, outSR, inSR=None, geometryService=None,
+            transformation=None, batch_size=100, cache=project_cache):
+    """
+       projects a geometry or a list of geometries, locally when the
+       spatial references are supported and with the geometryService
+       otherwise.  See Projector.
+    """
+    return Projector(inSR=inSR, outSR=outSR,
+                     geometryService=geometryService,
+                     transformation=transformation,
+                     batch_size=batch_size,
+                     cache=cache).project(geometries)
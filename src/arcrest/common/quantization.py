@@ -0,0 +1,127 @@
+"""
+   Helpers to shrink query responses: generalization tolerances and
+   coordinate precision derived from a map scale, quantization parameters
+   and decoding of quantized geometries.
+"""
+import math
+# meters per inch and meters per degree at the equator
+_METERS_PER_INCH = 0.0254
+_METERS_PER_DEGREE = 111319.49079327357
+#----------------------------------------------------------------------
+def is_geographic(wkid):
+    """ returns True when the well known id is a geographic coordinate
+        system, whose units are degrees """
+    if isinstance(wkid, dict):
+        wkid = wkid.get('latestWkid', wkid.get('wkid', None))
+    if wkid is None:
+        return False
+    wkid = int(wkid)
+    return 4000 <= wkid < 5000 or 37001 <= wkid <= 37260 or \
+           104000 <= wkid < 105000
+#----------------------------------------------------------------------
+def resolution_for_scale(scale, dpi=96, geographic=False):
+    """
+       returns the size of a screen pixel in map units
+       Inputs:
+          scale - map scale denominator, e.g. 24000 for 1:24,000
+          dpi - resolution of the display in dots per inch
+          geographic - True when the map units are degrees
+       Output:
+          float
+    """
+    resolution = float(scale) * _METERS_PER_INCH / float(dpi)
+    if geographic:
+        resolution = resolution / _METERS_PER_DEGREE
+    return resolution
+#----------------------------------------------------------------------
+def tolerance_for_scale(scale, dpi=96, pixels=1.0, geographic=False):
+    """
+       returns the generalization tolerance (maxAllowableOffset) that keeps
+       the simplification below the given number of pixels at a scale
+    """
+    return resolution_for_scale(scale, dpi, geographic) * pixels
+#----------------------------------------------------------------------
+def precision_for_resolution(resolution):
+    """
+       returns the number of decimal places needed to keep coordinates
+       accurate to resolution map units
+    """
+    if resolution <= 0:
+        return None
+    return max(0, int(math.ceil(-math.log10(resolution))))
+#----------------------------------------------------------------------
+def quantization_parameters(extent, tolerance, mode="view",
+                            originPosition="upperLeft"):
+    """
+       builds the quantizationParameters of a query
+       Inputs:
+          extent - envelope dictionary (xmin, ymin, xmax, ymax and
+                   spatialReference) covering the features
+          tolerance - size of a quantization step in map units, usually
+                      the resolution of a pixel
+          mode - view or edit
+          originPosition - upperLeft or lowerLeft
+       Output:
+          dictionary
+    """
+    return {"mode" : mode,
+            "originPosition" : originPosition,
+            "tolerance" : tolerance,
+            "extent" : extent}
+#----------------------------------------------------------------------
+def _decode_path(path, sx, sy, tx, ty, upper):
+    """ decodes a delta encoded list of quantized vertices """
+    x = 0
+    y = 0
+    coords = []
+    for vertex in path:
+        x += vertex[0]
+        y += vertex[1]
+        if upper:
+            coords.append([tx + x * sx, ty - y * sy] + list(vertex[2:]))
+        else:
+            coords.append([tx + x * sx, ty + y * sy] + list(vertex[2:]))
+    return coords
+#----------------------------------------------------------------------
+def dequantize_geometry(geometry, transform):
+    """
+       converts a quantized geometry back to real coordinates
+       Inputs:
+          geometry - esri json geometry dictionary with integer coordinates
+          transform - the transform dictionary of the query response
+       Output:
+          the geometry with real coordinates
+    """
+    if geometry is None:
+        return geometry
+    sx, sy = transform['scale'][0], transform['scale'][1]
+    tx, ty = transform['translate'][0], transform['translate'][1]
+    upper = transform.get('originPosition', 'upperLeft') == 'upperLeft'
+    if 'x' in geometry and geometry['x'] is not None:
+        geometry['x'] = tx + geometry['x'] * sx
+        if upper:
+            geometry['y'] = ty - geometry['y'] * sy
+        else:
+            geometry['y'] = ty + geometry['y'] * sy
+    for key in ['paths', 'rings']:
+        if key in geometry:
+            geometry[key] = [_decode_path(part, sx, sy, tx, ty, upper) \
+                             for part in geometry[key]]
+    if 'points' in geometry:
+        geometry['points'] = _decode_path(geometry['points'],
+                                          sx, sy, tx, ty, upper)
+    return geometry
+#----------------------------------------------------------------------
+def dequantize(results):
+    """
+       converts the geometries of a quantized query response back to real
+       coordinates, in place.  Responses without a transform are returned
+       unchanged.
+    """
+    transform = results.pop('transform', None)
+    if transform is None:
+        return results
+    for feature in results.get('features', []):
+        if 'geometry' in feature:
+            dequantize_geometry(feature['geometry'], transform)
+    return results
@@ -4,9 +4,7 @@ from xml.etree import ElementTree as ET
 
 import shutil
 
-import arcpy
-from arcpy import mapping
-from arcpy import env
+from _arcpy import arcpy
 
 ########################################################################
 def MXDtoFeatureServiceDef( mxd_path, service_name=None, tags=None, description=None,folder_name=None,capabilities ='Query,Create,Update,Delete,Uploads,Editing,Sync',maxRecordCount=1000,server_type='MY_HOSTED_SERVICES'):
@@ -30,9 +28,9 @@ def MXDtoFeatureServiceDef( mxd_path, service_name=None, tags=None, description=
         sciptPath = os.getcwd()
         mxd_path = os.path.join(sciptPath,mxd_path)
 
-    mxd = mapping.MapDocument(mxd_path)
-    sddraftFolder = env.scratchFolder + os.sep + "draft"
-    sdFolder = env.scratchFolder + os.sep + "sd"
+    mxd = arcpy.mapping.MapDocument(mxd_path)
+    sddraftFolder = arcpy.env.scratchFolder + os.sep + "draft"
+    sdFolder = arcpy.env.scratchFolder + os.sep + "sd"
     sddraft = sddraftFolder + os.sep + service_name + ".sddraft"
     sd = sdFolder + os.sep + "%s.sd" % service_name
     mxd = _prep_mxd(mxd)
@@ -58,7 +56,7 @@ def MXDtoFeatureServiceDef( mxd_path, service_name=None, tags=None, description=
     res['service_name'] = service_name
     res['tags'] = tags
     res['description'] = description
-    analysis = mapping.CreateMapSDDraft(map_document=mxd, out_sddraft=sddraft,
+    analysis = arcpy.mapping.CreateMapSDDraft(map_document=mxd, out_sddraft=sddraft,
                                        service_name=service_name, 
                                        server_type=server_type, 
                                        connection_file_path=None, 
@@ -68,7 +66,7 @@ def MXDtoFeatureServiceDef( mxd_path, service_name=None, tags=None, description=
                                        tags=tags)         
     
     sddraft = _modify_sddraft(sddraft=sddraft,capabilities=capabilities,maxRecordCount=maxRecordCount)
-    analysis = mapping.AnalyzeForSD(sddraft)
+    analysis = arcpy.mapping.AnalyzeForSD(sddraft)
     if os.path.isdir(sdFolder):
         shutil.rmtree(sdFolder, ignore_errors=True)
         os.makedirs(sdFolder)
@@ -0,0 +1,611 @@
+"""
+   Streaming writers for query results that do not need arcpy.
+
+   A sink is opened once with the fields, geometry type and spatial
+   reference of the features, then receives the features page by page as
+   they are downloaded, so memory use does not grow with the size of the
+   result.  Three formats are available: newline delimited GeoJSON, CSV
+   with the geometry as WKT, and GeoPackage (a SQLite database readable by
+   QGIS, GDAL and ArcGIS Pro).
+"""
+import os
+import csv
+import json
+import struct
+import sqlite3
+import datetime
+from general import _date_handler
+from quantization import is_geographic
+#----------------------------------------------------------------------
+def _signed_area(ring):
+    """ returns twice the signed area of a ring, negative when the ring is
+        clockwise """
+    area = 0.0
+    for i in xrange(len(ring) - 1):
+        area += ring[i][0] * ring[i + 1][1] - ring[i + 1][0] * ring[i][1]
+    return area
+#----------------------------------------------------------------------
+def polygon_parts(rings):
+    """
+       groups the rings of an esri polygon into polygons.  Esri outer rings
+       are clockwise and holes counterclockwise; each hole is assigned to
+       the outer ring before it.
+       Output:
+          list of polygons, each a list of rings with the outer ring first
+    """
+    polygons = []
+    for ring in rings:
+        if len(ring) < 3:
+            continue
+        if _signed_area(ring) <= 0 or len(polygons) == 0:
+            polygons.append([ring])
+        else:
+            polygons[-1].append(ring)
+    return polygons
+#----------------------------------------------------------------------
+def to_geojson(geometry):
+    """ converts an esri json geometry to a GeoJSON geometry """
+    if geometry is None:
+        return None
+    if 'x' in geometry:
+        if geometry['x'] is None:
+            return None
+        coords = [geometry['x'], geometry['y']]
+        if geometry.get('z', None) is not None:
+            coords.append(geometry['z'])
+        return {"type" : "Point", "coordinates" : coords}
+    if 'points' in geometry:
+        return {"type" : "MultiPoint", "coordinates" : geometry['points']}
+    if 'paths' in geometry:
+        paths = geometry['paths']
+        if len(paths) == 1:
+            return {"type" : "LineString", "coordinates" : paths[0]}
+        return {"type" : "MultiLineString", "coordinates" : paths}
+    if 'rings' in geometry:
+        # GeoJSON outer rings are counterclockwise, the reverse of esri
+        polygons = [[list(reversed(ring)) for ring in polygon] \
+                    for polygon in polygon_parts(geometry['rings'])]
+        if len(polygons) == 1:
+            return {"type" : "Polygon", "coordinates" : polygons[0]}
+        return {"type" : "MultiPolygon", "coordinates" : polygons}
+    if 'xmin' in geometry:
+        return to_geojson({"rings" : [[[geometry['xmin'], geometry['ymin']],
+                                       [geometry['xmin'], geometry['ymax']],
+                                       [geometry['xmax'], geometry['ymax']],
+                                       [geometry['xmax'], geometry['ymin']],
+                                       [geometry['xmin'], geometry['ymin']]]]})
+    return None
+#----------------------------------------------------------------------
+def geometry_type(geometry):
+    """ returns the esri geometry type of an esri json geometry, or None """
+    if geometry is None:
+        return None
+    if 'x' in geometry:
+        return "esriGeometryPoint"
+    elif 'points' in geometry:
+        return "esriGeometryMultipoint"
+    elif 'paths' in geometry:
+        return "esriGeometryPolyline"
+    elif 'rings' in geometry:
+        return "esriGeometryPolygon"
+    elif 'xmin' in geometry:
+        return "esriGeometryEnvelope"
+    return None
+#----------------------------------------------------------------------
+def _wkt_coords(coords):
+    """ formats a list of vertices """
+    return ", ".join([" ".join([repr(float(c)) for c in v]) for v in coords])
+#----------------------------------------------------------------------
+def _has_vertices(coords):
+    """ returns True when nested coordinate lists hold at least one vertex """
+    if len(coords) == 0:
+        return False
+    if not isinstance(coords[0], list):
+        return True
+    return any([_has_vertices(c) for c in coords])
+#----------------------------------------------------------------------
+def to_wkt(geometry):
+    """ converts an esri json geometry to well known text, geometries
+        without vertices are written as <TYPE> EMPTY """
+    geojson = to_geojson(geometry)
+    if geojson is None:
+        return ""
+    gtype = geojson['type']
+    coords = geojson['coordinates']
+    if not _has_vertices(coords):
+        return "%s EMPTY" % gtype.upper()
+    if gtype == "Point":
+        return "POINT (%s)" % _wkt_coords([coords])
+    elif gtype == "MultiPoint":
+        return "MULTIPOINT (%s)" % ", ".join(["(%s)" % _wkt_coords([p]) for p in coords])
+    elif gtype == "LineString":
+        return "LINESTRING (%s)" % _wkt_coords(coords)
+    elif gtype == "MultiLineString":
+        return "MULTILINESTRING (%s)" % ", ".join(["(%s)" % _wkt_coords(p) for p in coords])
+    elif gtype == "Polygon":
+        return "POLYGON (%s)" % ", ".join(["(%s)" % _wkt_coords(r) for r in coords])
+    return "MULTIPOLYGON (%s)" % ", ".join(["(%s)" % ", ".join(["(%s)" % _wkt_coords(r) \
+                                                               for r in polygon]) \
+                                            for polygon in coords])
+#----------------------------------------------------------------------
+def _wkb_points(coords):
+    """ packs a list of xy vertices """
+    return struct.pack('<I', len(coords)) + \
+           "".join([struct.pack('<dd', v[0], v[1]) for v in coords])
+#----------------------------------------------------------------------
+def to_wkb(geometry, multi=False):
+    """ converts an esri json geometry to 2D little endian well known
+        binary, or None.  multi=True always writes lines and polygons as
+        MultiLineString and MultiPolygon. """
+    geojson = to_geojson(geometry)
+    if geojson is None:
+        return None
+    gtype = geojson['type']
+    coords = geojson['coordinates']
+    if multi and gtype in ("LineString", "Polygon"):
+        gtype = "Multi" + gtype
+        coords = [coords]
+    if gtype == "Point":
+        return struct.pack('<BIdd', 1, 1, coords[0], coords[1])
+    elif gtype == "LineString":
+        return struct.pack('<BI', 1, 2) + _wkb_points(coords)
+    elif gtype == "Polygon":
+        return struct.pack('<BII', 1, 3, len(coords)) + \
+               "".join([_wkb_points(r) for r in coords])
+    elif gtype == "MultiPoint":
+        return struct.pack('<BII', 1, 4, len(coords)) + \
+               "".join([struct.pack('<BIdd', 1, 1, p[0], p[1]) for p in coords])
+    elif gtype == "MultiLineString":
+        return struct.pack('<BII', 1, 5, len(coords)) + \
+               "".join([struct.pack('<BI', 1, 2) + _wkb_points(p) for p in coords])
+    return struct.pack('<BII', 1, 6, len(coords)) + \
+           "".join([struct.pack('<BII', 1, 3, len(polygon)) + \
+                    "".join([_wkb_points(r) for r in polygon]) \
+                    for polygon in coords])
+#----------------------------------------------------------------------
+def _value(value):
+    """ converts dates to epoch milliseconds """
+    if isinstance(value, datetime.datetime):
+        return _date_handler(value)
+    return value
+#----------------------------------------------------------------------
+def _iso_date(value):
+    """ converts an epoch milliseconds date (or a datetime) to the
+        ISO-8601 UTC text GeoPackage stores DATETIME values as """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        value = _date_handler(value)
+    date = datetime.datetime(1970, 1, 1) + \
+           datetime.timedelta(milliseconds=int(value))
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%03dZ" % (date.year, date.month,
+                                                    date.day, date.hour,
+                                                    date.minute, date.second,
+                                                    date.microsecond // 1000)
+#----------------------------------------------------------------------
+def _as_dict(feature):
+    """ returns the esri json dictionary of a feature """
+    if isinstance(feature, dict):
+        return feature
+    return feature.asDictionary
+########################################################################
+class FeatureSink(object):
+    """
+       Base class of the streaming writers.  Call open() with the layer
+       description (optional, it is otherwise taken from the first
+       feature), write() with each page of features, then close().
+       Sinks are context managers.
+    """
+    _path = None
+    _fields = None
+    _geometryType = None
+    _spatialReference = None
+    _count = None
+    _opened = None
+    #----------------------------------------------------------------------
+    def __init__(self, path):
+        """Constructor"""
+        self._path = path
+        self._count = 0
+        self._opened = False
+    #----------------------------------------------------------------------
+    @property
+    def path(self):
+        """ returns the output path """
+        return self._path
+    #----------------------------------------------------------------------
+    @property
+    def count(self):
+        """ returns the number of features written """
+        return self._count
+    #----------------------------------------------------------------------
+    def open(self, fields=None, geometryType=None, spatialReference=None):
+        """
+           prepares the output
+           Inputs:
+              fields - list of field dictionaries (name, type) or names
+              geometryType - esri geometry type of the features
+              spatialReference - spatial reference dictionary
+        """
+        if self._opened:
+            return
+        if fields is not None:
+            fields = [f if isinstance(f, dict) else {"name" : f} for f in fields]
+            # geometry and raster fields are not attributes
+            fields = [f for f in fields \
+                      if f.get('type', None) not in ("esriFieldTypeGeometry",
+                                                     "esriFieldTypeRaster")]
+        self._fields = fields
+        self._geometryType = geometryType
+        self._spatialReference = spatialReference
+        self._open()
+        self._opened = True
+    #----------------------------------------------------------------------
+    def _open(self):
+        """ creates the output, implemented by the sinks """
+        raise NotImplementedError()
+    #----------------------------------------------------------------------
+    def write(self, features):
+        """ writes features (esri json dictionaries or Feature objects) """
+        for feature in features:
+            feature = _as_dict(feature)
+            if not self._opened:
+                geometry = feature.get('geometry', None) or {}
+                self.open(fields=sorted(feature.get('attributes', {}).keys()),
+                          geometryType=geometry_type(geometry),
+                          spatialReference=geometry.get('spatialReference', None))
+            self._write(feature)
+            self._count += 1
+    #----------------------------------------------------------------------
+    def write_result(self, result):
+        """ writes a query response dictionary, opening the sink with its
+            fields, geometry type and spatial reference.  The output is
+            created even when the response has no features. """
+        if not self._opened:
+            fields = result.get('fields', None)
+            if not fields and len(result.get('features', [])) > 0:
+                fields = sorted(result['features'][0].get('attributes', {}).keys())
+            self.open(fields=fields,
+                      geometryType=result.get('geometryType', None),
+                      spatialReference=result.get('spatialReference', None))
+        self.write(result.get('features', []))
+    #----------------------------------------------------------------------
+    def _write(self, feature):
+        """ writes one feature, implemented by the sinks """
+        raise NotImplementedError()
+    #----------------------------------------------------------------------
+    def close(self):
+        """ finishes the output """
+        pass
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+    #----------------------------------------------------------------------
+    def __exit__(self, type, value, traceback):
+        self.close()
+########################################################################
+class GeoJSONSink(FeatureSink):
+    """
+       Writes newline delimited GeoJSON, one Feature object per line, or a
+       FeatureCollection document.  Coordinates are written as received;
+       GeoJSON readers expect WGS84, so query with outSR=4326.
+       Inputs:
+          path - output file path
+          collection - if True, the features are wrapped in a
+                       FeatureCollection instead of one per line
+    """
+    _file = None
+    _collection = None
+    #----------------------------------------------------------------------
+    def __init__(self, path, collection=False):
+        """Constructor"""
+        super(GeoJSONSink, self).__init__(path)
+        self._collection = collection
+    #----------------------------------------------------------------------
+    def _open(self):
+        """ creates the file """
+        self._file = open(self._path, 'wb')
+        if self._collection:
+            self._file.write('{"type": "FeatureCollection", "features": [\n')
+    #----------------------------------------------------------------------
+    def _write(self, feature):
+        """ writes one feature """
+        record = {"type" : "Feature",
+                  "properties" : feature.get('attributes', {}),
+                  "geometry" : to_geojson(feature.get('geometry', None))}
+        if self._collection and self._count > 0:
+            self._file.write(",\n")
+        self._file.write(json.dumps(record, default=_date_handler))
+        if not self._collection:
+            self._file.write("\n")
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the file, an empty output is created when nothing was
+            written """
+        if not self._opened:
+            self.open()
+        if self._file is not None:
+            if self._collection:
+                self._file.write("\n]}\n")
+            self._file.close()
+            self._file = None
+########################################################################
+class CSVSink(FeatureSink):
+    """
+       Writes a CSV file with one column per field and the geometry as
+       WKT in the last column.
+       Inputs:
+          path - output file path
+          geometry_column - name of the WKT column
+    """
+    _file = None
+    _writer = None
+    _names = None
+    _geometry_column = None
+    _has_geometry = None
+    #----------------------------------------------------------------------
+    def __init__(self, path, geometry_column="WKT"):
+        """Constructor"""
+        super(CSVSink, self).__init__(path)
+        self._geometry_column = geometry_column
+    #----------------------------------------------------------------------
+    def _open(self):
+        """ creates the file and writes the header """
+        self._names = [f['name'] for f in (self._fields or [])]
+        self._file = open(self._path, 'wb')
+        self._writer = csv.writer(self._file)
+        header = list(self._names)
+        if self._geometryType is not None or len(header) == 0:
+            header.append(self._geometry_column)
+        self._writer.writerow([self._encode(n) for n in header])
+        self._has_geometry = self._geometryType is not None or len(self._names) == 0
+    #----------------------------------------------------------------------
+    def _encode(self, value):
+        """ encodes a value for the csv module """
+        if value is None:
+            return ""
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return _value(value)
+    #----------------------------------------------------------------------
+    def _write(self, feature):
+        """ writes one feature """
+        attributes = feature.get('attributes', {})
+        row = [self._encode(attributes.get(name, None)) for name in self._names]
+        if self._has_geometry:
+            row.append(to_wkt(feature.get('geometry', None)))
+        self._writer.writerow(row)
+    #----------------------------------------------------------------------
+    def close(self):
+        """ closes the file, an empty output is created when nothing was
+            written """
+        if not self._opened:
+            self.open()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+########################################################################
+class GeoPackageSink(FeatureSink):
+    """
+       Writes the features into a table of a GeoPackage (OGC GeoPackage
+       1.2, a SQLite database).  An existing GeoPackage receives a new
+       table.
+       Inputs:
+          path - output .gpkg file path
+          table - name of the feature table
+          batch_size - number of features inserted per transaction
+    """
+    _table = None
+    _conn = None
+    _names = None
+    _srs_id = None
+    _rows = None
+    _batch_size = None
+    _extent = None
+    _sql = None
+    _dates = None
+    _column_types = {"esriFieldTypeOID" : "INTEGER",
+                     "esriFieldTypeSmallInteger" : "SMALLINT",
+                     "esriFieldTypeInteger" : "INTEGER",
+                     "esriFieldTypeSingle" : "FLOAT",
+                     "esriFieldTypeDouble" : "DOUBLE",
+                     "esriFieldTypeDate" : "DATETIME",
+                     "esriFieldTypeBlob" : "BLOB"}
+    _geometry_types = {"esriGeometryPoint" : "POINT",
+                       "esriGeometryMultipoint" : "MULTIPOINT",
+                       "esriGeometryPolyline" : "MULTILINESTRING",
+                       "esriGeometryPolygon" : "MULTIPOLYGON",
+                       "esriGeometryEnvelope" : "MULTIPOLYGON"}
+    _wgs84 = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],' + \
+             'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]'
+    _web_mercator = (102100, 102113, 900913, 3857)
+    #----------------------------------------------------------------------
+    def __init__(self, path, table="features", batch_size=1000):
+        """Constructor"""
+        super(GeoPackageSink, self).__init__(path)
+        self._table = table
+        self._batch_size = batch_size
+        self._rows = []
+    #----------------------------------------------------------------------
+    def _open(self):
+        """ creates the GeoPackage tables and the feature table """
+        conn = sqlite3.connect(self._path)
+        conn.execute("PRAGMA application_id = 1196444487")
+        conn.execute("PRAGMA user_version = 10200")
+        conn.execute("CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (" + \
+                     "srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY, " + \
+                     "organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, " + \
+                     "definition TEXT NOT NULL, description TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS gpkg_contents (" + \
+                     "table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, " + \
+                     "identifier TEXT UNIQUE, description TEXT DEFAULT '', " + \
+                     "last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), " + \
+                     "min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)")
+        conn.execute("CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (" + \
+                     "table_name TEXT NOT NULL, column_name TEXT NOT NULL, " + \
+                     "geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, " + \
+                     "z TINYINT NOT NULL, m TINYINT NOT NULL, " + \
+                     "CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name))")
+        for row in [("Undefined cartesian SRS", -1, "NONE", -1, "undefined", None),
+                    ("Undefined geographic SRS", 0, "NONE", 0, "undefined", None),
+                    ("WGS 84 geodetic", 4326, "EPSG", 4326, self._wgs84, None)]:
+            conn.execute("INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", row)
+        row = self._srs(self._spatialReference or {})
+        self._srs_id = row[1]
+        conn.execute("INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", row)
+        columns = ['"fid" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL']
+        self._names = []
+        self._dates = []
+        for field in self._fields or []:
+            if field.get('type', None) == "esriFieldTypeDate":
+                self._dates.append(len(self._names))
+            if field.get('type', None) == "esriFieldTypeOID" or \
+               field['name'].lower() == "fid":
+                # the object id is kept as a regular column
+                ctype = "INTEGER"
+            else:
+                ctype = self._column_types.get(field.get('type', None), "TEXT")
+            columns.append('"%s" %s' % (field['name'].replace('"', '""'), ctype))
+            self._names.append(field['name'])
+        has_geometry = self._geometryType is not None
+        if has_geometry:
+            columns.insert(1, '"geom" %s' % self._geometry_types.get(self._geometryType,
+                                                                    "GEOMETRY"))
+        table = '"%s"' % self._table.replace('"', '""')
+        conn.execute("CREATE TABLE %s (%s)" % (table, ", ".join(columns)))
+        conn.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) " + \
+                     "VALUES (?, ?, ?, ?)",
+                     (self._table, "features" if has_geometry else "attributes",
+                      self._table, self._srs_id))
+        if has_geometry:
+            conn.execute("INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)",
+                         (self._table, "geom",
+                          self._geometry_types.get(self._geometryType, "GEOMETRY"),
+                          self._srs_id))
+        conn.commit()
+        insert = [('"%s"' % n.replace('"', '""')) for n in self._names]
+        if has_geometry:
+            insert.insert(0, '"geom"')
+        self._sql = "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(insert),
+                                                         ", ".join(["?"] * len(insert)))
+        self._conn = conn
+    #----------------------------------------------------------------------
+    def _srs(self, sr):
+        """ returns the gpkg_spatial_ref_sys row of a spatial reference.
+            WGS 84, Web Mercator, the WGS 84 UTM zones and spatial
+            references with a wkt are defined, others are written as an
+            undefined geographic (0) or cartesian (-1) SRS. """
+        wkid = sr.get('latestWkid', sr.get('wkid', None))
+        if wkid == 4326:
+            return ("WGS 84 geodetic", 4326, "EPSG", 4326, self._wgs84, None)
+        if wkid in self._web_mercator:
+            return ("WGS 84 / Pseudo-Mercator", 3857, "EPSG", 3857,
+                    'PROJCS["WGS 84 / Pseudo-Mercator",' + self._wgs84 + \
+                    ',PROJECTION["Mercator_1SP"],PARAMETER["central_meridian",0],' + \
+                    'PARAMETER["scale_factor",1],PARAMETER["false_easting",0],' + \
+                    'PARAMETER["false_northing",0],UNIT["metre",1],' + \
+                    'AUTHORITY["EPSG","3857"]]', None)
+        if wkid is not None and (32601 <= wkid <= 32660 or 32701 <= wkid <= 32760):
+            zone = wkid % 100
+            hemisphere = "N" if wkid < 32700 else "S"
+            name = "WGS 84 / UTM zone %s%s" % (zone, hemisphere)
+            return (name, wkid, "EPSG", wkid,
+                    'PROJCS["%s",' % name + self._wgs84 + \
+                    ',PROJECTION["Transverse_Mercator"],' + \
+                    'PARAMETER["latitude_of_origin",0],' + \
+                    'PARAMETER["central_meridian",%s],' % (zone * 6 - 183) + \
+                    'PARAMETER["scale_factor",0.9996],' + \
+                    'PARAMETER["false_easting",500000],' + \
+                    'PARAMETER["false_northing",%s],' % (0 if hemisphere == "N" else 10000000) + \
+                    'UNIT["metre",1],AUTHORITY["EPSG","%s"]]' % wkid, None)
+        if wkid is not None and sr.get('wkt', None) is not None:
+            organization = "EPSG" if wkid < 100000 else "ESRI"
+            return ("%s:%s" % (organization, wkid), wkid, organization, wkid,
+                    sr['wkt'], None)
+        if is_geographic(sr):
+            return ("Undefined geographic SRS", 0, "NONE", 0, "undefined", None)
+        return ("Undefined cartesian SRS", -1, "NONE", -1, "undefined", None)
+    #----------------------------------------------------------------------
+    def _geometry_blob(self, geometry):
+        """ returns the GeoPackage binary of a geometry: the header with
+            the xy envelope, followed by the WKB.  Geometries without
+            vertices are written as NULL. """
+        wkb = to_wkb(geometry, multi=True)
+        if wkb is None:
+            return None
+        if 'x' in geometry:
+            vertices = [[geometry['x'], geometry['y']]]
+        elif 'points' in geometry:
+            vertices = geometry['points']
+        elif 'xmin' in geometry:
+            vertices = [[geometry['xmin'], geometry['ymin']],
+                        [geometry['xmax'], geometry['ymax']]]
+        else:
+            vertices = [v for part in geometry.get('rings', geometry.get('paths', [])) \
+                        for v in part]
+        if len(vertices) == 0:
+            return None
+        xs = [v[0] for v in vertices]
+        ys = [v[1] for v in vertices]
+        box = (min(xs), max(xs), min(ys), max(ys))
+        if self._extent is None:
+            self._extent = list(box)
+        else:
+            self._extent = [min(self._extent[0], box[0]), max(self._extent[1], box[1]),
+                            min(self._extent[2], box[2]), max(self._extent[3], box[3])]
+        # magic, version 0, flags: little endian with an xy envelope
+        header = struct.pack('<2sBBi4d', "GP", 0, 0x03, self._srs_id,
+                             box[0], box[1], box[2], box[3])
+        return sqlite3.Binary(header + wkb)
+    #----------------------------------------------------------------------
+    def _write(self, feature):
+        """ buffers one feature """
+        attributes = feature.get('attributes', {})
+        row = [_value(attributes.get(name, None)) for name in self._names]
+        for index in self._dates:
+            row[index] = _iso_date(row[index])
+        if self._geometryType is not None:
+            row.insert(0, self._geometry_blob(feature.get('geometry', None)))
+        self._rows.append(row)
+        if len(self._rows) >= self._batch_size:
+            self._flush()
+    #----------------------------------------------------------------------
+    def _flush(self):
+        """ inserts the buffered features """
+        if len(self._rows) > 0:
+            self._conn.executemany(self._sql, self._rows)
+            self._conn.commit()
+            self._rows = []
+    #----------------------------------------------------------------------
+    def close(self):
+        """ writes the remaining features and the extent, an empty table is
+            created when nothing was written """
+        if not self._opened:
+            self.open()
+        if self._conn is not None:
+            self._flush()
+            if self._extent is not None:
+                self._conn.execute("UPDATE gpkg_contents SET min_x = ?, max_x = ?, " + \
+                                   "min_y = ?, max_y = ? WHERE table_name = ?",
+                                   tuple(self._extent) + (self._table,))
+                self._conn.commit()
+            self._conn.close()
+            self._conn = None
+#----------------------------------------------------------------------
+def sink_for_path(path, **kwargs):
+    """
+       returns the sink matching the extension of path: .geojson for a
+       GeoJSON FeatureCollection, .geojsonl, .ndjson or .jsonl for newline
+       delimited GeoJSON, .csv for CSV and .gpkg for GeoPackage, or None
+       for other extensions
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".geojson":
+        return GeoJSONSink(path, collection=True, **kwargs)
+    elif ext in (".geojsonl", ".ndjson", ".jsonl"):
+        return GeoJSONSink(path, **kwargs)
+    elif ext == ".csv":
+        return CSVSink(path, **kwargs)
+    elif ext == ".gpkg":
+        return GeoPackageSink(path, **kwargs)
+    return None
@@ -1,9 +1,10 @@
 """
 
 """
-import arcpy
-from arcpy import env
+from _arcpy import arcpy
+from general import local_time_to_online
 import os, datetime
+import json
 #----------------------------------------------------------------------
 def create_feature_layer(ds, sql, name="layer"):
     """ creates a feature layer object """
@@ -16,6 +17,38 @@ def featureclass_to_json(fc):
     """converts a feature class to JSON"""
     return arcpy.FeatureSet(fc).JSON
 #----------------------------------------------------------------------
+def iter_featureclass(fc, where_clause=None):
+    """
+       yields each row of a feature class or table as an esri json feature
+       dictionary.  Unlike featureclass_to_json, only a single row is held
+       in memory at any time.
+       Inputs:
+          fc - path to the feature class, table or feature layer
+          where_clause - optional sql statement to limit the rows
+    """
+    desc = arcpy.Describe(fc)
+    fields = [field.name for field in arcpy.ListFields(fc) \
+              if field.type not in ['Geometry', 'Raster']]
+    date_fields = [field.name for field in arcpy.ListFields(fc) \
+                   if field.type == 'Date']
+    cursor_fields = list(fields)
+    if hasattr(desc, "shapeFieldName"):
+        cursor_fields.append("SHAPE@JSON")
+    del desc
+    with arcpy.da.SearchCursor(fc, cursor_fields,
+                               where_clause=where_clause) as rows:
+        for row in rows:
+            attributes = dict(zip(fields, row))
+            for df in date_fields:
+                if attributes[df] is not None:
+                    attributes[df] = int(local_time_to_online(attributes[df]))
+            feature = {"attributes" : _unicode_convert(attributes)}
+            if len(cursor_fields) > len(fields) and \
+               row[-1] is not None:
+                feature['geometry'] = json.loads(row[-1])
+            yield feature
+            del row
+#----------------------------------------------------------------------
 def recordset_to_json(table):
     """ converts the table to JSON """
     return arcpy.RecordSet(table).JSON
@@ -57,6 +90,35 @@ def get_attachment_data(attachmentTable, sql,
             del row
     return ret_rows
 #----------------------------------------------------------------------
+def iter_attachment_data(attachmentTable, sql=None,
+                         nameField="ATT_NAME", blobField="DATA",
+                         contentTypeField="CONTENT_TYPE",
+                         rel_object_field="REL_OBJECTID"):
+    """
+       yields the rows of an attachment table with the blob kept in
+       memory, so no temporary files are written
+       Output:
+          generator of dictionaries with name, data, content and rel_oid
+          keys
+    """
+    with arcpy.da.SearchCursor(attachmentTable,
+                               [nameField,
+                                blobField,
+                                contentTypeField,
+                                rel_object_field],
+                               where_clause=sql) as rows:
+        for row in rows:
+            data = row[1]
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            yield {
+                "name" : row[0],
+                "data" : data,
+                "content" : row[2],
+                "rel_oid" : row[3]
+            }
+            del row
+#----------------------------------------------------------------------
 def get_records_with_attachments(attachment_table, rel_object_field="REL_OBJECTID"):
     """"""
     OIDs = []
@@ -112,7 +174,7 @@ def scratchFolder():
 #----------------------------------------------------------------------
 def scratchGDB():
     """ returns the arcpy scratch file geodatabase """
-    return env.scratchGDB
+    return arcpy.env.scratchGDB
 #----------------------------------------------------------------------
 def getDateFields(fc):
     """
@@ -0,0 +1,102 @@
+"""
+   Server side statistics queries shared by the feature layers of
+   ArcGIS Server (ags) and ArcGIS Online (agol).
+
+   Statistic results are small and often repeated, so they are kept in the
+   shared statistics cache.
+"""
+import json
+import filters
+from cache import statistics_cache, make_key
+########################################################################
+class StatisticsMixin(object):
+    """
+       Adds query_statistics to a layer class that has _url, _token,
+       _securityHandler, _proxy_url, _proxy_port, supportsStatistics and
+       _do_get.
+    """
+    #----------------------------------------------------------------------
+    def query_statistics(self,
+                         statistics,
+                         groupByFieldsForStatistics=None,
+                         where="1=1",
+                         having=None,
+                         orderByFields=None,
+                         timeFilter=None,
+                         geometryFilter=None,
+                         use_cache=True,
+                         cache_ttl=None):
+        """ calculates statistics on the server, optionally grouped by
+            one or more fields.  Results are kept in a shared time based
+            cache, keyed by the request and the token, so repeating the
+            same request only costs a lookup until the entry expires.
+            Security handlers without a token are never cached.
+            Inputs:
+               statistics - a filters.StatisticFilter object or a list of
+                            outStatistics dictionaries (statisticType,
+                            onStatisticField, outStatisticFieldName)
+               groupByFieldsForStatistics - list or comma separated string
+                                            of the fields to group by
+               where - the selection sql statement
+               having - sql statement applied to the aggregated values,
+                        e.g. "SUM(POP) > 1000"
+               orderByFields - list or comma separated string of fields
+                               to order the results by
+               timeFilter - a TimeFilter object limiting the features
+               geometryFilter - a GeometryFilter object limiting the
+                                features
+               use_cache - if True, the shared statistics cache is used
+               cache_ttl - seconds a result stays cached.  Default is the
+                           time to live of the cache.
+            Output:
+               list of dictionaries, one per group, holding the group by
+               fields and the statistic fields
+        """
+        if self.supportsStatistics == False:
+            raise ValueError("Statistics are not supported by this layer.")
+        if isinstance(statistics, filters.StatisticFilter):
+            statistics = statistics.filter
+        params = {"f": "json",
+                  "where": where,
+                  "outStatistics": json.dumps(statistics),
+                  "returnGeometry" : False
+                  }
+        if isinstance(groupByFieldsForStatistics, (list, tuple)):
+            groupByFieldsForStatistics = ",".join(groupByFieldsForStatistics)
+        if groupByFieldsForStatistics is not None:
+            params['groupByFieldsForStatistics'] = groupByFieldsForStatistics
+        if having is not None:
+            params['having'] = having
+        if isinstance(orderByFields, (list, tuple)):
+            orderByFields = ",".join(orderByFields)
+        if orderByFields is not None:
+            params['orderByFields'] = orderByFields
+        if not timeFilter is None and \
+           isinstance(timeFilter, filters.TimeFilter):
+            params['time'] = timeFilter.filter
+        if not geometryFilter is None and \
+           isinstance(geometryFilter, filters.GeometryFilter):
+            gf = geometryFilter.filter
+            params['geometry'] = json.dumps(gf['geometry'])
+            params['geometryType'] = gf['geometryType']
+            params['spatialRel'] = gf['spatialRel']
+            params['inSR'] = json.dumps(gf['inSR'])
+        fURL = self._url + "/query"
+        if not use_cache or \
+           (self._token is None and self._securityHandler is not None):
+            # without a token the user of a response cannot be told apart
+            return self._statistics(fURL, params)
+        rows = statistics_cache.get_or_call(make_key(fURL, params, self._token),
+                                            lambda: self._statistics(fURL, params),
+                                            ttl=cache_ttl)
+        return [dict(row) for row in rows]
+    #----------------------------------------------------------------------
+    def _statistics(self, url, params):
+        """ runs a statistics query and returns the rows """
+        if not self._token is None:
+            params["token"] = self._token
+        results = self._do_get(url, params, proxy_port=self._proxy_port,
+                               proxy_url=self._proxy_url)
+        if 'error' in results:
+            raise ValueError (results)
+        return [feature['attributes'] for feature in results.get('features', [])]
\ No newline at end of file
@@ -933,6 +933,8 @@ class AdminFeatureServiceLayer(BaseAGOLClass):
                  proxy_url=None,
                  proxy_port=None):
         """Constructor"""
+        if 'rest/services' in url:
+            url = url.replace('rest/services', 'rest/admin/services')
         self._url = url
         self._proxy_url = proxy_url
         self._proxy_port = proxy_port
@@ -990,6 +992,30 @@ class AdminFeatureServiceLayer(BaseAGOLClass):
         return self._do_get(url=uURL, param_dict=params, proxy_port=self._proxy_port,
                             proxy_url=self._proxy_url)
     #----------------------------------------------------------------------
+    def truncate(self, attachmentOnly=False, asynchronous=False):
+        """
+           The truncate operation removes all the features (or only the
+           attachments) of a hosted feature layer in a single step.  It is
+           much faster than deleting the features, but the layer must not
+           have sync enabled and is not logged in editor tracking.
+
+           Input:
+              attachmentOnly - if True, only the attachments are removed
+              asynchronous - if True, the operation runs as a job and the
+                             response holds the status url of the job
+           Output:
+              JSON message as dictionary
+        """
+        params = {
+            "f" : "json",
+            "token" : self._token,
+            "attachmentOnly" : attachmentOnly,
+            "async" : asynchronous
+        }
+        uURL = self._url + "/truncate"
+        return self._do_post(url=uURL, param_dict=params, proxy_port=self._proxy_port,
+                             proxy_url=self._proxy_url)
+    #----------------------------------------------------------------------
     @property
     def editFieldsInfo(self):
         """ returns the edit fields information """
@@ -6,6 +6,7 @@ import urlparse
 import json
 import os
 import mmap
+import tempfile
 ########################################################################
 class Content(BaseAGOLClass):
     """
@@ -1423,7 +1424,7 @@ class UserContent(BaseAGOLClass):
                 steps += 1
             for i in range(steps):
                 files = []
-                tempFile = os.path.join(os.environ['TEMP'], "split.part%s" % i)
+                tempFile = os.path.join(tempfile.gettempdir(), "split.part%s" % i)
                 if os.path.isfile(tempFile):
                     os.remove(tempFile)
                 with open(tempFile, 'wb') as writer:
@@ -1729,7 +1730,7 @@ class UserContent(BaseAGOLClass):
     def deleteItem(self, item_id,folder=None,force_delete=False):
         """ deletes an agol item by it's ID """
 
-        url = '{}/content/users/{}'.format(self._baseUrl, self._username )
+        url = self._baseUrl + "/%s" % self._username
         if folder:
             url += '/' + folder
 
@@ -1752,7 +1753,7 @@ class UserContent(BaseAGOLClass):
     def disableProtect(self, item_id,folder=None):
         """ Disables an items protection """
 
-        url = '{}/content/users/{}'.format(self._baseUrl, self._username )
+        url = self._baseUrl + "/%s" % self._username
         if folder:
             url += '/' + folder
 
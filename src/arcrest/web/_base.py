@@ -26,6 +26,18 @@ class AGOLRedirectHandler(urllib2.HTTPRedirectHandler):
         return result
 
 
+########################################################################
+class FileData(object):
+    """
+       The contents of a file held in memory, for a multipart upload.  A
+       plain string in the files of a multipart request is the path of a
+       file, so the bytes of a file are wrapped in a FileData.
+    """
+    data = None
+    #----------------------------------------------------------------------
+    def __init__(self, data):
+        """Constructor"""
+        self.data = data
 ########################################################################
 class BaseWebOperations(object):
     """ base class that holds operations for web requests """
@@ -87,6 +99,39 @@ class BaseWebOperations(object):
             print "URL Error:",e.reason , url
             return False
     #----------------------------------------------------------------------
+    def _download_stream(self, url, writer, param_dict=None, proxy_url=None,
+                         proxy_port=None, chunk_size=65536):
+        """ downloads a url and passes the bytes to writer.write as they
+            arrive, so nothing is held in memory.  Returns the number of
+            bytes read. """
+        if url.find("http://") > -1:
+            url = url.replace("http://", "https://")
+        if param_dict is not None:
+            url = url + "?%s" % urllib.urlencode(param_dict)
+        if proxy_url is not None:
+            if proxy_port is None:
+                proxy_port = 80
+            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
+                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
+            proxy_support = urllib2.ProxyHandler(proxies)
+            opener = urllib2.build_opener(proxy_support, AGOLRedirectHandler())
+        else:
+            opener = urllib2.build_opener(AGOLRedirectHandler())
+        opener.addheaders = [('Referer', self._referer_url),
+                             ('User-Agent', self._useragent)]
+        resp = opener.open(url)
+        downloaded = 0
+        try:
+            while True:
+                chunk = resp.read(chunk_size)
+                if not chunk:
+                    break
+                downloaded += len(chunk)
+                writer.write(chunk)
+        finally:
+            resp.close()
+        return downloaded
+    #----------------------------------------------------------------------
     def _do_post(self, url, param_dict, proxy_url=None, proxy_port=None, header={}):
         """ performs the POST operation and returns dictionary result """
         if proxy_url is not None:
@@ -118,6 +163,32 @@ class BaseWebOperations(object):
 
         return self._unicode_convert(jres)
     #----------------------------------------------------------------------
+    def _do_post_raw(self, url, param_dict, header=None, proxy_url=None, proxy_port=None,compress=True):
+        """ performs the POST operation and returns the undecoded response
+            body, used for binary formats such as f=pbf """
+        headers = {'Referer': self._referer_url,
+                   'User-Agent': self._useragent}
+        if not header is None:
+            headers.update(header)
+        if compress:
+            headers['Accept-encoding'] = 'gzip'
+        if proxy_url is not None:
+            if proxy_port is None:
+                proxy_port = 80
+            proxies = {"http":"http://%s:%s" % (proxy_url, proxy_port),
+                       "https":"https://%s:%s" % (proxy_url, proxy_port)}
+            proxy_support = urllib2.ProxyHandler(proxies)
+            opener = urllib2.build_opener(proxy_support, AGOLRedirectHandler())
+        else:
+            opener = urllib2.build_opener(AGOLRedirectHandler())
+        request = urllib2.Request(url, urllib.urlencode(param_dict), headers=headers)
+        resp = opener.open(request)
+        if resp.info().get('Content-Encoding') == 'gzip':
+            buf = StringIO(resp.read())
+            f = gzip.GzipFile(fileobj=buf)
+            return f.read()
+        return resp.read()
+    #----------------------------------------------------------------------
     def _do_get(self, url, param_dict, header=None, proxy_url=None, proxy_port=None,compress=True):
         """ performs a get operation """
         format_url = url + "?%s" % urllib.urlencode(param_dict)
@@ -255,15 +326,29 @@ class BaseWebOperations(object):
             buf.write('Content-Disposition: form-data; name="%s"' % key)
             buf.write('\r\n\r\n' + self._tostr(value) + '\r\n')
         for (key, filepath, filename) in files:
-            if os.path.isfile(filepath):
-                buf.write('--%s\r\n' % boundary)
-                buf.write('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename))
-                buf.write('Content-Type: %s\r\n' % (self._get_content_type3(filename)))
+            if isinstance(filepath, FileData):
+                data = filepath.data
+            elif hasattr(filepath, 'read'):
+                data = filepath.read()
+            elif isinstance(filepath, (bytearray, buffer, memoryview)):
+                data = filepath
+            elif '\0' not in filepath and os.path.isfile(filepath):
                 file = open(filepath, "rb")
                 try:
-                    buf.write('\r\n' + file.read() + '\r\n')
+                    data = file.read()
                 finally:
                     file.close()
+            else:
+                raise ValueError("%s is not a file, the bytes of a file " % key + \
+                                 "must be wrapped in a FileData")
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            elif not isinstance(data, str):
+                data = str(data)
+            buf.write('--%s\r\n' % boundary)
+            buf.write('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename))
+            buf.write('Content-Type: %s\r\n' % (self._get_content_type3(filename)))
+            buf.write('\r\n' + data + '\r\n')
         buf.write('--' + boundary + '--\r\n\r\n')
         buf = buf.getvalue()
         content_type = 'multipart/form-data; boundary=%s' % boundary
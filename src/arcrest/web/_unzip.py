@@ -0,0 +1,239 @@
+"""
+   Extracts a zip archive while it is being downloaded.
+
+   The archive is read front to back from its local file headers, so each
+   entry is written to disk as its bytes arrive and the central directory
+   at the end is never needed.  Stored and deflated entries are supported.
+   Entries whose size is only known after their data (a data descriptor)
+   can be streamed when they are deflated, since the deflate stream marks
+   its own end; a stored entry of that kind raises StreamingNotSupported
+   and the archive has to be spooled to disk instead.
+"""
+import os
+import zlib
+import struct
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_LOCAL_SIGNATURE = 0x04034b50
+_DESCRIPTOR_SIGNATURE = 0x08074b50
+_CENTRAL_SIGNATURES = (0x02014b50, 0x06054b50, 0x06064b50)
+_STORED = 0
+_DEFLATED = 8
+########################################################################
+class StreamingNotSupported(Exception):
+    """ raised when an archive cannot be extracted while streaming """
+    pass
+########################################################################
+class StreamingUnzip(object):
+    """
+       File like writer that extracts a zip archive to a folder as it is
+       written to.
+       Inputs:
+          out_folder - folder the entries are extracted to
+    """
+    _out_folder = None
+    _buffer = None
+    _entry = None
+    _writer = None
+    _inflater = None
+    _remaining = None
+    _crc = None
+    _done = None
+    _files = None
+    #----------------------------------------------------------------------
+    def __init__(self, out_folder):
+        """Constructor"""
+        self._out_folder = os.path.abspath(out_folder)
+        self._buffer = ""
+        self._done = False
+        self._files = []
+        if os.path.isdir(self._out_folder) == False:
+            os.makedirs(self._out_folder)
+    #----------------------------------------------------------------------
+    @property
+    def files(self):
+        """ returns the paths of the extracted files """
+        return self._files
+    #----------------------------------------------------------------------
+    def write(self, data):
+        """ extracts the next bytes of the archive """
+        if self._done:
+            return
+        self._buffer += data
+        while not self._done:
+            if self._entry is None:
+                if not self._read_header():
+                    return
+            elif self._entry['descriptor']:
+                if not self._read_descriptor():
+                    return
+            elif not self._read_data():
+                return
+    #----------------------------------------------------------------------
+    def close(self):
+        """ checks that the archive ended cleanly """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if not self._done and (self._entry is not None or \
+                               len(self._buffer) > 0):
+            raise ValueError("the zip archive is truncated")
+    #----------------------------------------------------------------------
+    def _target(self, name):
+        """ returns the output path of an entry, refusing paths that
+            leave the output folder """
+        name = name.replace("\\", "/")
+        path = os.path.abspath(os.path.join(self._out_folder, *name.split("/")))
+        if path != self._out_folder and \
+           not path.startswith(self._out_folder + os.sep):
+            raise ValueError("zip entry %s is outside of the output folder" % name)
+        return path
+    #----------------------------------------------------------------------
+    def _read_header(self):
+        """ parses a local file header, returns False when more bytes are
+            needed """
+        if len(self._buffer) < 4:
+            return False
+        signature = struct.unpack('<I', self._buffer[:4])[0]
+        if signature in _CENTRAL_SIGNATURES:
+            # the entries are all extracted, the rest is the directory
+            self._done = True
+            self._buffer = ""
+            return True
+        if signature != _LOCAL_SIGNATURE:
+            raise ValueError("invalid zip local file header")
+        if len(self._buffer) < _LOCAL_HEADER.size:
+            return False
+        (sig, version, flags, method, mtime, mdate, crc,
+         compressed, size, name_len, extra_len) = \
+            _LOCAL_HEADER.unpack(self._buffer[:_LOCAL_HEADER.size])
+        header_len = _LOCAL_HEADER.size + name_len + extra_len
+        if len(self._buffer) < header_len:
+            return False
+        name = self._buffer[_LOCAL_HEADER.size:_LOCAL_HEADER.size + name_len]
+        if flags & 0x800:
+            name = name.decode('utf-8')
+        extra = self._buffer[_LOCAL_HEADER.size + name_len:header_len]
+        self._buffer = self._buffer[header_len:]
+        if flags & 0x1:
+            raise StreamingNotSupported("encrypted zip entries are not supported")
+        if compressed == 0xFFFFFFFF:
+            compressed = self._zip64_size(extra)
+        streamed = bool(flags & 0x8)
+        if method not in (_STORED, _DEFLATED):
+            raise StreamingNotSupported("zip compression method %s" % method)
+        if streamed and method == _STORED:
+            raise StreamingNotSupported("stored zip entry without sizes")
+        path = self._target(name)
+        self._entry = {"name" : name,
+                       "path" : path,
+                       "method" : method,
+                       "crc" : crc,
+                       "streamed" : streamed,
+                       "descriptor" : False,
+                       "zip64" : self._has_zip64(extra)}
+        self._remaining = None if streamed else compressed
+        self._crc = 0
+        if name.endswith("/"):
+            if os.path.isdir(path) == False:
+                os.makedirs(path)
+            self._writer = None
+        else:
+            if os.path.isdir(os.path.dirname(path)) == False:
+                os.makedirs(os.path.dirname(path))
+            self._writer = open(path, 'wb')
+            self._files.append(path)
+        if method == _DEFLATED:
+            self._inflater = zlib.decompressobj(-15)
+        else:
+            self._inflater = None
+        return True
+    #----------------------------------------------------------------------
+    def _has_zip64(self, extra):
+        """ returns True when the extra field holds zip64 sizes """
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, size = struct.unpack('<HH', extra[pos:pos + 4])
+            if tag == 0x0001:
+                return True
+            pos += 4 + size
+        return False
+    #----------------------------------------------------------------------
+    def _zip64_size(self, extra):
+        """ reads the compressed size from the zip64 extra field """
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, size = struct.unpack('<HH', extra[pos:pos + 4])
+            if tag == 0x0001 and size >= 16:
+                return struct.unpack('<Q', extra[pos + 12:pos + 20])[0]
+            pos += 4 + size
+        return None
+    #----------------------------------------------------------------------
+    def _emit(self, data):
+        """ writes decompressed bytes of the current entry """
+        if len(data) == 0:
+            return
+        self._crc = zlib.crc32(data, self._crc)
+        if self._writer is not None:
+            self._writer.write(data)
+    #----------------------------------------------------------------------
+    def _read_data(self):
+        """ extracts the available bytes of the current entry, returns
+            False when more bytes are needed """
+        if self._remaining is not None:
+            take = min(self._remaining, len(self._buffer))
+            chunk = self._buffer[:take]
+            self._buffer = self._buffer[take:]
+            self._remaining -= take
+            if self._inflater is not None:
+                self._emit(self._inflater.decompress(chunk))
+            else:
+                self._emit(chunk)
+            if self._remaining > 0:
+                return False
+            if self._inflater is not None:
+                self._emit(self._inflater.flush())
+            self._finish()
+            return True
+        # deflated entry of unknown size: the stream marks its end
+        chunk = self._buffer
+        self._buffer = ""
+        self._emit(self._inflater.decompress(chunk))
+        if self._inflater.unused_data == "" and \
+           not self._stream_ended():
+            return False
+        self._buffer = self._inflater.unused_data + self._buffer
+        self._emit(self._inflater.flush())
+        self._entry['descriptor'] = True
+        return True
+    #----------------------------------------------------------------------
+    def _stream_ended(self):
+        """ returns True when the deflate stream of the entry ended """
+        # python 2 has no 'eof' attribute on decompress objects; a stream
+        # that ended exactly at the end of the buffer is detected when the
+        # next bytes arrive as unused data
+        return getattr(self._inflater, 'eof', False)
+    #----------------------------------------------------------------------
+    def _read_descriptor(self):
+        """ reads the data descriptor that follows a streamed entry """
+        size = 20 if self._entry['zip64'] else 12
+        if len(self._buffer) < 4:
+            return False
+        if struct.unpack('<I', self._buffer[:4])[0] == _DESCRIPTOR_SIGNATURE:
+            size += 4
+        if len(self._buffer) < size:
+            return False
+        descriptor = self._buffer[size - (20 if self._entry['zip64'] else 12):size]
+        self._entry['crc'] = struct.unpack('<I', descriptor[:4])[0]
+        self._buffer = self._buffer[size:]
+        self._finish()
+        return True
+    #----------------------------------------------------------------------
+    def _finish(self):
+        """ closes the current entry and checks its crc """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if (self._crc & 0xffffffff) != self._entry['crc']:
+            raise ValueError("crc mismatch in zip entry %s" % self._entry['name'])
+        self._entry = None
+        self._inflater = None
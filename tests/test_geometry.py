@@ -0,0 +1,47 @@
+"""
+   Tests that the geometries survive a pickle round trip with every
+   protocol.  Run the tests from the repository folder with:
+      python -m unittest discover tests
+"""
+import os
+import sys
+import pickle
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+from arcrest.common import geometry
+########################################################################
+class PickleTests(unittest.TestCase):
+    """ pickles the point and the array backed geometries """
+    #----------------------------------------------------------------------
+    def _round_trip(self, geom):
+        """ checks every pickle protocol returns an equal geometry """
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(geom, protocol))
+            self.assertEqual(type(copy), type(geom))
+            self.assertEqual(copy.asDictionary, geom.asDictionary)
+    #----------------------------------------------------------------------
+    def test_point(self):
+        """ points define __slots__ """
+        self._round_trip(geometry.Point([1.5, 2.5], 4326))
+        self._round_trip(geometry.Point([1.5, 2.5], 3857, z=10, m=2))
+    #----------------------------------------------------------------------
+    def test_multipoint(self):
+        """ vertices are kept in an array of doubles """
+        self._round_trip(geometry.MultiPoint([[1, 2], [3, 4]], 4326))
+    #----------------------------------------------------------------------
+    def test_polyline(self):
+        """ two paths with z values """
+        self._round_trip(geometry.Polyline([[[0, 0, 1], [1, 1, 2]],
+                                            [[2, 2, 3], [3, 3, 4]]],
+                                           4326, hasZ=True))
+    #----------------------------------------------------------------------
+    def test_polygon(self):
+        """ a ring with a hole """
+        self._round_trip(geometry.Polygon([[[0, 0], [0, 10], [10, 10],
+                                            [10, 0], [0, 0]],
+                                           [[2, 2], [8, 2], [8, 8], [2, 2]]],
+                                          4326))
+
+if __name__ == "__main__":
+    unittest.main()
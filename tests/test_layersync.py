@@ -0,0 +1,94 @@
+"""
+   Tests of the LayerSync diff against an in memory layer.  Run the tests
+   from the repository folder with:
+      python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+from arcrest.agol.layersync import LayerSync
+########################################################################
+class _Feature(object):
+    """ a query result feature """
+    def __init__(self, attributes):
+        self.asDictionary = {"attributes" : attributes}
+########################################################################
+class _Layer(object):
+    """ a feature layer holding a single page of rows """
+    objectIdField = "OBJECTID"
+    globalIdField = "GlobalID"
+    fields = [{"name" : "OBJECTID", "type" : "esriFieldTypeOID"},
+              {"name" : "KEY", "type" : "esriFieldTypeString"},
+              {"name" : "VALUE", "type" : "esriFieldTypeInteger"}]
+    #----------------------------------------------------------------------
+    def __init__(self, rows):
+        self._rows = rows
+    #----------------------------------------------------------------------
+    def query_pages(self, **kwargs):
+        yield [_Feature(dict(row)) for row in self._rows]
+#----------------------------------------------------------------------
+def _diff(remote, local, **kwargs):
+    """ returns the edits of a diff as a sorted list """
+    sync = LayerSync(_Layer(remote), key_field="KEY",
+                     compare_geometry=False, **kwargs)
+    edits = []
+    for action, value in sync.diff(local):
+        if action != "delete":
+            value = value['attributes'].get("OBJECTID", None)
+        edits.append((action, value))
+    return sorted(edits)
+########################################################################
+class DiffTests(unittest.TestCase):
+    """ matches local rows to layer rows """
+    #----------------------------------------------------------------------
+    def test_changes(self):
+        """ adds, updates and deletes """
+        remote = [{"OBJECTID" : 1, "KEY" : "a", "VALUE" : 1},
+                  {"OBJECTID" : 2, "KEY" : "b", "VALUE" : 2},
+                  {"OBJECTID" : 3, "KEY" : "c", "VALUE" : 3}]
+        local = [{"KEY" : "a", "VALUE" : 1},
+                 {"KEY" : "b", "VALUE" : 5},
+                 {"KEY" : "d", "VALUE" : 4}]
+        self.assertEqual(_diff(remote, local),
+                         [("add", None), ("delete", 3), ("update", 2)])
+    #----------------------------------------------------------------------
+    def test_remote_duplicates(self):
+        """ stale copies of a key are deleted and do not cause adds """
+        remote = [{"OBJECTID" : 1, "KEY" : "a", "VALUE" : 1},
+                  {"OBJECTID" : 2, "KEY" : "a", "VALUE" : 1},
+                  {"OBJECTID" : 3, "KEY" : "a", "VALUE" : 1}]
+        local = [{"KEY" : "a", "VALUE" : 1}]
+        self.assertEqual(_diff(remote, local),
+                         [("delete", 2), ("delete", 3)])
+        self.assertEqual(_diff(remote, local, delete_missing=False),
+                         [("delete", 2), ("delete", 3)])
+    #----------------------------------------------------------------------
+    def test_remote_null_keys(self):
+        """ every layer row without a key is deleted """
+        remote = [{"OBJECTID" : 1, "KEY" : None, "VALUE" : 1},
+                  {"OBJECTID" : 2, "KEY" : None, "VALUE" : 1},
+                  {"OBJECTID" : 3, "KEY" : "a", "VALUE" : 1}]
+        local = [{"KEY" : "a", "VALUE" : 1}]
+        self.assertEqual(_diff(remote, local),
+                         [("delete", 1), ("delete", 2)])
+        self.assertEqual(_diff(remote, local, delete_missing=False), [])
+    #----------------------------------------------------------------------
+    def test_local_duplicates(self):
+        """ a local key used twice raises before any edit """
+        remote = [{"OBJECTID" : 1, "KEY" : "a", "VALUE" : 1},
+                  {"OBJECTID" : 2, "KEY" : "a", "VALUE" : 1}]
+        local = [{"KEY" : "b", "VALUE" : 1},
+                 {"KEY" : "a", "VALUE" : 1},
+                 {"KEY" : "a", "VALUE" : 2}]
+        self.assertRaises(ValueError, _diff, remote, local)
+    #----------------------------------------------------------------------
+    def test_local_null_keys(self):
+        """ a local row without a key raises """
+        local = [{"KEY" : "a", "VALUE" : 1},
+                 {"KEY" : None, "VALUE" : 1}]
+        self.assertRaises(ValueError, _diff, [], local)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+   Tests of the f=pbf query response decoder against recorded payloads.
+
+   The payloads in fixtures/pbf are encoded from the .txt files next to
+   them with protoc and FeatureCollection.proto.  Run the tests from the
+   repository folder with:
+      python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+from arcrest.common import pbf
+from arcrest.agol.layer import FeatureLayer
+
+_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "fixtures", "pbf")
+#----------------------------------------------------------------------
+def _fixture(name):
+    """ returns the bytes of a recorded payload """
+    with open(os.path.join(_FIXTURES, name + ".pbf"), "rb") as reader:
+        return reader.read()
+_POLYGON_GEOMETRIES = [
+    {"rings" : [[[1500000.0, 5000000.0], [1500000.0, 5000020.0],
+                 [1500020.0, 5000020.0], [1500020.0, 5000000.0],
+                 [1500000.0, 5000000.0]],
+                [[1500004.0, 5000004.0], [1500016.0, 5000004.0],
+                 [1500016.0, 5000016.0], [1500004.0, 5000004.0]]]},
+    {"rings" : [[[1500200.0, 5000200.0], [1500200.0, 5000208.0],
+                 [1500208.0, 5000208.0], [1500208.0, 5000200.0],
+                 [1500200.0, 5000200.0]]]}]
+########################################################################
+class DecodeTests(unittest.TestCase):
+    """ decodes the recorded payloads """
+    #----------------------------------------------------------------------
+    def test_point(self):
+        """ upper left origin, a string with non ascii characters """
+        res = pbf.decode(_fixture("point"))
+        self.assertEqual(res['geometryType'], "esriGeometryPoint")
+        self.assertEqual(res['objectIdFieldName'], "OBJECTID")
+        self.assertEqual(res['spatialReference'],
+                         {"wkid" : 4326, "latestWkid" : 4326})
+        self.assertEqual([f['type'] for f in res['fields']],
+                         ["esriFieldTypeOID", "esriFieldTypeString",
+                          "esriFieldTypeDouble"])
+        self.assertEqual(res['features'], [
+            {"attributes" : {"OBJECTID" : 1, "NAME" : u"Z\xfcrich",
+                             "RATING" : 4.5},
+             "geometry" : {"x" : -155.0, "y" : 65.0}},
+            {"attributes" : {"OBJECTID" : 2, "NAME" : u"Oslo",
+                             "RATING" : -1.25},
+             "geometry" : {"x" : -179.0, "y" : 89.0}}])
+    #----------------------------------------------------------------------
+    def test_polyline(self):
+        """ lower left origin, z values and two paths """
+        res = pbf.decode(_fixture("polyline"))
+        self.assertEqual(res['geometryType'], "esriGeometryPolyline")
+        self.assertTrue(res['hasZ'])
+        self.assertEqual(res['fields'][1],
+                         {"name" : "LANES",
+                          "type" : "esriFieldTypeSmallInteger"})
+        self.assertEqual(res['features'], [
+            {"attributes" : {"OBJECTID" : 7, "LANES" : -2},
+             "geometry" : {"paths" : [[[1000.0, 2000.0, 10.0],
+                                       [1001.0, 2002.0, 11.0],
+                                       [1002.0, 2001.0, 13.0]],
+                                      [[1007.0, 2001.0, 10.0],
+                                       [1005.0, 2004.0, 10.0]]]}}])
+    #----------------------------------------------------------------------
+    def test_polygon(self):
+        """ rings with a hole, float, int64 and bool values """
+        res = pbf.decode(_fixture("polygon"))
+        self.assertEqual(res['geometryType'], "esriGeometryPolygon")
+        self.assertEqual(res['globalIdFieldName'], "GlobalID")
+        self.assertTrue(res['exceededTransferLimit'])
+        self.assertEqual([f['geometry'] for f in res['features']],
+                         _POLYGON_GEOMETRIES)
+        self.assertEqual(res['features'][0]['attributes'],
+                         {"FID" : 11,
+                          "GlobalID" : "{6F7F1C9A-2B2E-4E0A-9E55-0B1D2C3F4A5B}",
+                          "AREA_HA" : 2.5,
+                          "CREATED" : 1500000000000,
+                          "ACTIVE" : True})
+        self.assertEqual(res['features'][1]['attributes']['CREATED'],
+                         -86400000)
+        self.assertEqual(res['features'][1]['attributes']['ACTIVE'], False)
+    #----------------------------------------------------------------------
+    def test_columnar(self):
+        """ the polygon payload decoded column by column """
+        res = pbf.decode(_fixture("polygon"), columnar=True)
+        self.assertFalse('features' in res)
+        self.assertEqual(res['columns'], {
+            "FID" : [11, 12],
+            "GlobalID" : ["{6F7F1C9A-2B2E-4E0A-9E55-0B1D2C3F4A5B}",
+                          "{0A1B2C3D-4E5F-4A6B-8C7D-9E0F1A2B3C4D}"],
+            "AREA_HA" : [2.5, 0.75],
+            "CREATED" : [1500000000000, -86400000],
+            "ACTIVE" : [True, False]})
+        self.assertEqual(res['geometries'], _POLYGON_GEOMETRIES)
+    #----------------------------------------------------------------------
+    def test_count_and_ids(self):
+        """ returnCountOnly and returnIdsOnly responses """
+        self.assertEqual(pbf.decode(_fixture("count")), {"count" : 123456})
+        self.assertEqual(pbf.decode(_fixture("ids")),
+                         {"objectIdFieldName" : "OBJECTID",
+                          "objectIds" : [1, 2, 300, 70000]})
+########################################################################
+class QueryTests(unittest.TestCase):
+    """ sends pbf queries through a feature layer """
+    #----------------------------------------------------------------------
+    def test_query_is_posted(self):
+        """ pbf queries are sent as a POST """
+        calls = []
+        def post_raw(url, param_dict, **kwargs):
+            calls.append((url, param_dict))
+            return _fixture("point")
+        layer = FeatureLayer.__new__(FeatureLayer)
+        layer._proxy_url = None
+        layer._proxy_port = None
+        layer._do_post_raw = post_raw
+        res = layer._query_pbf("http://example.com/FeatureServer/0/query",
+                               {"where" : "1=1"})
+        self.assertEqual(len(res['features']), 2)
+        self.assertEqual(calls, [("http://example.com/FeatureServer/0/query",
+                                  {"where" : "1=1", "f" : "pbf"})])
+
+if __name__ == "__main__":
+    unittest.main()